@@ -0,0 +1,33 @@
+"""
+Benchmarks for the API. Run from the repository root:
+
+    python -m benchmarks.serializers
+    python -m benchmarks.api
+    python -m benchmarks.search
+    python -m benchmarks.connections
+
+They use benchmarks.settings and run against a throwaway database that is
+created before and dropped after each run: a temporary SQLite file by default,
+or a local Postgres with BENCH_DATABASE=postgres (see benchmarks/settings.py).
+"""
+import os
+from contextlib import contextmanager
+
+
+def setup():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+    import django
+    django.setup()
+
+
+@contextmanager
+def database():
+    """
+    Create and migrate the benchmark database, and drop it on the way out.
+    """
+    from django.db import connection
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(connection.settings_dict["NAME"], verbosity=0)
@@ -0,0 +1,278 @@
+"""
+Load test for the /v1 API. Seeds users with lists, products and shared lists,
+then sends each endpoint's requests from concurrent clients through the full
+middleware stack and grocery/urls.py, in this process. Reports p50/p95/p99
+latency and requests per second per endpoint.
+
+    python -m benchmarks.api --concurrency 8 --requests 2000 --output before.json
+    python -m benchmarks.api --concurrency 8 --requests 2000 --compare before.json
+
+The seed and request mix are fixed by --seed, so two runs on different
+commits send the same requests. Set BENCH_DATABASE=postgres to run against a
+local Postgres instead of SQLite. SQLite takes one writer at a time, so the
+write endpoints report "database is locked" errors (500) under concurrency
+there.
+"""
+import argparse
+import json
+import platform
+import random
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from benchmarks import database, setup
+
+
+class Dataset:
+    """
+    Ids and tokens of the seeded rows, for building requests.
+    """
+    def __init__(self):
+        self.users = []
+        self.tokens = {}
+        self.lists = {}
+        self.products = {}
+        self.shares = []
+
+
+def seed(users, lists, products, shared, rng):
+    from django.db import transaction
+    from rest_framework_simplejwt.tokens import AccessToken
+    from shoppinglist.models import CustomUser, List, Product, SharedList, SyncClock
+
+    data = Dataset()
+    with transaction.atomic():
+        owners = CustomUser.objects.bulk_create([CustomUser(email=f"bench{i}@example.com") for i in range(users)])
+        # bulk_create skips the post_save signal that creates the clocks
+        SyncClock.objects.bulk_create([SyncClock(user=owner, value=1) for owner in owners])
+        allLists = List.objects.bulk_create([
+            List(user=owner, name=f"List {i}", color=rng.choice(["orange", "purple", "green"]),
+                 total=products, checked=products // 2, version=1)
+            for owner in owners for i in range(lists)
+        ], batch_size=1000)
+        Product.objects.bulk_create([
+            Product(user_id=list.user_id, list=list, name=f"Product {i}", quantity=rng.randint(1, 9),
+                    checked=i < products // 2, version=1)
+            for list in allLists for i in range(products)
+        ], batch_size=1000)
+        sharedLists = rng.sample(allLists, min(shared, len(allLists)))
+        SharedList.objects.bulk_create([
+            SharedList(user_id=list.user_id, list=list, list_name=list.name, access_token=f"bench-share-{list.id}")
+            for list in sharedLists
+        ])
+
+    for owner in owners:
+        token = AccessToken.for_user(owner)
+        token.set_exp(lifetime=timedelta(hours=6))
+        data.users.append(owner.id)
+        data.tokens[owner.id] = str(token)
+    for listId, userId in List.objects.values_list("id", "user_id"):
+        data.lists.setdefault(userId, []).append(listId)
+    for productId, userId, listId in Product.objects.values_list("id", "user_id", "list_id"):
+        data.products.setdefault(userId, []).append((productId, listId))
+    data.shares = list(SharedList.objects.values_list("access_token", flat=True))
+    return data
+
+
+# Each scenario returns (method, path, JSON body or None) for one request by
+# ``user``
+def _lists_list(data, user, rng):
+    return "GET", "/v1/lists", None
+
+
+def _lists_retrieve(data, user, rng):
+    return "GET", f"/v1/lists/{rng.choice(data.lists[user])}", None
+
+
+def _products_list(data, user, rng):
+    return "GET", "/v1/products", None
+
+
+def _products_retrieve(data, user, rng):
+    return "GET", f"/v1/products/{rng.choice(data.products[user])[0]}", None
+
+
+def _share_retrieve(data, user, rng):
+    return "GET", f"/v1/share/{rng.choice(data.shares)}", None
+
+
+def _sync(data, user, rng):
+    return "GET", "/v1/sync", None
+
+
+def _products_create(data, user, rng):
+    return "POST", "/v1/products", {"name": "Milk", "list": rng.choice(data.lists[user])}
+
+
+def _products_update(data, user, rng):
+    productId, listId = rng.choice(data.products[user])
+    return "PUT", f"/v1/products/{productId}", {"name": "Milk", "list": listId, "checked": rng.random() < 0.5}
+
+
+def _products_bulk_check(data, user, rng):
+    ids = [productId for productId, _ in rng.sample(data.products[user], min(20, len(data.products[user])))]
+    return "POST", "/v1/products/bulk/check", {"ids": ids, "checked": rng.random() < 0.5}
+
+
+SCENARIOS = {
+    "lists.list": _lists_list,
+    "lists.retrieve": _lists_retrieve,
+    "products.list": _products_list,
+    "products.retrieve": _products_retrieve,
+    "share.retrieve": _share_retrieve,
+    "sync": _sync,
+    "products.create": _products_create,
+    "products.update": _products_update,
+    "products.bulk_check": _products_bulk_check,
+}
+
+
+def percentile(sortedValues, fraction):
+    # Nearest rank
+    if not sortedValues:
+        return None
+    index = max(0, min(len(sortedValues) - 1, round(fraction * len(sortedValues) + 0.5) - 1))
+    return sortedValues[index]
+
+
+def run_scenario(name, data, requests, concurrency, warmup, seed):
+    from django.db import connections
+    from django.test import Client
+
+    scenario = SCENARIOS[name]
+    remaining = iter(range(requests))
+    lock = threading.Lock()
+    latencies, errors = [], []
+    # Clients start measuring together, once all of them have warmed up
+    started = []
+    barrier = threading.Barrier(concurrency, action=lambda: started.append(time.perf_counter()))
+
+    def client(worker):
+        rng = random.Random(f"{seed}:{name}:{worker}")
+        browser = Client(raise_request_exception=False)
+        user = data.users[worker % len(data.users)]
+        headers = {"Authorization": f"Bearer {data.tokens[user]}"}
+        try:
+            for _ in range(warmup):
+                send(browser, scenario(data, user, rng), headers)
+            barrier.wait()
+            results, failures = [], []
+            while True:
+                with lock:
+                    if next(remaining, None) is None:
+                        break
+                requestStarted = time.perf_counter()
+                status = send(browser, scenario(data, user, rng), headers)
+                results.append(time.perf_counter() - requestStarted)
+                if status >= 400:
+                    failures.append(status)
+            with lock:
+                latencies.extend(results)
+                errors.extend(failures)
+        except BaseException:
+            # Don't leave the other clients waiting at the barrier
+            barrier.abort()
+            raise
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        for future in [pool.submit(client, worker) for worker in range(concurrency)]:
+            future.result()
+    elapsed = time.perf_counter() - started[0]
+
+    latencies.sort()
+    statuses = {}
+    for code in errors:
+        statuses[str(code)] = statuses.get(str(code), 0) + 1
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "error_statuses": statuses,
+        "rps": round(len(latencies) / elapsed, 1),
+        "mean_ms": milliseconds(sum(latencies) / len(latencies)) if latencies else None,
+        "p50_ms": milliseconds(percentile(latencies, 0.50)),
+        "p95_ms": milliseconds(percentile(latencies, 0.95)),
+        "p99_ms": milliseconds(percentile(latencies, 0.99)),
+        "max_ms": milliseconds(latencies[-1] if latencies else None),
+    }
+
+
+def milliseconds(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+def send(browser, request, headers):
+    method, path, body = request
+    if body is None:
+        response = browser.generic(method, path, headers=headers)
+    else:
+        response = browser.generic(method, path, json.dumps(body), "application/json", headers=headers)
+    return response.status_code
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    print(f"{'endpoint':<22} {'requests':>8} {'errors':>6} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, result in results.items():
+        line = (f"{name:<22} {result['requests']:>8} {result['errors']:>6} {result['rps']:>8} "
+                f"{result['p50_ms']:>8} {result['p95_ms']:>8} {result['p99_ms']:>8}")
+        before = (baseline or {}).get(name)
+        if before and before.get("p95_ms") and before.get("rps"):
+            line += f"   p95 {(result['p95_ms'] / before['p95_ms'] - 1) * 100:+.0f}%, rps {(result['rps'] / before['rps'] - 1) * 100:+.0f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--lists", type=int, default=20, help="lists per user")
+    parser.add_argument("--products", type=int, default=50, help="products per list")
+    parser.add_argument("--shared", type=int, default=50, help="shared lists in total")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=1000, help="measured requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=10, help="unmeasured requests per client before measuring")
+    parser.add_argument("--endpoints", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="show the change against the results in this JSON file")
+    args = parser.parse_args()
+
+    setup()
+    import django
+    with database() as connection:
+        data = seed(args.users, args.lists, args.products, args.shared, random.Random(args.seed))
+        results = {}
+        for name in args.endpoints:
+            results[name] = run_scenario(name, data, args.requests, args.concurrency, args.warmup, args.seed)
+        vendor = connection.vendor
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)["results"]
+    print_results(results, baseline)
+    if args.output:
+        report = {
+            "commit": git_commit(),
+            "date": datetime.now(timezone.utc).isoformat(),
+            "database": vendor,
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "parameters": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+            "results": results,
+        }
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Per-request cost of each connection setup in grocery/database.py: a new
+connection for every request (CONN_MAX_AGE = 0, the old settings), a
+persistent one with and without health checks, and the pool behind
+DB_POOL_SIZE. Each simulated request does what Django does around a view
+with one query: the request_started and request_finished connection checks,
+and SELECT 1.
+
+    BENCH_DATABASE=postgres python -m benchmarks.connections [--requests N]
+
+Run it against Postgres, over the network if that is how production
+connects: SQLite opens a file, which is nearly free, and has no pool mode.
+"""
+import argparse
+import time
+from importlib import import_module
+from benchmarks import database, setup
+
+MODES = {
+    "connect per request": ({"CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": False}, None),
+    "persistent": ({"CONN_MAX_AGE": 60, "CONN_HEALTH_CHECKS": False}, None),
+    "persistent + health checks": ({"CONN_MAX_AGE": 60, "CONN_HEALTH_CHECKS": True}, None),
+    "pool": ({"CONN_MAX_AGE": 0, "CONN_HEALTH_CHECKS": False}, "grocery.pooled_postgresql"),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    setup()
+    with database() as connection:
+        run(connection, args.requests)
+
+
+def wrapper(connection, overrides, engine):
+    # A connection of its own, for the test database the default one points at
+    settings = {**connection.settings_dict, **overrides}
+    if engine is not None:
+        settings["ENGINE"] = engine
+        settings["OPTIONS"] = {**settings["OPTIONS"], "pool": {"max_size": 1, "timeout": 10}}
+    return import_module(f"{settings['ENGINE']}.base").DatabaseWrapper(settings, alias=f"bench-{engine}")
+
+
+def request(db):
+    db.close_if_unusable_or_obsolete()
+    with db.cursor() as cursor:
+        cursor.execute("SELECT 1")
+        cursor.fetchone()
+    db.close_if_unusable_or_obsolete()
+
+
+def run(connection, requests):
+    print(f"{connection.vendor}, {requests} requests per mode")
+    print(f"{'mode':<28} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'saved ms':>9}")
+    baseline = None
+    for name, (overrides, engine) in MODES.items():
+        if engine is not None and connection.vendor != "postgresql":
+            print(f"{name:<28} (PostgreSQL only)")
+            continue
+        db = wrapper(connection, overrides, engine)
+        request(db)
+        times = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            request(db)
+            times.append(time.perf_counter() - started)
+        db.close()
+        times.sort()
+        mean = sum(times) / len(times) * 1000
+        if baseline is None:
+            baseline = mean
+        print(f"{name:<28} {mean:>8.3f} {times[len(times) // 2] * 1000:>8.3f} {times[int(len(times) * 0.95)] * 1000:>8.3f} {baseline - mean:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Compares search.search() with the naive scan it replaces, icontains on the
+four text columns, for one user with many lists and products. Both sides
+return the ids of the matches only.
+
+    python -m benchmarks.search [--lists N] [--products N] [--repeat N]
+
+Set BENCH_DATABASE=postgres to measure the tsvector column and GIN index;
+the default SQLite database uses the FTS5 tables.
+"""
+import argparse
+import random
+import timeit
+from benchmarks import database, setup
+
+WORDS = (
+    "milk eggs bread butter cheese apples bananas oranges rice pasta flour sugar salt pepper cumin paprika "
+    "saffron coffee tea chicken beef salmon tuna beans lentils onions garlic tomatoes spinach lettuce yogurt"
+).split()
+TERMS = ["saffron", "milk", "chicken", "paprika"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lists", type=int, default=500)
+    parser.add_argument("--products", type=int, default=100, help="products per list")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    setup()
+    with database():
+        run(args.lists, args.products, args.repeat, random.Random(args.seed))
+
+
+def seed(lists, products, rng):
+    from shoppinglist.models import CustomUser, List, Product
+
+    user = CustomUser.objects.create(email="bench@example.com")
+    allLists = List.objects.bulk_create([
+        List(user=user, name=" ".join(rng.sample(WORDS, 2)), description=" ".join(rng.sample(WORDS, 4)))
+        for _ in range(lists)
+    ], batch_size=1000)
+    Product.objects.bulk_create([
+        Product(user=user, list=list, name=rng.choice(WORDS), note=" ".join(rng.sample(WORDS, 3)) if rng.random() < 0.3 else "")
+        for list in allLists for _ in range(products)
+    ], batch_size=1000)
+    return user
+
+
+def run(lists, products, repeat, rng):
+    from django.db.models import Q
+    from shoppinglist import search
+    from shoppinglist.models import List, Product
+
+    user = seed(lists, products, rng)
+    print(f"{lists} lists, {lists * products} products")
+    print(f"{'term':<10} {'matches':>8} {'icontains':>10} {'full-text':>10} {'speedup':>8}")
+    for term in TERMS:
+        def naive():
+            matches = list(List.objects.filter(Q(name__icontains=term) | Q(description__icontains=term), user=user).values_list("id", flat=True))
+            matches += Product.objects.filter(Q(name__icontains=term) | Q(note__icontains=term), user=user).values_list("id", flat=True)
+            return matches
+
+        def fullText():
+            # Everything, as the scan returns everything
+            return search.search(user.id, term, 0, lists * (products + 1))
+
+        naiveTime = min(timeit.repeat(naive, number=1, repeat=repeat))
+        searchTime = min(timeit.repeat(fullText, number=1, repeat=repeat))
+        print(f"{term:<10} {len(fullText()):>8} {naiveTime * 1000:>8.1f}ms {searchTime * 1000:>8.1f}ms {naiveTime / searchTime:>7.1f}x")
+        # First page only, which is what the endpoint runs
+        pageTime = min(timeit.repeat(lambda: search.search(user.id, term, 0, 100), number=1, repeat=repeat))
+        print(f"{'':<10} {'':>8} {'':>10} {pageTime * 1000:>8.1f}ms {naiveTime / pageTime:>7.1f}x  (first page of 100)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Compares ProductSerializer on model instances with ProductReadSerializer on
+values() rows, for one list of 1k and one of 10k products. Both sides include
+the query, as the views do.
+
+    python -m benchmarks.serializers [--repeat N]
+"""
+import argparse
+import timeit
+from benchmarks import database, setup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    setup()
+    with database():
+        run(args.repeat)
+
+
+def run(repeat):
+    from shoppinglist.models import CustomUser, List, Product
+    from shoppinglist.serializers import ProductReadSerializer, ProductSerializer
+
+    user = CustomUser.objects.create(email="bench@example.com")
+    print(f"{'rows':>6} {'ModelSerializer':>16} {'values()':>10} {'speedup':>8}")
+    for rows in (1000, 10000):
+        list = List.objects.create(user=user, name=f"{rows} products")
+        Product.objects.bulk_create(
+            [Product(user=user, list=list, name=f"Product {i}", quantity=i, checked=i % 2 == 0) for i in range(rows)],
+            batch_size=1000
+        )
+        products = Product.objects.filter(list=list)
+
+        def model():
+            return ProductSerializer(products.all(), many=True).data
+
+        def values():
+            return ProductReadSerializer(ProductReadSerializer.values(products.all()), many=True).data
+
+        assert model() == values()
+        modelTime = min(timeit.repeat(model, number=1, repeat=repeat))
+        valuesTime = min(timeit.repeat(values, number=1, repeat=repeat))
+        print(f"{rows:>6} {modelTime * 1000:>14.1f}ms {valuesTime * 1000:>8.1f}ms {modelTime / valuesTime:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+import os
+import tempfile
+from grocery.settings import *  # noqa: F401,F403
+
+# The benchmarks create and drop the TEST database, never NAME itself
+if os.environ.get('BENCH_DATABASE') == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('BENCH_PG_NAME', 'postgres'),
+            'USER': os.environ.get('BENCH_PG_USER', 'postgres'),
+            'PASSWORD': os.environ.get('BENCH_PG_PASSWORD', 'postgres'),
+            'HOST': os.environ.get('BENCH_PG_HOST', 'localhost'),
+            'PORT': os.environ.get('BENCH_PG_PORT', '5432'),
+            'TEST': {'NAME': 'grocery_bench'},
+        }
+    }
+else:
+    # A file rather than :memory: so concurrent clients share one database
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(tempfile.gettempdir(), 'grocery-bench.sqlite3'),
+            'OPTIONS': {'timeout': 30},
+            'TEST': {'NAME': os.path.join(tempfile.gettempdir(), 'grocery-bench.sqlite3')},
+        }
+    }
+
+DEBUG = False
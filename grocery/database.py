@@ -0,0 +1,128 @@
+"""
+DATABASES["default"], the read replicas and the shards from the environment,
+so one image runs against any database and connection setup without editing
+settings.py.
+
+    DB_ENGINE
+        "postgresql", the default, or "sqlite3" for local runs, where DB_NAME
+        is the database file and the settings below other than DB_SHARDS do
+        not apply.
+    DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT
+        Where to connect. Default to the docker-compose "db" service.
+    DB_CONNECT_TIMEOUT
+        Seconds to wait for a new connection. Default 5.
+    DB_STATEMENT_TIMEOUT
+        Milliseconds after which PostgreSQL cancels a query; 0, the default,
+        for no limit.
+    DB_CONN_MAX_AGE
+        Seconds a worker keeps its connection open between requests, "none"
+        for no limit, 0 to connect on every request. Default 60.
+    DB_CONN_HEALTH_CHECKS
+        Check a kept connection with SELECT 1 before the first query of each
+        request, so a connection the server dropped is replaced instead of
+        failing the request. Default on.
+    DB_POOL_SIZE
+        Above 0, borrow connections from a pool of at most this many per
+        process (grocery/pooled_postgresql) instead of keeping one per thread.
+        Replaces DB_CONN_MAX_AGE and DB_CONN_HEALTH_CHECKS. Default 0.
+    DB_POOL_TIMEOUT
+        Seconds a request waits for a pooled connection. Default 10.
+    DB_PGBOUNCER
+        Set when connecting through PgBouncer in transaction pooling mode.
+        Server-side cursors are turned off, since they do not survive the
+        transaction that opened them, and DB_STATEMENT_TIMEOUT is ignored,
+        since PgBouncer refuses startup options; set statement_timeout on the
+        database role instead. Default off.
+    DB_REPLICA_HOSTS
+        Comma-separated host or host:port of each read replica, connected to
+        with the settings above. shoppinglist/routers.py sends the reads of
+        GET requests to them. Default none.
+    DB_SHARDS
+        Comma-separated databases that hold users' lists and products besides
+        the default one, see shoppinglist/sharding.py: each [host[:port]/]name
+        for PostgreSQL, connected to with the settings above, or a file for
+        SQLite. Named "shard1", "shard2" and so on, in order; only ever add
+        to the end. Default none.
+"""
+import os
+
+
+def _flag(environ, name, default):
+    value = environ.get(name)
+    return default if value is None else value.lower() in ("1", "true", "yes")
+
+
+def _max_age(value):
+    return None if value.lower() == "none" else int(value)
+
+
+def database_from_environment(environ=None):
+    environ = os.environ if environ is None else environ
+    if environ.get("DB_ENGINE") == "sqlite3":
+        return {"ENGINE": "django.db.backends.sqlite3", "NAME": environ.get("DB_NAME", "db.sqlite3")}
+    poolSize = int(environ.get("DB_POOL_SIZE", 0))
+    pgbouncer = _flag(environ, "DB_PGBOUNCER", False)
+    options = {"connect_timeout": int(environ.get("DB_CONNECT_TIMEOUT", 5))}
+    statementTimeout = int(environ.get("DB_STATEMENT_TIMEOUT", 0))
+    if statementTimeout and not pgbouncer:
+        options["options"] = f"-c statement_timeout={statementTimeout}"
+    database = {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": environ.get("DB_NAME", "postgres"),
+        "USER": environ.get("DB_USER", "postgres"),
+        "PASSWORD": environ.get("DB_PASSWORD", "postgres"),
+        "HOST": environ.get("DB_HOST", "db"),
+        "PORT": environ.get("DB_PORT", "5432"),
+        "CONN_MAX_AGE": _max_age(environ.get("DB_CONN_MAX_AGE", "60")),
+        "CONN_HEALTH_CHECKS": _flag(environ, "DB_CONN_HEALTH_CHECKS", True),
+        "DISABLE_SERVER_SIDE_CURSORS": pgbouncer,
+        "OPTIONS": options,
+    }
+    if poolSize > 0:
+        database["ENGINE"] = "grocery.pooled_postgresql"
+        # Each request hands its connection back to the pool when it ends
+        database["CONN_MAX_AGE"] = 0
+        database["CONN_HEALTH_CHECKS"] = False
+        options["pool"] = {"max_size": poolSize, "timeout": float(environ.get("DB_POOL_TIMEOUT", 10))}
+    return database
+
+
+def replicas_from_environment(environ=None):
+    """
+    DATABASES entries for the replicas in DB_REPLICA_HOSTS, named "replica1",
+    "replica2" and so on.
+    """
+    environ = os.environ if environ is None else environ
+    hosts = [host.strip() for host in environ.get("DB_REPLICA_HOSTS", "").split(",") if host.strip()]
+    replicas = {}
+    for number, host in enumerate(hosts, 1):
+        replica = database_from_environment(environ)
+        replica["HOST"], _, port = host.partition(":")
+        if port:
+            replica["PORT"] = port
+        # Tests have no replica; its alias reads the test primary instead
+        replica["TEST"] = {"MIRROR": "default"}
+        replicas[f"replica{number}"] = replica
+    return replicas
+
+
+def shards_from_environment(environ=None):
+    """
+    DATABASES entries for the shards in DB_SHARDS, named "shard1", "shard2"
+    and so on.
+    """
+    environ = os.environ if environ is None else environ
+    names = [name.strip() for name in environ.get("DB_SHARDS", "").split(",") if name.strip()]
+    shards = {}
+    for number, name in enumerate(names, 1):
+        shard = database_from_environment(environ)
+        if shard["ENGINE"] == "django.db.backends.sqlite3":
+            shard["NAME"] = name
+        else:
+            location, _, shard["NAME"] = name.rpartition("/")
+            if location:
+                shard["HOST"], _, port = location.partition(":")
+                if port:
+                    shard["PORT"] = port
+        shards[f"shard{number}"] = shard
+    return shards
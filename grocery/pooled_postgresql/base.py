@@ -0,0 +1,112 @@
+"""
+PostgreSQL backend that borrows connections from a bounded per-process pool
+instead of opening a new one for every request. Selected by
+grocery/database.py when DB_POOL_SIZE is set:
+
+    DATABASES["default"]["ENGINE"] = "grocery.pooled_postgresql"
+    DATABASES["default"]["OPTIONS"]["pool"] = {"max_size": 4, "timeout": 10}
+
+Django still "closes" the connection at the end of each request
+(CONN_MAX_AGE = 0); here that hands it back to the pool, rolled back if a
+transaction was left open. At most ``max_size`` connections are checked out
+at once. A thread that finds none free waits up to ``timeout`` seconds, then
+gets an OperationalError. Connections that sat idle longer than
+``check_after`` seconds are pinged before reuse, and ones that saw a database
+error are closed rather than returned.
+"""
+import os
+import threading
+import time
+from django.db.backends.postgresql import base
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+Database = base.Database
+
+
+class ConnectionPool:
+    def __init__(self, max_size=4, timeout=10, check_after=30):
+        self.timeout = timeout
+        self.check_after = check_after
+        self._idle = []
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+
+    def checkout(self, connect):
+        """
+        Return an idle connection, or a new one from ``connect()``.
+        """
+        if not self._slots.acquire(timeout=self.timeout):
+            raise Database.OperationalError(f"No database connection became free within {self.timeout}s.")
+        try:
+            while True:
+                with self._lock:
+                    connection, returned = self._idle.pop() if self._idle else (None, None)
+                if connection is None:
+                    return connect()
+                if self._usable(connection, returned):
+                    return connection
+                connection.close()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def checkin(self, connection, discard=False):
+        try:
+            if not discard and not connection.closed:
+                if connection.info.transaction_status != TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+                with self._lock:
+                    self._idle.append((connection, time.monotonic()))
+                return
+            connection.close()
+        except Database.Error:
+            connection.close()
+        finally:
+            self._slots.release()
+
+    def _usable(self, connection, returned):
+        if connection.closed:
+            return False
+        if time.monotonic() - returned < self.check_after:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            return True
+        except Database.Error:
+            return False
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, options):
+    # Keyed by process too: connections inherited across a fork share their
+    # socket with the parent and must not be reused
+    key = (os.getpid(), alias)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(**options)
+        return _pools[key]
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop("pool", None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        return self._pool().checkout(lambda: super(DatabaseWrapper, self).get_new_connection(conn_params))
+
+    def _close(self):
+        if self.connection is None:
+            return
+        # Inside atomic() Django keeps its reference to the connection until
+        # the block exits, so it must not go back to the pool yet
+        discard = self.errors_occurred or self.in_atomic_block
+        self._pool().checkin(self.connection, discard=discard)
+
+    def _pool(self):
+        return get_pool(self.alias, self.settings_dict["OPTIONS"].get("pool", {}))
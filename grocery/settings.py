@@ -10,8 +10,10 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
+from grocery.database import database_from_environment, replicas_from_environment, shards_from_environment
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -47,10 +49,66 @@ AUTH_USER_MODEL = "shoppinglist.CustomUser"
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'shoppinglist.authentication.StatelessJWTAuthentication',
     ],
 }
 
+AUTHENTICATION_BACKENDS = [
+    'shoppinglist.backends.PooledModelBackend',
+]
+
+# Django's hashers, with PBKDF2 replaced by one whose iteration count is
+# tunable. Hashes made with another count or hasher are upgraded on login.
+PASSWORD_HASHERS = [
+    'shoppinglist.hashers.TunablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+PASSWORD_PBKDF2_ITERATIONS = int(os.environ.get('PASSWORD_PBKDF2_ITERATIONS', 600000))
+
+# Threads per process that hash passwords, how many hashes may be running or
+# waiting before signups and logins get a 503, and the Retry-After it sends.
+# The count is kept in this cache alias: across all processes when it is
+# shared, per process with the local-memory default. A slot left by a process
+# that died is freed after PASSWORD_HASHING_SLOT_TIMEOUT seconds.
+PASSWORD_HASHING_WORKERS = int(os.environ.get('PASSWORD_HASHING_WORKERS', 2))
+PASSWORD_HASHING_QUEUE = int(os.environ.get('PASSWORD_HASHING_QUEUE', 8))
+PASSWORD_HASHING_RETRY_AFTER = 1
+PASSWORD_HASHING_CACHE = 'default'
+PASSWORD_HASHING_SLOT_TIMEOUT = 30
+
+# How long StatelessJWTAuthentication trusts a cached is_active flag, and how
+# many users it keeps, per process
+JWT_USER_SNAPSHOT_TTL = 60
+JWT_USER_SNAPSHOT_SIZE = 10000
+
+# Default and maximum ?page_size= for the cursor-paginated endpoints
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# Largest array accepted by the /v1/products/bulk endpoints, and how many
+# rows go into each INSERT/UPDATE statement
+BULK_MAX_ITEMS = 1000
+BULK_BATCH_SIZE = 500
+
+# How long tombstones of deleted lists and products are kept for /v1/sync;
+# prune_tombstones deletes older ones, and tokens older than this get a 410
+SYNC_TOMBSTONE_RETENTION = timedelta(days=int(os.environ.get('SYNC_TOMBSTONE_RETENTION_DAYS', 30)))
+
+# Rows fetched per round trip by the server-side cursors of /v1/export
+EXPORT_CHUNK_SIZE = 2000
+
+# Lines of a /v1/import upload or import_lists file per transaction, and how
+# many per-row errors the report lists
+IMPORT_CHUNK_SIZE = 500
+IMPORT_MAX_ERRORS = 1000
+
+# Default and maximum ?limit= for /v1/products/suggest
+SUGGESTIONS_LIMIT = 10
+SUGGESTIONS_MAX_LIMIT = 50
+
 SIMPJWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),  
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
@@ -58,6 +116,9 @@ SIMPJWT = {
 }
 
 MIDDLEWARE = [
+    'shoppinglist.middleware.RequestTimingMiddleware',
+    'shoppinglist.middleware.ReplicaRoutingMiddleware',
+    'shoppinglist.middleware.ShardMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -68,6 +129,23 @@ MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware'
 ]
 
+# Send each request's timings to clients in a Server-Timing header, see
+# shoppinglist/middleware.py. The per-URL histograms are kept either way.
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '1').lower() in ('1', 'true', 'yes')
+
+# Log requests that run more queries than their budget in
+# shoppinglist/budgets.py, with the SQL. Keeps every statement of every
+# request in memory, so meant for development and staging.
+QUERY_BUDGETS_DEBUG = os.environ.get('QUERY_BUDGETS_DEBUG', '').lower() in ('1', 'true', 'yes')
+
+# Who may read /metrics, see shoppinglist/metrics.py: clients at these
+# addresses, and clients sending "Authorization: Bearer <METRICS_TOKEN>" once
+# it is set. Behind a proxy on the same host every request comes from the
+# proxy's address, so have the proxy refuse /metrics, or set
+# METRICS_ALLOWED_IPS to "" and scrape with the token.
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip.strip()]
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
 ROOT_URLCONF = 'grocery.urls'
 
 TEMPLATES = [
@@ -92,17 +170,77 @@ WSGI_APPLICATION = 'grocery.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Connection, timeouts, persistent connections and pooling come from DB_*
+# environment variables; see grocery/database.py
+
 DATABASES = {
+    'default': database_from_environment(),
+    **replicas_from_environment(),
+    **shards_from_environment(),
+}
+
+# Reads of GET, HEAD and OPTIONS requests go to one of these aliases, writes
+# and everything else to 'default'; see shoppinglist/routers.py
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias.startswith('replica')]
+DATABASE_ROUTERS = ['shoppinglist.routers.ShardRouter', 'shoppinglist.routers.ReplicaRouter']
+
+# Databases holding users' lists and products, by user; see
+# shoppinglist/sharding.py. Users without a shard are on the first. A shard's
+# position sets the range of ids its rows get, so new ones go at the end.
+SHARDS = ['default', *(alias for alias in DATABASES if alias.startswith('shard'))]
+# Cache alias and lifetime (seconds) of the user-to-shard map. Must be shared
+# by every process: rebalance_shards refuses to move users with a local one.
+SHARD_MAP_CACHE = 'default'
+SHARD_MAP_TIMEOUT = 300
+# Retry-After sent with the 503 for writes of a user being moved
+SHARD_MOVE_RETRY_AFTER = 5
+
+# Seconds a client reads from 'default' after writing, so it sees its writes
+# while the replicas catch up. Set above the replicas' usual lag. The pins are
+# kept in this cache alias, which must be shared by every process; with a
+# local one (LocMemCache, DummyCache) the replicas are not used.
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 5))
+REPLICA_PIN_CACHE = 'default'
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Local memory unless CACHE_BACKEND / CACHE_LOCATION point somewhere shared,
+# e.g. django.core.cache.backends.redis.RedisCache and redis://cache:6379
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'postgres',                      
-        'USER': 'postgres',
-        'PASSWORD': 'postgres',
-        'HOST': 'db',
-        'PORT': '5432',
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
     }
 }
 
+# Cache alias and lifetime (seconds) of public shared-list payloads
+SHARED_LIST_CACHE = 'default'
+SHARED_LIST_CACHE_TIMEOUT = 300
+
+# Seconds a new share's signed token is valid for, or None for as long as the
+# share exists; see shoppinglist/share_tokens.py
+SHARE_TOKEN_LIFETIME = int(os.environ['SHARE_TOKEN_LIFETIME']) if os.environ.get('SHARE_TOKEN_LIFETIME') else None
+# Whether the random tokens of shares made before tokens were signed still work
+SHARE_LEGACY_TOKENS = os.environ.get('SHARE_LEGACY_TOKENS', '1').lower() in ('1', 'true', 'yes')
+
+# Push channel for shared-list changes, see shoppinglist/realtime.py. The
+# in-memory broker only reaches viewers connected to the same process.
+REALTIME_BROKER = 'shoppinglist.realtime.InMemoryBroker'
+# Events buffered per viewer before it is told to reload: 0 for no limit,
+# otherwise at least 2, one event and the overflow marker
+REALTIME_QUEUE_SIZE = 100
+# Seconds between keep-alive comments, and the reconnect delay sent to clients
+REALTIME_HEARTBEAT = 15
+REALTIME_RETRY_MS = 3000
+
+# Serve the read endpoints with the coroutine views in
+# shoppinglist/async_views.py. Only worth it under ASGI; grocery.uvicorn_worker
+# turns it on.
+ASYNC_READ_VIEWS = os.environ.get('ASYNC_READ_VIEWS', '').lower() in ('1', 'true', 'yes')
+
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
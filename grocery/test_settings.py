@@ -0,0 +1,13 @@
+"""
+Settings for the test suite:
+
+    python manage.py test --settings=grocery.test_settings
+
+Adds "shard1", a second SQLite database, for the tests that move users
+between shards. SHARDS leaves it out, so the rest of the suite runs on one
+shard; those tests add it with override_settings.
+"""
+from grocery.settings import *  # noqa: F401,F403
+
+DATABASES.setdefault('shard1', {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'})
+SHARDS = ['default']
@@ -16,6 +16,7 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from shoppinglist.metrics import metrics_view
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
@@ -28,4 +29,5 @@ urlpatterns = [
     path('v1/token/refresh', TokenRefreshView.as_view(), name='token_refresh'),
     path('v1/token/verify', TokenVerifyView.as_view(), name='token_verify'),
     path('v1/', include('shoppinglist.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
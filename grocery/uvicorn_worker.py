@@ -0,0 +1,20 @@
+"""
+Gunicorn worker class that serves grocery.asgi:application with uvicorn.
+
+    gunicorn grocery.asgi:application -k grocery.uvicorn_worker.UvicornWorker
+
+Each worker process runs one event loop, and the read endpoints are served by
+the coroutine views in shoppinglist/async_views.py, so a slow client waiting
+on a response holds no thread.
+"""
+
+import os
+
+from uvicorn.workers import UvicornWorker as BaseUvicornWorker
+
+os.environ.setdefault('ASYNC_READ_VIEWS', '1')
+
+
+class UvicornWorker(BaseUvicornWorker):
+    # Django's ASGI handler does not implement the lifespan protocol
+    CONFIG_KWARGS = {**BaseUvicornWorker.CONFIG_KWARGS, "lifespan": "off"}
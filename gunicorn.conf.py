@@ -0,0 +1,34 @@
+"""
+Gunicorn settings, read automatically when gunicorn is started from this
+directory (see the Dockerfile).
+
+Puts the Prometheus client into multiprocess mode so /metrics reports the sum
+over all workers rather than whichever worker answered the scrape.
+
+Runs threaded workers, so a request waiting for its password hash (see
+shoppinglist/hashing.py) does not stop its worker from serving others.
+GUNICORN_THREADS sets the threads per worker. The ASGI command in the
+Dockerfile picks its own worker class.
+"""
+import os
+import shutil
+import tempfile
+
+# Must be set before prometheus_client is imported in this process or a worker
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "grocery-prometheus"))
+
+from prometheus_client import multiprocess  # noqa: E402
+
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+
+
+def on_starting(server):
+    # Samples left by a previous run would be added to this one's
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+
+
+def child_exit(server, worker):
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,123 @@
+"""
+Async versions of the read endpoints, routed in urls.py when
+settings.ASYNC_READ_VIEWS is on (grocery/uvicorn_worker.py turns it on).
+
+Reads run on the event loop with the async ORM and AsyncJWTAuthentication, so a
+slow client or a slow query does not pin a thread. Every other method on the
+same URL is handed to the DRF viewset in a worker thread. Responses match
+what the viewsets return, except that a missing object is a 404 rather than
+a server error.
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotFound
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from .authentication import AsyncJWTAuthentication
+from .models import List, Product
+from .pagination import IdCursorPagination
+from .serializers import ListReadSerializer, ListSerializer, ProductReadSerializer, ProductSerializer
+from . import cache, etags, share_tokens
+
+
+def with_async_get(sync_view, async_get):
+    """
+    Serve GET and HEAD with the coroutine ``async_get`` and any other method
+    with the DRF view ``sync_view``.
+    """
+    async def view(request, *args, **kwargs):
+        if request.method in ("GET", "HEAD"):
+            try:
+                return await async_get(request, *args, **kwargs)
+            except APIException as exc:
+                return _error(exc)
+        return await sync_to_async(sync_view)(request, *args, **kwargs)
+    # DRF views are csrf exempt; django.views.decorators.csrf.csrf_exempt
+    # cannot wrap a coroutine function in Django 4.2
+    view.csrf_exempt = True
+    # Report under the viewset's name in the request metrics
+    view.cls = getattr(sync_view, "cls", None)
+    view.actions = getattr(sync_view, "actions", None)
+    return view
+
+
+def _json(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(JSONRenderer().render(data), content_type="application/json", status=status_code)
+
+
+def _error(exc):
+    # Same body and headers as rest_framework.views.exception_handler
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {"detail": exc.detail}
+    response = _json(data, exc.status_code)
+    if exc.status_code == status.HTTP_401_UNAUTHORIZED:
+        response["WWW-Authenticate"] = AsyncJWTAuthentication().authenticate_header(None)
+    return response
+
+
+async def _authenticate(request):
+    # The viewsets authenticate every request, so a bad token is a 401 even
+    # on the public endpoints
+    result = await AsyncJWTAuthentication().aauthenticate(request)
+    return result[0] if result else None
+
+
+async def _conditional(request, etag, build):
+    if etag is None:
+        raise NotFound()
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = await build()
+    response.headers.setdefault("ETag", etag)
+    return response
+
+
+async def list_list(request):
+    user = await _authenticate(request)
+    if user is None:
+        raise NotFound()
+
+    async def build():
+        paginator = IdCursorPagination()
+        lists = ListReadSerializer.values(List.objects.filter(user=user.id))
+        page = await sync_to_async(paginator.paginate_queryset)(lists, Request(request))
+        return _json(paginator.get_paginated_response(ListReadSerializer(page, many=True).data).data)
+    return await _conditional(request, await etags.alist_collection_etag(user.id), build)
+
+
+async def list_retrieve(request, pk=None):
+    await _authenticate(request)
+
+    async def build():
+        return _json(ListSerializer(await List.objects.aget(id=pk)).data)
+    return await _conditional(request, await etags.alist_etag(pk), build)
+
+
+async def product_retrieve(request, pk=None):
+    await _authenticate(request)
+
+    async def build():
+        return _json(ProductSerializer(await Product.objects.aget(id=pk)).data)
+    return await _conditional(request, await etags.aproduct_etag(pk), build)
+
+
+async def shared_list_retrieve(request, access_token=None):
+    await _authenticate(request)
+
+    async def load():
+        # ashared_list_etag() has checked the token
+        list = await ListReadSerializer.values(List.objects.filter(**share_tokens.list_filter(access_token))).aget()
+        products = [row async for row in ProductReadSerializer.values(Product.objects.filter(list=list["id"]))]
+        return {
+            "products": ProductReadSerializer(products, many=True).data,
+            "list": ListReadSerializer(list).data
+        }
+
+    async def build():
+        try:
+            return _json(await cache.aget_shared_list(access_token, load))
+        except List.DoesNotExist:
+            # Share revoked since ashared_list_etag() found the list
+            raise NotFound()
+    return await _conditional(request, await etags.ashared_list_etag(access_token), build)
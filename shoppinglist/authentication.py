@@ -0,0 +1,155 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from . import sharding
+from .metrics import AUTHENTICATION_DURATION
+
+
+def _observe(started, outcome):
+    AUTHENTICATION_DURATION.labels(outcome).observe(time.perf_counter() - started)
+
+
+def _outcome(result):
+    return "anonymous" if result is None else "authenticated"
+
+
+class TimedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that reports how long each authentication took, and
+    whether it succeeded, to the Prometheus metrics.
+    """
+    def authenticate(self, request):
+        started = time.perf_counter()
+        try:
+            result = super().authenticate(request)
+        except Exception:
+            _observe(started, "failed")
+            raise
+        _observe(started, _outcome(result))
+        return result
+
+
+class UserSnapshots:
+    """
+    Bounded cache of each user's is_active flag, for ``ttl`` seconds and at
+    most ``max_size`` users, least recently used first out. signals.py drops a
+    user's entry when the user is saved or deleted in this process; other
+    processes see the change once their entry expires.
+    """
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """
+        Return the cached is_active flag, or None if the user is not cached.
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            isActive, expires = entry
+            if expires <= time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return isActive
+
+    def set(self, user_id, is_active):
+        with self._lock:
+            self._entries[user_id] = (is_active, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_snapshots = UserSnapshots(settings.JWT_USER_SNAPSHOT_TTL, settings.JWT_USER_SNAPSHOT_SIZE)
+
+
+class StatelessJWTAuthentication(TimedJWTAuthentication):
+    """
+    Authenticates as a simplejwt TokenUser built from the token's claims
+    instead of loading the CustomUser row. The views only need the user's id.
+    Whether the user still exists and is active comes from user_snapshots,
+    so only the first request of a user in ``JWT_USER_SNAPSHOT_TTL`` seconds
+    runs a query. Also routes the request to the user's shard.
+    """
+    def get_user(self, validated_token):
+        user_id = self._user_id(validated_token)
+        isActive = user_snapshots.get(user_id)
+        if isActive is None:
+            isActive = self.user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).values_list("is_active", flat=True).first()
+            self._remember(user_id, isActive)
+        user = self._token_user(validated_token, isActive)
+        sharding.activate(user_id)
+        return user
+
+    def _user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+    def _remember(self, user_id, is_active):
+        if is_active is not None:
+            user_snapshots.set(user_id, is_active)
+
+    def _token_user(self, validated_token, is_active):
+        if is_active is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if not is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return TokenUser(validated_token)
+
+
+class AsyncJWTAuthentication(StatelessJWTAuthentication):
+    """
+    StatelessJWTAuthentication for the async views. The token signature and
+    claims are checked in memory; the only I/O, the snapshot lookup on a
+    miss, goes through the async ORM so the event loop is never blocked.
+    """
+    async def aauthenticate(self, request):
+        started = time.perf_counter()
+        try:
+            result = await self._aauthenticate(request)
+        except Exception:
+            _observe(started, "failed")
+            raise
+        _observe(started, _outcome(result))
+        return result
+
+    async def _aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        user_id = self._user_id(validated_token)
+        isActive = user_snapshots.get(user_id)
+        if isActive is None:
+            isActive = await self.user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).values_list("is_active", flat=True).afirst()
+            self._remember(user_id, isActive)
+        user = self._token_user(validated_token, isActive)
+        await sharding.aactivate(user_id)
+        return user
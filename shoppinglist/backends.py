@@ -0,0 +1,30 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from . import hashing
+
+
+class PooledModelBackend(ModelBackend):
+    """
+    ModelBackend that verifies passwords on the hashing pool (see hashing.py)
+    and saves the rehashed password when the stored hash is out of date.
+    Raises hashing.HashingUnavailable when the pool is full.
+    """
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # Hash anyway, so unknown and known users take as long
+            hashing.make_password(password)
+            return None
+        valid, rehashed = hashing.check_password(password, user.password)
+        if not valid or not self.user_can_authenticate(user):
+            return None
+        if rehashed is not None:
+            user.password = rehashed
+            user.save(update_fields=["password"])
+        return user
@@ -0,0 +1,86 @@
+"""
+Query budgets: the most database queries one request to each endpoint may
+run, keyed by URL name and method. Authenticated requests are counted with
+the user's snapshot cached (see authentication.StatelessJWTAuthentication);
+a cold snapshot adds one query. Bulk endpoints have the same budget whatever
+the batch size.
+
+QueryBudgetTestCase in tests.py runs every endpoint against its budget, so a
+change that adds a per-row query fails the suite. With
+settings.QUERY_BUDGETS_DEBUG on, RequestTimingMiddleware also checks live
+requests and logs the ones over budget with their SQL.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+QUERY_BUDGETS = {
+    ("sharedList-create-list-destroy", "GET"): 1,
+    ("sharedList-create-list-destroy", "POST"): 4,
+    # Also bumps the list's share generation, revoking its signed tokens
+    ("sharedList-create-list-destroy", "DELETE"): 3,
+    # ETag lookup, then the list and its products, all by primary key; none
+    # once cached and none for a token that fails its signature check
+    ("sharedList-retrieve", "GET"): 3,
+    ("sharedList-events", "GET"): 1,
+    ("product-list-create", "GET"): 2,
+    # Writes also take the owner's clock, stamp the lists, find the shares
+    # whose cached payloads to drop and count the new names for autocomplete
+    ("product-list-create", "POST"): 8,
+    ("product-bulk", "POST"): 7,
+    ("product-bulk", "PUT"): 8,
+    ("product-bulk", "DELETE"): 7,
+    ("product-bulk-check", "POST"): 6,
+    ("product-suggest", "GET"): 1,
+    ("product-destroy-retrieve-update", "GET"): 2,
+    ("product-destroy-retrieve-update", "PUT"): 8,
+    ("product-destroy-retrieve-update", "DELETE"): 7,
+    ("list-list-create", "GET"): 2,
+    ("list-list-create", "POST"): 3,
+    ("list-retrieve-update-destroy", "GET"): 2,
+    ("list-retrieve-update-destroy", "PUT"): 6,
+    ("list-retrieve-update-destroy", "DELETE"): 7,
+    ("sync", "GET"): 3,
+    # The ranked search, then the lists and the products it found
+    ("search", "GET"): 3,
+    # The lists and the products, both streamed, whatever their number
+    ("export", "GET"): 2,
+    # Per chunk of lines: the clock, the lists, the products and their names
+    ("import", "POST"): 4,
+    # The response includes the new user's groups and permissions
+    ("user-create", "POST"): 6,
+    ("metrics", "GET"): 0,
+}
+
+# Savepoints depend on how deeply the view's transaction is nested (the test
+# runner wraps every test in one), not on what the view does
+_IGNORED_PREFIXES = ("SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO SAVEPOINT")
+
+
+def count(statements):
+    return sum(1 for sql in statements if not sql.lstrip().upper().startswith(_IGNORED_PREFIXES))
+
+
+def check(url_name, method, statements):
+    """
+    Return (budget, queries) if the request ran more queries than its budget,
+    otherwise None. Endpoints without a budget always pass.
+    """
+    budget = QUERY_BUDGETS.get((url_name, method))
+    if budget is None:
+        return None
+    queries = count(statements)
+    if queries > budget:
+        return budget, queries
+    return None
+
+
+def report(url_name, method, statements):
+    violation = check(url_name, method, statements)
+    if violation is not None:
+        budget, queries = violation
+        logger.warning(
+            "%s %s ran %d queries, over its budget of %d:\n%s",
+            method, url_name, queries, budget, "\n".join(statements)
+        )
+    return violation
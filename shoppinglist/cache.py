@@ -0,0 +1,153 @@
+import random
+import threading
+from django.conf import settings
+from django.core.cache import caches
+from .models import SharedList
+from . import metrics, routers, sharding
+
+KEY_PREFIX = "shared-list:"
+# Bumped by writers instead of deleting the payload, see get_shared_list().
+# A generation starts from a random value, so one that was evicted and created
+# again never matches a payload stored under the old one
+GENERATION_PREFIX = "shared-list-generation:"
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+
+def _cache():
+    return caches[settings.SHARED_LIST_CACHE]
+
+
+def _count(outcome):
+    with _lock:
+        _stats[outcome] += 1
+    metrics.SHARED_LIST_CACHE.labels(outcome).inc()
+
+
+def stats():
+    """
+    Hit and miss counts of the shared-list cache in this process.
+    """
+    with _lock:
+        return dict(_stats)
+
+
+def _keys(access_token):
+    return [KEY_PREFIX + access_token, GENERATION_PREFIX + access_token]
+
+
+def _unpack(values, access_token):
+    # (payload or None, current generation or None) from get_many(_keys())
+    key, generationKey = _keys(access_token)
+    generation = values.get(generationKey)
+    entry = values.get(key)
+    if generation is not None and entry is not None and entry[0] == generation:
+        return entry[1], generation
+    return None, generation
+
+
+def _new_generation():
+    return random.getrandbits(62)
+
+
+def _start_generation(access_token):
+    # The token's generation, creating it if missing; None if it is evicted
+    # straight away
+    key = GENERATION_PREFIX + access_token
+    generation = _new_generation()
+    if _cache().add(key, generation, None):
+        return generation
+    return _cache().get(key)
+
+
+async def _astart_generation(access_token):
+    key = GENERATION_PREFIX + access_token
+    generation = _new_generation()
+    if await _cache().aadd(key, generation, None):
+        return generation
+    return await _cache().aget(key)
+
+
+def peek_shared_list(access_token):
+    """
+    Return the cached payload for ``access_token`` or None, without loading it
+    or counting towards the hit and miss totals.
+    """
+    return _unpack(_cache().get_many(_keys(access_token)), access_token)[0]
+
+
+def get_shared_list(access_token, load):
+    """
+    Return the cached ``{products, list}`` payload for ``access_token``, calling
+    ``load()`` to build and store it on a miss. ``load()`` reads from the
+    primary: a replica that has not caught up with the write that invalidated
+    the entry would put the old payload back for the whole timeout.
+
+    The payload is stored with the token's generation as read before
+    ``load()``. A write that commits while ``load()`` runs bumps the
+    generation, so the payload, which may predate the write, is never served.
+    """
+    payload, generation = _unpack(_cache().get_many(_keys(access_token)), access_token)
+    if payload is not None:
+        _count("hits")
+        return payload
+    _count("misses")
+    if generation is None:
+        generation = _start_generation(access_token)
+    with routers.use_primary():
+        payload = load()
+    if generation is not None:
+        _cache().set(KEY_PREFIX + access_token, (generation, payload), settings.SHARED_LIST_CACHE_TIMEOUT)
+    return payload
+
+
+async def apeek_shared_list(access_token):
+    return _unpack(await _cache().aget_many(_keys(access_token)), access_token)[0]
+
+
+async def aget_shared_list(access_token, aload):
+    """
+    Coroutine version of get_shared_list(); ``aload`` is awaited on a miss.
+    """
+    payload, generation = _unpack(await _cache().aget_many(_keys(access_token)), access_token)
+    if payload is not None:
+        _count("hits")
+        return payload
+    _count("misses")
+    if generation is None:
+        generation = await _astart_generation(access_token)
+    with routers.use_primary():
+        payload = await aload()
+    if generation is not None:
+        await _cache().aset(KEY_PREFIX + access_token, (generation, payload), settings.SHARED_LIST_CACHE_TIMEOUT)
+    return payload
+
+
+def _bump(access_tokens):
+    for token in access_tokens:
+        key = GENERATION_PREFIX + token
+        try:
+            _cache().incr(key)
+        except ValueError:
+            # Evicted or never started: a fresh generation matches no stored
+            # payload
+            _cache().set(key, _new_generation(), None)
+
+
+def invalidate_tokens(access_tokens):
+    """
+    Retire the cached payloads for ``access_tokens`` once the current
+    transaction commits, so readers cannot re-cache the old rows in between.
+    """
+    tokens = list(access_tokens)
+    if tokens:
+        sharding.on_commit(lambda: _bump(tokens))
+
+
+def invalidate_lists(list_ids):
+    """
+    Drop the cached payloads of every share of ``list_ids``. The tokens are
+    looked up right away, while the share rows still exist.
+    """
+    invalidate_tokens(SharedList.objects.filter(list_id__in=list_ids).values_list("access_token", flat=True))
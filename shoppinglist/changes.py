@@ -0,0 +1,90 @@
+from collections import defaultdict
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from .models import List, SyncClock, Tombstone
+from .cache import invalidate_lists
+from .sync import next_version
+from .realtime import publish_on_commit
+
+
+class ListChanges:
+    """
+    Collects the lists touched by a batch of writes, the resulting changes to
+    List.total and List.checked, and the rows deleted along the way.
+
+    version_for() takes one SyncClock value per user for the whole batch.
+    apply() stamps every touched list with its owner's clock and adjusts the
+    counters, using one UPDATE per distinct delta instead of one per product.
+    It then writes the tombstones, and once the transaction commits it drops
+    the cached shared-list payloads and pushes the collected events to viewers.
+    """
+    def __init__(self):
+        self.deltas = defaultdict(lambda: [0, 0])
+        self.versions = {}
+        self.tombstones = []
+        self.events = []
+
+    def version_for(self, user_id):
+        if user_id not in self.versions:
+            self.versions[user_id] = next_version(user_id)
+        return self.versions[user_id]
+
+    def event(self, list_id, type, **payload):
+        self.events.append((list_id, {"type": type, "list": list_id, **payload}))
+
+    def touch(self, list_id):
+        self.deltas[list_id]
+
+    def add(self, list_id, checked):
+        self._count(list_id, checked, 1)
+
+    def remove(self, list_id, checked, product_id, user_id):
+        self._count(list_id, checked, -1)
+        self.tombstones.append((Tombstone.PRODUCT, product_id, user_id))
+
+    def remove_list(self, list_id, user_id):
+        self.tombstones.append((Tombstone.LIST, list_id, user_id))
+
+    def change(self, old_list_id, old_checked, new_list_id, new_checked):
+        if old_list_id != new_list_id or bool(old_checked) != bool(new_checked):
+            self._count(old_list_id, old_checked, -1)
+            self._count(new_list_id, new_checked, 1)
+        else:
+            self.touch(new_list_id)
+
+    def _count(self, list_id, checked, sign):
+        delta = self.deltas[list_id]
+        delta[0] += sign
+        delta[1] += sign * int(bool(checked))
+
+    def apply(self):
+        """
+        Apply the collected changes with F() expressions. Must run inside the
+        transaction that wrote the products.
+        """
+        if self.deltas:
+            lists = List.objects.filter(id__in=list(self.deltas))
+            # Owners other than the writers still need their clock moved on
+            SyncClock.objects.filter(user__in=lists.values("user")).exclude(user__in=list(self.versions)).update(value=F("value") + 1)
+            clock = SyncClock.objects.filter(user=OuterRef("user")).values("value")[:1]
+            groups = defaultdict(list)
+            for list_id, (total, checked) in self.deltas.items():
+                groups[(total, checked)].append(list_id)
+            for (total, checked), list_ids in groups.items():
+                fields = {"version": Subquery(clock), "updated_at": timezone.now()}
+                if total:
+                    fields["total"] = Greatest(F("total") + total, Value(0))
+                if checked:
+                    fields["checked"] = Greatest(F("checked") + checked, Value(0))
+                List.objects.filter(id__in=list_ids).update(**fields)
+            invalidate_lists(list(self.deltas))
+        if self.tombstones:
+            Tombstone.objects.bulk_create([
+                Tombstone(kind=kind, object_id=object_id, user_id=user_id, version=self.version_for(user_id))
+                for kind, object_id, user_id in self.tombstones
+            ])
+        publish_on_commit(self.events)
+        self.deltas.clear()
+        self.tombstones.clear()
+        self.events.clear()
@@ -0,0 +1,113 @@
+"""
+ETag functions for django.views.decorators.http.condition, plus coroutine
+versions of the same validators for the async views.
+
+Every write to a list or its products stamps List.version with a fresh value
+of the owner's SyncClock (see changes.py), so the validators below are built
+from that column alone. None of them load product rows or run a serializer,
+which is what makes a 304 cheap.
+"""
+from django.db.models import Count, Max, Subquery, Sum
+from .models import List, Product, Tombstone
+from . import cache, share_tokens, sharding
+
+
+def _user_lists_summary(user_id):
+    # Any create, update or delete changes the count, the version sum or the
+    # newest id of the user's lists
+    return List.objects.filter(user=user_id).aggregate(n=Count("id"), versions=Sum("version"), last=Max("id"))
+
+
+def _user_products_summary(user_id):
+    # A user's products may sit in other users' lists, whose versions do not
+    # move when they change. Every product write is stamped with its user's
+    # clock, raising the newest version, and a delete leaves a tombstone
+    # stamped the same way; one query for both
+    deleted = Tombstone.objects.filter(user=user_id, kind=Tombstone.PRODUCT).order_by().values("user").annotate(v=Max("version")).values("v")
+    return Product.objects.filter(user=user_id).aggregate(n=Count("id"), version=Max("version"), last=Max("id"), deleted=Max(Subquery(deleted)))
+
+
+def _format_user_products(user_id, summary):
+    return f'"{user_id}.{summary["n"]}.{summary["version"] or 0}.{summary["last"] or 0}.{summary["deleted"] or 0}"'
+
+
+def _format_user_lists(user_id, summary):
+    return f'"{user_id}.{summary["n"]}.{summary["versions"] or 0}.{summary["last"] or 0}"'
+
+
+def _format_list(pk, version):
+    return None if version is None else f'"{pk}.{version}"'
+
+
+def _format_product(pk, row):
+    return None if row is None else f'"{pk}.{row[0]}.{row[1]}"'
+
+
+def _format_shared_list(row):
+    return None if row is None else f'"{row[0]}.{row[1]}"'
+
+
+def _cached_shared_list_row(payload):
+    return (payload["list"]["id"], payload["list"]["version"])
+
+
+def _user_lists_etag(request):
+    if not request.user.is_authenticated:
+        return None
+    return _format_user_lists(request.user.id, _user_lists_summary(request.user.id))
+
+
+def list_collection_etag(request, *args, **kwargs):
+    return _user_lists_etag(request)
+
+
+def product_collection_etag(request, *args, **kwargs):
+    if not request.user.is_authenticated:
+        return None
+    return _format_user_products(request.user.id, _user_products_summary(request.user.id))
+
+
+def list_etag(request, pk=None, **kwargs):
+    return _format_list(pk, List.objects.filter(id=pk).values_list("version", flat=True).first())
+
+
+def product_etag(request, pk=None, **kwargs):
+    return _format_product(pk, Product.objects.filter(id=pk).values_list("list_id", "list__version").first())
+
+
+def shared_list_etag(request, access_token=None, **kwargs):
+    # Runs before the view, so it finds the owner's shard for both
+    sharding.activate_token(access_token)
+    # Checked before the cache, whose payload outlives the token's expiry and
+    # SHARE_LEGACY_TOKENS being turned off
+    listFilter = share_tokens.list_filter(access_token)
+    if listFilter is None:
+        return None
+    payload = cache.peek_shared_list(access_token)
+    if payload is not None:
+        return _format_shared_list(_cached_shared_list_row(payload))
+    return _format_shared_list(List.objects.filter(**listFilter).values_list("id", "version").first())
+
+
+async def alist_collection_etag(user_id):
+    summary = await List.objects.filter(user=user_id).aaggregate(n=Count("id"), versions=Sum("version"), last=Max("id"))
+    return _format_user_lists(user_id, summary)
+
+
+async def alist_etag(pk):
+    return _format_list(pk, await List.objects.filter(id=pk).values_list("version", flat=True).afirst())
+
+
+async def aproduct_etag(pk):
+    return _format_product(pk, await Product.objects.filter(id=pk).values_list("list_id", "list__version").afirst())
+
+
+async def ashared_list_etag(access_token):
+    await sharding.aactivate_token(access_token)
+    listFilter = share_tokens.list_filter(access_token)
+    if listFilter is None:
+        return None
+    payload = await cache.apeek_shared_list(access_token)
+    if payload is not None:
+        return _format_shared_list(_cached_shared_list_row(payload))
+    return _format_shared_list(await List.objects.filter(**listFilter).values_list("id", "version").afirst())
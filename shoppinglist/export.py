@@ -0,0 +1,97 @@
+"""
+Streaming exports of all of a user's lists with their products, for
+ExportViewSet.
+
+Lists and products are read with two server-side cursors
+(``.iterator(chunk_size=...)``), the products ordered by list, and merged as
+they arrive. Only one list's products are held at a time, so memory does not
+grow with the size of the account, and the first list goes out before the
+rest has been read. (Behind PgBouncer, DB_PGBOUNCER turns server-side cursors
+off and psycopg2 then reads each query's rows in full.)
+
+Under ASGI the generators are wrapped in aiterate(): Django would otherwise
+read a sync iterator to the end before sending the first byte.
+"""
+import csv
+import json
+from io import StringIO
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from .models import List, Product
+from .serializers import ListReadSerializer, ProductReadSerializer
+from . import sharding
+
+
+def lists_with_products(user_id, chunk_size):
+    """
+    Yield (list row, [product rows]) for every list of the user, by list id.
+    """
+    # The response is streamed after the request's shard is gone
+    shard = sharding.shard_for_user(user_id)
+    lists = ListReadSerializer.values(List.objects.using(shard).filter(user=user_id).order_by("id"))
+    products = ProductReadSerializer.values(Product.objects.using(shard).filter(list__user=user_id).order_by("list", "id"))
+    products = products.iterator(chunk_size=chunk_size)
+    product = next(products, None)
+    for list in lists.iterator(chunk_size=chunk_size):
+        items = []
+        while product is not None and product["list"] <= list["id"]:
+            if product["list"] == list["id"]:
+                items.append(product)
+            product = next(products, None)
+        yield list, items
+
+
+def ndjson(user_id, chunk_size):
+    """
+    One JSON object per line: each list's fields, with its products under
+    "products".
+    """
+    for list, products in lists_with_products(user_id, chunk_size):
+        data = ListReadSerializer(list).data
+        data["products"] = ProductReadSerializer(products, many=True).data
+        yield json.dumps(data, cls=DjangoJSONEncoder) + "\n"
+
+
+def csv_rows(user_id, chunk_size):
+    """
+    A header, then one row per product with its list's fields in front. A
+    list without products gets one row with the product columns empty.
+    """
+    listFields = [name for name, _, _ in ListReadSerializer.get_fields()]
+    productFields = [name for name, _, _ in ProductReadSerializer.get_fields()]
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([f"list_{name}" for name in listFields] + [f"product_{name}" for name in productFields])
+    for list, products in lists_with_products(user_id, chunk_size):
+        listData = ListReadSerializer(list).data
+        listRow = [listData[name] for name in listFields]
+        for product in ProductReadSerializer(products, many=True).data or [None]:
+            writer.writerow(listRow + ([product[name] for name in productFields] if product else [""] * len(productFields)))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Only the header when there are no lists
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+async def aiterate(chunks):
+    """
+    Yield the chunks of the ``chunks`` generator, each read through
+    sync_to_async. Thread-sensitive, so every chunk is read on the thread,
+    and with the connection, that opened the cursors.
+    """
+    read = sync_to_async(next, thread_sensitive=True)
+    done = object()
+    try:
+        while (chunk := await read(chunks, done)) is not done:
+            yield chunk
+    finally:
+        await sync_to_async(chunks.close, thread_sensitive=True)()
+
+
+# ?format= value: (generator, content type)
+FORMATS = {
+    "ndjson": (ndjson, "application/x-ndjson"),
+    "csv": (csv_rows, "text/csv"),
+}
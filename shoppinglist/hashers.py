@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class TunablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2-SHA256 with the iteration count taken from
+    settings.PASSWORD_PBKDF2_ITERATIONS. Keeps Django's "pbkdf2_sha256"
+    algorithm name, so existing hashes still verify; a hash with a different
+    count is rehashed with the configured one on the user's next login.
+    """
+    @property
+    def iterations(self):
+        return settings.PASSWORD_PBKDF2_ITERATIONS
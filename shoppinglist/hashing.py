@@ -0,0 +1,118 @@
+"""
+Password hashing on a small dedicated thread pool, with admission control.
+
+Hashing a password takes hundreds of milliseconds of CPU by design. Signups
+(UserViewSet.create) and logins (backends.PooledModelBackend, behind
+/v1/token) hand it to a pool of settings.PASSWORD_HASHING_WORKERS threads;
+PBKDF2 runs in OpenSSL with the GIL released, so they hash in parallel with
+each other and with the rest of the process.
+
+At most settings.PASSWORD_HASHING_QUEUE hashes may be running or waiting at
+once, counted as slots in settings.PASSWORD_HASHING_CACHE. When that cache
+is shared, the limit holds across every process, which is what makes it bite
+with gunicorn, where each process has only a few requests in flight. Past it
+the caller gets HashingUnavailable, a 503 with Retry-After, right away,
+instead of a burst of logins tying up every worker. A slot lapses after
+settings.PASSWORD_HASHING_SLOT_TIMEOUT, should its process die holding it.
+
+The request's thread still waits for its hash, so run gunicorn with gthread
+workers, as gunicorn.conf.py does, or under ASGI: a sync worker would serve
+nothing else in the meantime.
+"""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from . import metrics
+
+
+class HashingUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Too many logins and signups in progress, try again shortly."
+    default_code = "hashing_unavailable"
+
+    def __init__(self, wait):
+        super().__init__()
+        # DRF's exception handler sends this as Retry-After
+        self.wait = wait
+
+
+KEY_PREFIX = "password-hashing-slot:"
+
+_pool = None
+_lock = threading.Lock()
+
+
+def _get_pool():
+    # Created on first use, so gunicorn forks its workers before any threads
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(settings.PASSWORD_HASHING_WORKERS, thread_name_prefix="password-hashing")
+    return _pool
+
+
+def _cache():
+    return caches[settings.PASSWORD_HASHING_CACHE]
+
+
+def _acquire():
+    """
+    Take a free slot and return its key, or None when all are taken.
+    """
+    size = settings.PASSWORD_HASHING_QUEUE
+    # From a random slot, so concurrent callers seldom race for the same keys
+    first = random.randrange(size)
+    for offset in range(size):
+        key = f"{KEY_PREFIX}{(first + offset) % size}"
+        if _cache().add(key, 1, settings.PASSWORD_HASHING_SLOT_TIMEOUT):
+            return key
+    return None
+
+
+def _run(operation, work):
+    pool = _get_pool()
+    slot = _acquire()
+    if slot is None:
+        metrics.PASSWORD_HASHING_REJECTED.labels(operation).inc()
+        raise HashingUnavailable(settings.PASSWORD_HASHING_RETRY_AFTER)
+    queued = time.perf_counter()
+
+    def timed():
+        started = time.perf_counter()
+        metrics.PASSWORD_HASHING_WAIT.labels(operation).observe(started - queued)
+        try:
+            return work()
+        finally:
+            metrics.PASSWORD_HASHING_DURATION.labels(operation).observe(time.perf_counter() - started)
+
+    try:
+        return pool.submit(timed).result()
+    finally:
+        _cache().delete(slot)
+
+
+def make_password(password):
+    """
+    Hash ``password`` with the preferred hasher, on the pool.
+    """
+    return _run("hash", lambda: hashers.make_password(password))
+
+
+def check_password(password, encoded):
+    """
+    Verify ``password`` against ``encoded`` on the pool. Return (valid, new
+    encoded password or None); the second item is set when the hash was made
+    with other hasher settings than the preferred ones, for the caller to save.
+    """
+    def work():
+        rehashed = []
+        valid = hashers.check_password(password, encoded, lambda raw: rehashed.append(hashers.make_password(raw)))
+        return valid, rehashed[0] if rehashed else None
+    return _run("check", work)
@@ -0,0 +1,111 @@
+"""
+Bulk import of lists with their products from NDJSON, for ImportViewSet and
+the import_lists management command.
+
+Each line is one list object with its products under "products", the format
+/v1/export writes (ids, owners, counters and versions in it are ignored).
+Lines are read one chunk at a time from the upload or file, so memory does
+not grow with its size. Each chunk is validated without queries, then
+inserted with bulk_create in one transaction stamped with one SyncClock
+value. An invalid line or product is left out and reported with its line
+number; the rest of the import goes ahead.
+"""
+import json
+from itertools import islice
+from django.conf import settings
+from .models import List, Product
+from .serializers import ImportListSerializer, ImportProductSerializer
+from .sync import next_version
+from . import sharding, suggestions
+
+
+class ImportReport:
+    """
+    Counts of the created rows and the first ``max_errors`` errors.
+    """
+    def __init__(self, max_errors):
+        self.max_errors = max_errors
+        self.lists = 0
+        self.products = 0
+        self.error_count = 0
+        self.errors = []
+
+    def error(self, line, errors, product=None):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            error = {"line": line, "errors": errors}
+            if product is not None:
+                error["product"] = product
+            self.errors.append(error)
+
+    def as_dict(self):
+        return {
+            "lists": self.lists,
+            "products": self.products,
+            "error_count": self.error_count,
+            "errors": self.errors,
+        }
+
+
+def import_lists(user_id, lines, chunk_size, max_errors):
+    """
+    Import the lists in ``lines``, an iterable of NDJSON lines as bytes or
+    str, for ``user_id``. Returns an ImportReport.
+    """
+    report = ImportReport(max_errors)
+    numbered = enumerate(lines, 1)
+    with sharding.for_user(user_id):
+        while True:
+            chunk = list(islice(numbered, chunk_size))
+            if not chunk:
+                return report
+            _import_chunk(user_id, _validate(chunk, report), report)
+
+
+def _validate(chunk, report):
+    # [(list fields, [product fields])] for the valid lines of the chunk
+    rows = []
+    for number, line in chunk:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            report.error(number, {"non_field_errors": ["Invalid JSON."]})
+            continue
+        listSerializer = ImportListSerializer(data=record)
+        if not listSerializer.is_valid():
+            report.error(number, listSerializer.errors)
+            continue
+        items = record.get("products") or []
+        if not isinstance(items, list):
+            report.error(number, {"products": ["Expected a list."]})
+            continue
+        products = []
+        for index, item in enumerate(items):
+            productSerializer = ImportProductSerializer(data=item)
+            if productSerializer.is_valid():
+                products.append(productSerializer.validated_data)
+            else:
+                report.error(number, productSerializer.errors, product=index)
+        rows.append((listSerializer.validated_data, products))
+    return rows
+
+
+def _import_chunk(user_id, rows, report):
+    if not rows:
+        return
+    with sharding.atomic():
+        version = next_version(user_id)
+        lists = List.objects.bulk_create([
+            List(user_id=user_id, version=version, total=len(products),
+                 checked=sum(1 for product in products if product.get("checked")), **fields)
+            for fields, products in rows
+        ], batch_size=settings.BULK_BATCH_SIZE)
+        products = Product.objects.bulk_create([
+            Product(user_id=user_id, list=list, version=version, **fields)
+            for list, (_, items) in zip(lists, rows) for fields in items
+        ], batch_size=settings.BULK_BATCH_SIZE)
+        suggestions.record(user_id, [product.name for product in products])
+    report.lists += len(lists)
+    report.products += len(products)
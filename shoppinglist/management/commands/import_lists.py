@@ -0,0 +1,35 @@
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from shoppinglist.importer import import_lists
+from shoppinglist.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        "Create lists with their products for a user from an NDJSON file in the format /v1/export writes, "
+        "one chunk of lines per transaction. Invalid lines and products are reported and skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="NDJSON file, or - for standard input.")
+        parser.add_argument("--user", required=True, help="Email of the user who will own the lists.")
+        parser.add_argument("--chunk-size", type=int, default=settings.IMPORT_CHUNK_SIZE, help="Lines per transaction.")
+
+    def handle(self, *args, **options):
+        userId = CustomUser.objects.filter(email=CustomUser.objects.normalize_email(options["user"])).values_list("id", flat=True).first()
+        if userId is None:
+            raise CommandError(f"No user with email {options['user']}.")
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be at least 1.")
+        if options["path"] == "-":
+            report = import_lists(userId, sys.stdin.buffer, options["chunk_size"], settings.IMPORT_MAX_ERRORS)
+        else:
+            with open(options["path"], "rb") as file:
+                report = import_lists(userId, file, options["chunk_size"], settings.IMPORT_MAX_ERRORS)
+        for error in report.errors:
+            product = f", product {error['product']}" if "product" in error else ""
+            self.stderr.write(f"Line {error['line']}{product}: {error['errors']}")
+        if report.error_count > len(report.errors):
+            self.stderr.write(f"{report.error_count - len(report.errors)} more errors not shown.")
+        self.stdout.write(f"Created {report.lists} lists and {report.products} products. Skipped {report.error_count} invalid rows.")
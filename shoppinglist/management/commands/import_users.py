@@ -0,0 +1,163 @@
+import csv
+import json
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from shoppinglist.models import CustomUser
+from shoppinglist.sharding import place_users
+
+# Optional columns copied onto the user as they are
+EXTRA_FIELDS = ("first_name", "last_name")
+
+
+def _init_worker():
+    # Needed where the pool spawns its processes instead of forking them
+    django.setup()
+
+
+# Stands in for an NDJSON line that is not a JSON object, so it is counted
+# and reported with the other invalid records
+InvalidRecord = namedtuple("InvalidRecord", "line error")
+
+
+def read_records(file, format):
+    """
+    Yield each record of a CSV file with a header row, or of a file with one
+    JSON object per line, as a dict, or as an InvalidRecord for a line that
+    is not a JSON object.
+    """
+    if format == "csv":
+        yield from csv.DictReader(file)
+        return
+    for number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield InvalidRecord(number, "invalid JSON")
+            continue
+        yield record if isinstance(record, dict) else InvalidRecord(number, "not a JSON object")
+
+
+def read_checkpoint(path):
+    try:
+        with open(path) as file:
+            return json.load(file)["records"]
+    except FileNotFoundError:
+        return 0
+
+
+def write_checkpoint(path, records):
+    # Written to a temporary file and renamed, so a crash never leaves half a checkpoint
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as file:
+        json.dump({"records": records}, file)
+    os.replace(temporary, path)
+
+
+class Command(BaseCommand):
+    help = (
+        "Create users from a CSV or NDJSON file with email and password fields, one chunk at a time. "
+        "Passwords are hashed in parallel across processes. Progress is saved to a checkpoint file after "
+        "every chunk, and a rerun after a failure resumes from it. Users whose email already exists are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV file with a header row, or NDJSON file.")
+        parser.add_argument("--format", choices=["csv", "ndjson"], help="Defaults to the file's extension.")
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Users per INSERT statement and transaction.")
+        parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                            help="Processes hashing passwords; 0 hashes in this process.")
+        parser.add_argument("--checkpoint", help="Progress file. Defaults to PATH.checkpoint.")
+        parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start from the first record.")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        format = options["format"] or ("csv" if path.lower().endswith(".csv") else "ndjson")
+        checkpoint = options["checkpoint"] or f"{path}.checkpoint"
+        chunkSize = options["chunk_size"]
+        if chunkSize < 1:
+            raise CommandError("--chunk-size must be at least 1.")
+        done = 0 if options["restart"] else read_checkpoint(checkpoint)
+        if done:
+            self.stdout.write(f"Resuming after record {done}.")
+
+        pool = None
+        if options["workers"] > 0:
+            pool = ProcessPoolExecutor(options["workers"], initializer=_init_worker)
+        created = skipped = invalid = 0
+        try:
+            with open(path, newline="", encoding="utf-8") as file:
+                records = read_records(file, format)
+                # Records before the checkpoint went in on an earlier run
+                for _ in islice(records, done):
+                    pass
+                while True:
+                    chunk = list(islice(records, chunkSize))
+                    if not chunk:
+                        break
+                    users, existing, errors = self.prepare(chunk, done)
+                    for message in errors:
+                        self.stderr.write(message)
+                    passwords = [password for _, password in users]
+                    if pool is None:
+                        hashes = [make_password(password) for password in passwords]
+                    else:
+                        hashes = list(pool.map(make_password, passwords, chunksize=max(1, len(passwords) // (options["workers"] * 4))))
+                    with transaction.atomic():
+                        inserted = self.insert([user for user, _ in users], hashes)
+                    done += len(chunk)
+                    write_checkpoint(checkpoint, done)
+                    created += inserted
+                    skipped += existing + len(users) - inserted
+                    invalid += len(errors)
+                    self.stdout.write(f"{done} records read, {created} users created.")
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        self.stdout.write(f"Created {created} users. Skipped {skipped} existing and {invalid} invalid records.")
+
+    def prepare(self, chunk, offset):
+        """
+        Return ([(user, password)] for the new users in ``chunk``, how many
+        records are for existing users or repeat an earlier email, [error
+        message for each invalid record]).
+        """
+        errors, candidates, repeated = [], {}, 0
+        for number, record in enumerate(chunk, offset + 1):
+            if isinstance(record, InvalidRecord):
+                errors.append(f"Record {number}: {record.error} on line {record.line}.")
+                continue
+            # Normalized like CustomUserManager.create_user
+            email = CustomUser.objects.normalize_email((record.get("email") or "").strip())
+            if not email:
+                errors.append(f"Record {number}: no email.")
+                continue
+            if email in candidates:
+                repeated += 1
+                continue
+            user = CustomUser(email=email, **{field: record[field] for field in EXTRA_FIELDS if record.get(field)})
+            # An empty password gets an unusable one, as in create_user
+            candidates[email] = (user, record.get("password") or None)
+        existing = set(CustomUser.objects.filter(email__in=list(candidates)).values_list("email", flat=True))
+        return [candidate for email, candidate in candidates.items() if email not in existing], len(existing) + repeated, errors
+
+    def insert(self, users, hashes):
+        """
+        Insert ``users`` with their hashed passwords and give each a shard and
+        SyncClock, which bulk_create skips along with the post_save signal.
+        Return how many were inserted.
+        """
+        for user, encoded in zip(users, hashes):
+            user.password = encoded
+        # A user who signed up since prepare() ran is left as they are
+        CustomUser.objects.bulk_create(users, ignore_conflicts=True)
+        return place_users(CustomUser.objects.filter(email__in=[user.email for user in users]))
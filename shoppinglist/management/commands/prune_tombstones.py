@@ -0,0 +1,37 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from shoppinglist.models import Tombstone
+
+# Kept past SYNC_TOMBSTONE_RETENTION for the deletions whose transactions
+# were still committing when a token that is just young enough was issued
+MARGIN = timedelta(hours=1)
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the tombstones of lists and products deleted longer ago than settings.SYNC_TOMBSTONE_RETENTION, "
+        "one chunk per statement. Sync tokens that old already get a 410. Run it daily."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=settings.BULK_BATCH_SIZE, help="Tombstones per DELETE statement.")
+
+    def handle(self, *args, **options):
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be at least 1.")
+        cutoff = timezone.now() - settings.SYNC_TOMBSTONE_RETENTION - MARGIN
+        deleted = 0
+        # Every shard's tombstones, see shoppinglist/sharding.py
+        for alias in settings.SHARDS:
+            tombstones = Tombstone.objects.using(alias)
+            lastId = 0
+            while True:
+                # Ids grow with deleted_at, so the old ones come first
+                ids = list(tombstones.filter(id__gt=lastId, deleted_at__lt=cutoff).order_by("id").values_list("id", flat=True)[:options["chunk_size"]])
+                if not ids:
+                    break
+                lastId = ids[-1]
+                deleted += tombstones.filter(id__in=ids).delete()[0]
+        self.stdout.write(f"Deleted {deleted} tombstones.")
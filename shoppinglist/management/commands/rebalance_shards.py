@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+from shoppinglist import sharding
+from shoppinglist.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        "Move users, with their lists, products, shares and sync state, between the shards in settings.SHARDS. "
+        "With --user, moves those users to --to; otherwise moves the newest users off the fullest shards until "
+        "every shard holds about as many users. A user's writes get a 503 while their rows are copied."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", action="append", default=[], help="Email of a user to move. Repeat for several.")
+        parser.add_argument("--to", help="Shard to move the --user users to.")
+        parser.add_argument("--batch-size", type=int, default=settings.BULK_BATCH_SIZE, help="Rows per INSERT statement.")
+        parser.add_argument("--dry-run", action="store_true", help="List the moves without making them.")
+
+    def handle(self, *args, **options):
+        if not sharding.is_sharded():
+            raise CommandError("There is only one shard; list more in settings.SHARDS.")
+        if not options["dry_run"] and isinstance(caches[settings.SHARD_MAP_CACHE], (LocMemCache, DummyCache)):
+            # The web workers would keep routing moved users to the old shard
+            raise CommandError("settings.SHARD_MAP_CACHE is not shared between processes; point it at a cache such as Redis.")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        if options["user"]:
+            if options["to"] not in settings.SHARDS:
+                raise CommandError(f"--to must be one of: {', '.join(settings.SHARDS)}.")
+            moves = []
+            for email in options["user"]:
+                userId = CustomUser.objects.filter(email=CustomUser.objects.normalize_email(email)).values_list("id", flat=True).first()
+                if userId is None:
+                    raise CommandError(f"No user with email {email}.")
+                moves.append((userId, options["to"]))
+        elif options["to"]:
+            raise CommandError("--to needs --user.")
+        else:
+            moves = sharding.plan_rebalance()
+        moved = 0
+        for userId, alias in moves:
+            if options["dry_run"]:
+                self.stdout.write(f"Would move user {userId} to {alias}.")
+                continue
+            copied = sharding.move_user(userId, alias, options["batch_size"])
+            if copied is None:
+                self.stdout.write(f"User {userId} is already on {alias}.")
+                continue
+            moved += 1
+            rows = ", ".join(f"{count} {name}" for name, count in copied.items())
+            self.stdout.write(f"Moved user {userId} to {alias}: {rows}.")
+        if not options["dry_run"]:
+            self.stdout.write(f"Moved {moved} users.")
@@ -0,0 +1,98 @@
+from collections import defaultdict
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from shoppinglist import sharding
+from shoppinglist.changes import ListChanges
+from shoppinglist.models import List, Product
+
+
+def _product_count(**filters):
+    products = (
+        Product.objects.filter(list=OuterRef("pk"), **filters)
+        .order_by()
+        .values("list")
+        .annotate(n=Count("pk"))
+        .values("n")
+    )
+    return Coalesce(Subquery(products, output_field=IntegerField()), Value(0))
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute List.total and List.checked from the products table, one chunk of lists at a time. "
+        "Fixed lists get a new version from their owner's clock, so ETags and sync clients see the change, "
+        "and their cached share payloads are dropped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Lists per UPDATE statement.")
+        parser.add_argument("--dry-run", action="store_true", help="Report drifted lists without fixing them.")
+
+    def handle(self, *args, **options):
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be at least 1.")
+        scanned = drifted = 0
+        # Every shard's lists, see shoppinglist/sharding.py
+        for alias in settings.SHARDS:
+            shardScanned, shardDrifted = self.recount(alias, options["chunk_size"], options["dry_run"])
+            scanned += shardScanned
+            drifted += shardDrifted
+        action = "Found" if options["dry_run"] else "Fixed"
+        self.stdout.write(f"Scanned {scanned} lists. {action} {drifted} with drifted counters.")
+
+    def recount(self, alias, chunk_size, dry_run):
+        lists = List.objects.using(alias)
+        lastId = 0
+        scanned = drifted = 0
+        while True:
+            ids = list(lists.filter(id__gt=lastId).order_by("id").values_list("id", flat=True)[:chunk_size])
+            if not ids:
+                break
+            lastId = ids[-1]
+            scanned += len(ids)
+            stale = list(
+                lists.filter(id__gte=ids[0], id__lte=lastId)
+                .annotate(real_total=_product_count(), real_checked=_product_count(checked=True))
+                .filter(~Q(total=F("real_total")) | ~Q(checked=F("real_checked")))
+                .values_list("id", "user")
+            )
+            if dry_run:
+                drifted += len(stale)
+                continue
+            byOwner = defaultdict(list)
+            for listId, owner in stale:
+                byOwner[owner].append(listId)
+            for owner, listIds in sorted(byOwner.items()):
+                drifted += self.repair(alias, owner, listIds)
+        return scanned, drifted
+
+    def repair(self, alias, owner, list_ids):
+        """
+        Recount ``list_ids`` of ``owner`` on ``alias`` and stamp them with a
+        new version of the owner's clock. Return how many were fixed.
+        """
+        with sharding.for_user(owner):
+            if sharding.current()[0] != alias:
+                # Left behind by a move, which deletes them
+                return 0
+            try:
+                with sharding.atomic():
+                    changes = ListChanges()
+                    # The owner's clock first, then the lists, in the order
+                    # product writes lock them
+                    changes.version_for(owner)
+                    lists = List.objects.filter(id__in=list_ids)
+                    # Wait for in-flight product writes on these lists, so the
+                    # UPDATE below counts rows they committed
+                    list(lists.select_for_update().values_list("id", flat=True))
+                    lists.update(total=_product_count(), checked=_product_count(checked=True))
+                    for listId in list_ids:
+                        changes.touch(listId)
+                    changes.apply()
+            except sharding.ShardMoving:
+                self.stderr.write(f"Skipped the lists of user {owner}, who is being moved.")
+                return 0
+        return len(list_ids)
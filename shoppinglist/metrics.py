@@ -0,0 +1,100 @@
+"""
+Prometheus metrics for the API, exposed at /metrics by metrics_view.
+
+Request metrics are labelled with the handler, "<ViewSet>.<action>" for the
+viewsets (the async read views report under the viewset they stand in for).
+They are recorded by middleware.RequestTimingMiddleware.
+
+Under gunicorn every worker is a separate process. gunicorn.conf.py sets
+PROMETHEUS_MULTIPROC_DIR, so each process writes its samples to files in that
+directory and metrics_view merges all of them on every scrape.
+
+metrics_view answers only the addresses in settings.METRICS_ALLOWED_IPS and
+clients with settings.METRICS_TOKEN as their bearer token; the handler names
+and request counts are not for the public.
+"""
+import hmac
+import os
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import REGISTRY, CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+REQUEST_DURATION = Histogram(
+    "grocery_request_duration_seconds", "Wall time of a request.",
+    ["handler", "method"], buckets=LATENCY_BUCKETS
+)
+REQUESTS = Counter(
+    "grocery_requests_total", "Finished requests by status class.",
+    ["handler", "method", "status"]
+)
+REQUEST_QUERIES = Histogram(
+    "grocery_request_db_queries", "Database queries run by a request.",
+    ["handler"], buckets=QUERY_BUCKETS
+)
+REQUEST_DB_DURATION = Histogram(
+    "grocery_request_db_duration_seconds", "Time a request spent in database queries.",
+    ["handler"], buckets=LATENCY_BUCKETS
+)
+REQUEST_SERIALIZE_DURATION = Histogram(
+    "grocery_request_serialize_duration_seconds", "Time a request spent in serializers.",
+    ["handler"], buckets=LATENCY_BUCKETS
+)
+AUTHENTICATION_DURATION = Histogram(
+    "grocery_jwt_authentication_duration_seconds", "Time spent authenticating a JWT.",
+    ["outcome"], buckets=LATENCY_BUCKETS
+)
+PASSWORD_HASHING_DURATION = Histogram(
+    "grocery_password_hashing_duration_seconds", "Time spent hashing or verifying a password.",
+    ["operation"], buckets=LATENCY_BUCKETS
+)
+PASSWORD_HASHING_WAIT = Histogram(
+    "grocery_password_hashing_wait_seconds", "Time a password waited for a hashing thread.",
+    ["operation"], buckets=LATENCY_BUCKETS
+)
+PASSWORD_HASHING_REJECTED = Counter(
+    "grocery_password_hashing_rejected_total", "Passwords turned away with a 503 because the hashing pool was full.",
+    ["operation"]
+)
+SHARED_LIST_CACHE = Counter(
+    "grocery_shared_list_cache_requests_total", "Shared-list cache lookups.",
+    ["outcome"]
+)
+
+
+def handler_name(view_func, method):
+    cls = getattr(view_func, "cls", None)
+    if cls is None:
+        return getattr(view_func, "__name__", "unknown")
+    actions = getattr(view_func, "actions", None) or {}
+    return f"{cls.__name__}.{actions.get(method.lower(), method.lower())}"
+
+
+def observe_request(view_func, method, status_code, duration, timings):
+    handler = "unmatched" if view_func is None else handler_name(view_func, method)
+    REQUEST_DURATION.labels(handler, method).observe(duration)
+    REQUESTS.labels(handler, method, f"{status_code // 100}xx").inc()
+    REQUEST_QUERIES.labels(handler).observe(timings.queries)
+    REQUEST_DB_DURATION.labels(handler).observe(timings.db)
+    REQUEST_SERIALIZE_DURATION.labels(handler).observe(timings.serialize)
+
+
+def _allowed(request):
+    if request.META.get("REMOTE_ADDR") in settings.METRICS_ALLOWED_IPS:
+        return True
+    token = settings.METRICS_TOKEN
+    return bool(token) and hmac.compare_digest(request.headers.get("Authorization", "").encode(), f"Bearer {token}".encode())
+
+
+def metrics_view(request):
+    if not _allowed(request):
+        return HttpResponseForbidden()
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
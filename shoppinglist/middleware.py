@@ -0,0 +1,142 @@
+import logging
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from . import budgets, metrics, routers, sharding, timing
+
+logger = logging.getLogger(__name__)
+
+
+class RequestTimingMiddleware:
+    """
+    Measures each request's wall time, database queries and their time,
+    serializer time and response size. Adds them to the response as a
+    Server-Timing header when settings.SERVER_TIMING is on, to the
+    per-URL-name histograms in timing.py and to the Prometheus metrics. With
+    settings.QUERY_BUDGETS_DEBUG on it also logs the requests that go over
+    their query budget in budgets.py, with their SQL.
+
+    Goes first in MIDDLEWARE so the wall time covers the other middleware.
+    Works under WSGI and ASGI. The queries are counted by timing.record_query,
+    which signals.py installs on every database connection, so those run from
+    sync_to_async threads count too.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings, token = timing.start(settings.QUERY_BUDGETS_DEBUG)
+        try:
+            response = self.get_response(request)
+        finally:
+            timing.stop(token)
+        return self._finish(request, response, timings)
+
+    async def __acall__(self, request):
+        timings, token = timing.start(settings.QUERY_BUDGETS_DEBUG)
+        try:
+            response = await self.get_response(request)
+        finally:
+            timing.stop(token)
+        return self._finish(request, response, timings)
+
+    def _finish(self, request, response, timings):
+        total = timings.elapsed()
+        size = None if response.streaming else len(response.content)
+        match = getattr(request, "resolver_match", None)
+        timing.observe(match.url_name if match else None, total, timings, size)
+        metrics.observe_request(match.func if match else None, request.method, response.status_code, total, timings)
+        if timings.statements is not None and match:
+            budgets.report(match.url_name, request.method, timings.statements)
+        if settings.SERVER_TIMING:
+            serverTiming = [
+                f"total;dur={total * 1000:.1f}",
+                f'db;dur={timings.db * 1000:.1f};desc="{timings.queries} queries"',
+                f"serialize;dur={timings.serialize * 1000:.1f}",
+            ]
+            if size is not None:
+                serverTiming.append(f'size;desc="{size} bytes"')
+            response["Server-Timing"] = ", ".join(serverTiming)
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Lets routers.ReplicaRouter send the reads of GET, HEAD and OPTIONS
+    requests to a read replica, unless the client wrote within the last
+    settings.REPLICA_PIN_SECONDS, and pins clients whose requests wrote to the
+    primary for that long. Works under WSGI and ASGI.
+
+    Sends everything to the primary, with a warning at startup, while
+    settings.REPLICA_PIN_CACHE is local to the process, since a client could
+    then write through one worker and read a lagging replica through another.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        if settings.DATABASE_REPLICAS and not routers.enabled():
+            logger.warning("Not reading from %s: REPLICA_PIN_CACHE %r is local to the process.", ", ".join(settings.DATABASE_REPLICAS), settings.REPLICA_PIN_CACHE)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        safe = request.method in routers.SAFE_METHODS
+        enabled = routers.enabled()
+        token = routers.begin(safe and enabled and not routers.is_pinned(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            if routers.end(token) and enabled:
+                routers.pin(request)
+        return response
+
+    async def __acall__(self, request):
+        safe = request.method in routers.SAFE_METHODS
+        enabled = routers.enabled()
+        token = routers.begin(safe and enabled and not await routers.ais_pinned(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            if routers.end(token) and enabled:
+                await routers.apin(request)
+        return response
+
+
+class ShardMiddleware:
+    """
+    Scopes the shard that authentication activates to the request, see
+    sharding.py. Works under WSGI and ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = sharding.begin()
+        try:
+            return self.get_response(request)
+        finally:
+            sharding.end(token)
+
+    async def __acall__(self, request):
+        token = sharding.begin()
+        try:
+            return await self.get_response(request)
+        finally:
+            sharding.end(token)
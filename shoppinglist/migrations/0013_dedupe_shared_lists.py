@@ -0,0 +1,30 @@
+# Generated by Django 4.2.4 on 2026-10-18 17:29
+
+from django.db import migrations
+from django.db.models import Count, Min
+import secrets
+
+
+def drop_duplicate_shares(apps, schema_editor):
+    # Keep the oldest share of each list and re-mint any clashing tokens, so the
+    # unique constraints of the next migration can be created on existing data
+    SharedList = apps.get_model('shoppinglist', 'SharedList')
+    oldest = SharedList.objects.values('list').annotate(first=Min('id')).values('first')
+    SharedList.objects.exclude(id__in=oldest).delete()
+    clashes = SharedList.objects.values('access_token').annotate(n=Count('id')).filter(n__gt=1)
+    for clash in clashes:
+        shares = SharedList.objects.filter(access_token=clash['access_token']).order_by('id')[1:]
+        for share in shares:
+            share.access_token = secrets.token_hex(16)
+            share.save(update_fields=['access_token'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoppinglist', '0012_sharedlist_list_name'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_shares, migrations.RunPython.noop),
+    ]
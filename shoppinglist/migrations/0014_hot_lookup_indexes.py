@@ -0,0 +1,42 @@
+# Generated by Django 4.2.4 on 2026-10-18 17:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoppinglist', '0013_dedupe_shared_lists'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='list',
+            index=models.Index(fields=['user', 'complete'], name='list_user_complete_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['list', 'checked'], name='product_list_checked_idx'),
+        ),
+        migrations.AlterField(
+            model_name='list',
+            name='user',
+            field=models.ForeignKey(db_index=False, default='', on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='list',
+            field=models.ForeignKey(db_index=False, default='', on_delete=django.db.models.deletion.CASCADE, related_name='products', to='shoppinglist.list'),
+        ),
+        migrations.AlterField(
+            model_name='sharedlist',
+            name='access_token',
+            field=models.CharField(default='', max_length=255, unique=True),
+        ),
+        migrations.AddConstraint(
+            model_name='sharedlist',
+            constraint=models.UniqueConstraint(fields=('list',), name='sharedlist_unique_list'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.4 on 2026-10-18 17:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoppinglist', '0014_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='list',
+            name='version',
+            field=models.PositiveBigIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 4.2.4 on 2026-10-18 17:34
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Max
+
+
+def create_sync_clocks(apps, schema_editor):
+    # Start each clock past the list versions handed out before this migration,
+    # so no list can get a version (and ETag) that it already had
+    CustomUser = apps.get_model('shoppinglist', 'CustomUser')
+    SyncClock = apps.get_model('shoppinglist', 'SyncClock')
+    users = CustomUser.objects.annotate(last=Max('list__version')).values_list('id', 'last')
+    SyncClock.objects.bulk_create(
+        [SyncClock(user_id=user_id, value=last or 0) for user_id, last in users.iterator()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoppinglist', '0015_list_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncClock',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='sync_clock', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('value', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('list', 'List'), ('product', 'Product')], max_length=16)),
+                ('object_id', models.BigIntegerField()),
+                ('version', models.PositiveBigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='list',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='list',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='list',
+            index=models.Index(fields=['user', 'version'], name='list_user_version_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['user', 'version'], name='product_user_version_idx'),
+        ),
+        migrations.AddField(
+            model_name='tombstone',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['user', 'version'], name='tombstone_user_version_idx'),
+        ),
+        migrations.RunPython(create_sync_clocks, migrations.RunPython.noop),
+    ]
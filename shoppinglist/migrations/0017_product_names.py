@@ -0,0 +1,70 @@
+# Generated by Django 4.2.4 on 2026-10-18 18:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Max
+from django.utils import timezone
+
+
+def count_existing_names(apps, schema_editor):
+    # One user's names in memory at a time; the rows come grouped by user
+    Product = apps.get_model('shoppinglist', 'Product')
+    ProductName = apps.get_model('shoppinglist', 'ProductName')
+    rows = (
+        Product.objects.order_by('user_id').values_list('user_id', 'name')
+        .annotate(n=Count('id'), last=Max('updated_at'))
+    )
+    current, names = None, {}
+
+    def flush():
+        ProductName.objects.bulk_create([
+            ProductName(user_id=current, key=key, name=name, count=count, last_used=last)
+            for key, (name, count, last) in names.items()
+        ], batch_size=1000)
+
+    for user_id, name, n, last in rows.iterator(chunk_size=2000):
+        if user_id != current:
+            flush()
+            current, names = user_id, {}
+        # As suggestions.normalize() does
+        spelling = ' '.join(name.split())
+        key, spelling = spelling.lower()[:255], spelling[:255]
+        if not key:
+            continue
+        last = last or timezone.now()
+        if key in names:
+            _, count, previous = names[key]
+            names[key] = (spelling if last >= previous else names[key][0], count + n, max(last, previous))
+        else:
+            names[key] = (spelling, n, last)
+    flush()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoppinglist', '0016_delta_sync'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductName',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255)),
+                ('name', models.CharField(max_length=255)),
+                ('count', models.PositiveBigIntegerField(default=0)),
+                ('last_used', models.DateTimeField()),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'key'], name='productname_user_prefix_idx', opclasses=['int8_ops', 'varchar_pattern_ops'])],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='productname',
+            constraint=models.UniqueConstraint(fields=('user', 'key'), name='productname_user_key_uniq'),
+        ),
+        migrations.RunPython(count_existing_names, migrations.RunPython.noop),
+    ]
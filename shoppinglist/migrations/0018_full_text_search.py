@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    # A tsvector column with a GIN index on PostgreSQL, FTS5 tables on SQLite
+    from shoppinglist import search
+    search.create_index(schema_editor)
+
+
+def drop_search_index(apps, schema_editor):
+    from shoppinglist import search
+    search.drop_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoppinglist', '0017_product_names'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
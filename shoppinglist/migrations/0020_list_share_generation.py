@@ -0,0 +1,26 @@
+# Generated by Django 4.2.4 on 2026-10-18 18:35
+
+from django.db import migrations, models
+
+
+def restore_search_index(apps, schema_editor):
+    # SQLite rebuilds the list table to add the column, dropping the
+    # full-text search triggers on it
+    from shoppinglist import search
+    search.restore_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoppinglist', '0019_user_shard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='list',
+            name='share_generation',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(restore_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+from django.contrib.postgres.operations import BtreeGinExtension
+from django.db import migrations
+
+
+def index_search_by_user(apps, schema_editor):
+    # A GIN index on (user_id, search) instead of search alone, on PostgreSQL
+    from shoppinglist import search
+    search.index_by_user(schema_editor)
+
+
+def unindex_search_by_user(apps, schema_editor):
+    from shoppinglist import search
+    search.unindex_by_user(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoppinglist', '0020_list_share_generation'),
+    ]
+
+    operations = [
+        # Lets GIN index user_id, a bigint; does nothing on SQLite
+        BtreeGinExtension(),
+        migrations.RunPython(index_search_by_user, unindex_search_by_user),
+    ]
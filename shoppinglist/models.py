@@ -17,25 +17,117 @@ class CustomUser(AbstractUser):
         return self.email
     
 class List(models.Model):
-    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, default="")    
+    # Indexed through list_user_complete_idx, which leads with user
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, default="", db_index=False)
     name = models.CharField(max_length=255, default="")
     color = models.CharField(max_length=255, default="")
     total = models.PositiveBigIntegerField(default=0)
     checked = models.PositiveBigIntegerField(default=0)
     description = models.CharField(max_length=255, default="", blank=True)
     complete = models.BooleanField(default = False)
-    
+    # The owner's SyncClock value at the last change to the list or any of its
+    # products; used for ETags and delta sync
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Stamped into signed share tokens; bumped when a share is deleted, which
+    # revokes every token minted before
+    share_generation = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "complete"], name="list_user_complete_idx"),
+            models.Index(fields=["user", "version"], name="list_user_version_idx"),
+        ]
+
 class Product(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, default="")
-    list = models.ForeignKey(List, on_delete=models.CASCADE, related_name='products', default="")
+    # Indexed through product_list_checked_idx, which leads with list
+    list = models.ForeignKey(List, on_delete=models.CASCADE, related_name='products', default="", db_index=False)
     name = models.CharField(max_length=255, default="")
     note = models.CharField(max_length=255, default="", blank=True)
     quantity = models.PositiveBigIntegerField(default=0)
     checked = models.BooleanField(default = False)
+    # The owner's SyncClock value at the last change to the product
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["list", "checked"], name="product_list_checked_idx"),
+            models.Index(fields=["user", "version"], name="product_user_version_idx"),
+        ]
 
 class SharedList(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, default="")    
     list = models.ForeignKey(List, on_delete=models.CASCADE, related_name='shared_list', default="")
     list_name = models.CharField(max_length=255, default="")
-    access_token = models.CharField(max_length=255, default="")
-    
+    access_token = models.CharField(max_length=255, default="", unique=True)
+
+    class Meta:
+        constraints = [
+            # A list is shared at most once; ShareDataViewSet.create relies on this
+            models.UniqueConstraint(fields=["list"], name="sharedlist_unique_list"),
+        ]
+
+class SyncClock(models.Model):
+    """
+    Per-user change counter. Every write transaction takes the next value and
+    stamps it on the rows it touches. The row stays locked until commit, so a
+    user's versions become visible in order and a sync token never skips one.
+    """
+    user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, primary_key=True, related_name='sync_clock')
+    value = models.PositiveBigIntegerField(default=0)
+
+class Tombstone(models.Model):
+    """
+    Records a deleted list or product so delta sync can report it.
+    """
+    LIST = "list"
+    PRODUCT = "product"
+    KIND_CHOICES = [(LIST, "List"), (PRODUCT, "Product")]
+
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, db_index=False)
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    version = models.PositiveBigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "version"], name="tombstone_user_version_idx"),
+        ]
+
+class ProductName(models.Model):
+    """
+    How often a user has added a product of each name, for autocomplete. Kept
+    up to date by suggestions.record() as products are created, so
+    suggestions never scan the products table.
+    """
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, db_index=False)
+    # The name lowercased with its whitespace collapsed; what prefixes match
+    key = models.CharField(max_length=255)
+    # The spelling the user typed last
+    name = models.CharField(max_length=255)
+    count = models.PositiveBigIntegerField(default=0)
+    last_used = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "key"], name="productname_user_key_uniq"),
+        ]
+        indexes = [
+            # Lets PostgreSQL serve key LIKE 'prefix%' from the index whatever
+            # the database collation; other backends ignore the opclasses
+            models.Index(fields=["user", "key"], name="productname_user_prefix_idx", opclasses=["int8_ops", "varchar_pattern_ops"]),
+        ]
+
+class UserShard(models.Model):
+    """
+    Which database in settings.SHARDS holds a user's lists, products and the
+    rest of their rows; see sharding.py. Kept on the default database only.
+    Users without a row live on the first shard.
+    """
+    user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, primary_key=True, related_name='shard')
+    shard = models.CharField(max_length=64)
+    # Set while rebalance_shards copies the user's rows; their writes are refused
+    moving = models.BooleanField(default=False)
@@ -0,0 +1,21 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    Keyset pagination on the primary key. The cursor is opaque to clients and
+    every page is a single indexed range scan, no matter how deep it is.
+    """
+    ordering = "id"
+    page_size = settings.PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = settings.MAX_PAGE_SIZE
+
+    def paginate(self, queryset, request, serializer_class, view=None):
+        """
+        Paginate ``queryset`` and return the response for the requested page.
+        """
+        page = self.paginate_queryset(queryset, request, view=view)
+        serializer = serializer_class(page, many=True)
+        return self.get_paginated_response(serializer.data)
@@ -0,0 +1,139 @@
+"""
+Push channel for shared-list changes.
+
+Writers publish events for a list after their transaction commits, and every
+viewer of that list holds one subscription, served as Server-Sent Events by
+views.shared_list_events. The broker is chosen by settings.REALTIME_BROKER:
+InMemoryBroker needs no outside services but only reaches viewers connected
+to the same process. A broker backed by Redis pub/sub or similar only has to
+implement publish(), subscribe() and unsubscribe() below.
+"""
+import asyncio
+import threading
+from collections import defaultdict
+from django.conf import settings
+from django.utils.module_loading import import_string
+from . import sharding
+
+
+def channel_for(list_id):
+    return f"list:{list_id}"
+
+
+class Broker:
+    def publish(self, channel, event):
+        """
+        Deliver ``event`` (a JSON-serializable dict) to every subscriber of
+        ``channel``. Called from request threads, so it must not block.
+        """
+        raise NotImplementedError
+
+    def subscribe(self, channel):
+        """
+        Return a Subscription for ``channel``. Called from the event loop
+        that will read it.
+        """
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        """
+        Stop delivering to ``subscription``, from Subscription.close() when
+        its viewer disconnects. Called from any thread.
+        """
+        raise NotImplementedError
+
+
+class Subscription:
+    """
+    One viewer's queue of events. ``get()`` is awaited on the subscriber's
+    event loop, ``push()`` may be called from any thread. ``maxsize`` is 0
+    for no limit, or at least 2, room for an event and the overflow marker.
+    """
+    # Sent in place of the events a slow subscriber could not keep up with;
+    # the client should reload the list and reconnect
+    OVERFLOW = {"type": "overflow"}
+
+    def __init__(self, broker, channel, loop, maxsize):
+        if maxsize < 0 or maxsize == 1:
+            raise ValueError(f"Subscription maxsize must be 0 or at least 2, not {maxsize}")
+        self.broker = broker
+        self.channel = channel
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def push(self, event):
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # The subscriber's loop is gone
+            self.close()
+
+    def _put(self, event):
+        if self.overflowed:
+            return
+        if self.queue.maxsize and self.queue.qsize() >= self.queue.maxsize - 1:
+            self.overflowed = True
+            event = self.OVERFLOW
+        self.queue.put_nowait(event)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InMemoryBroker(Broker):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.push(event)
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel, asyncio.get_running_loop(), settings.REALTIME_QUEUE_SIZE)
+        with self._lock:
+            self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.channel]
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.REALTIME_BROKER)()
+    return _broker
+
+
+def publish_on_commit(events):
+    """
+    Publish ``(list_id, event)`` pairs once the current transaction commits,
+    so viewers never see a change that was rolled back.
+    """
+    if not events:
+        return
+    events = list(events)
+
+    def publish():
+        broker = get_broker()
+        for list_id, event in events:
+            broker.publish(channel_for(list_id), event)
+    sharding.on_commit(publish)
@@ -0,0 +1,181 @@
+"""
+Sends the reads of GET, HEAD and OPTIONS requests to the read replicas in
+settings.DATABASE_REPLICAS and everything else to "default", the primary.
+
+ReplicaRoutingMiddleware marks each safe request as allowed to read from a
+replica; queries made outside a request, by management commands, migrations
+and the streamed parts of a response, go to the primary. Within a request,
+reads switch to the primary for good once anything is written, and while a
+transaction is open on the primary, so a request always sees its own writes.
+
+Replicas lag behind the primary, so a client that has just written is pinned
+to the primary for settings.REPLICA_PIN_SECONDS: the middleware records the
+write in the settings.REPLICA_PIN_CACHE cache under the user id of the
+client's access token, so the pin holds across a token refresh, or under its
+address when it sent no valid token. The pins only hold if every process
+shares that cache, so with a process-local one (LocMemCache, DummyCache) the
+replicas are left unused and every query goes to the primary.
+
+ShardRouter, ahead of ReplicaRouter, sends the queries on a user's rows to
+the user's shard when there is more than one; see sharding.py. Shards have no
+replicas of their own, so only the directory's tables are read from
+DATABASE_REPLICAS then.
+"""
+import contextvars
+import random
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+from . import sharding
+from .models import CustomUser
+
+KEY_PREFIX = "primary-pin:"
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class _State:
+    def __init__(self, replica):
+        # One replica for the whole request, so its reads agree with each other
+        self.replica = replica
+        self.wrote = False
+
+
+_state = contextvars.ContextVar("replica_routing", default=None)
+_primary = contextvars.ContextVar("replica_routing_primary", default=False)
+
+
+def begin(use_replica):
+    """
+    Start routing the current request's queries, to a replica if
+    ``use_replica`` and there is one. Returns the token for end().
+    """
+    replicas = settings.DATABASE_REPLICAS
+    return _state.set(_State(random.choice(replicas) if use_replica and replicas else None))
+
+
+def end(token):
+    """
+    Stop routing the current request's queries. Returns whether it wrote.
+    """
+    state = _state.get()
+    _state.reset(token)
+    return state is not None and state.wrote
+
+
+@contextmanager
+def use_primary():
+    """
+    Read from the primary inside the block, e.g. to fill a cache that writers
+    invalidate, where a lagging replica would put the old rows back.
+    """
+    token = _primary.set(True)
+    try:
+        yield
+    finally:
+        _primary.reset(token)
+
+
+def _cache():
+    return caches[settings.REPLICA_PIN_CACHE]
+
+
+def enabled():
+    """
+    Whether safe requests may read from a replica: there is one, and the pin
+    cache is shared by every process.
+    """
+    return bool(settings.DATABASE_REPLICAS) and not isinstance(_cache(), (LocMemCache, DummyCache))
+
+
+def _user_id(request):
+    # Runs ahead of authentication, so checks the token itself
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    if header is None:
+        return None
+    try:
+        rawToken = authentication.get_raw_token(header)
+        if rawToken is None:
+            return None
+        return authentication.get_validated_token(rawToken).get(api_settings.USER_ID_CLAIM)
+    except AuthenticationFailed:
+        return None
+
+
+def pin_key(request):
+    userId = _user_id(request)
+    if userId is not None:
+        return KEY_PREFIX + "user:" + str(userId)
+    return KEY_PREFIX + "address:" + request.META.get("REMOTE_ADDR", "")
+
+
+def is_pinned(request):
+    return _cache().get(pin_key(request)) is not None
+
+
+def pin(request):
+    _cache().set(pin_key(request), 1, settings.REPLICA_PIN_SECONDS)
+
+
+async def ais_pinned(request):
+    return await _cache().aget(pin_key(request)) is not None
+
+
+async def apin(request):
+    await _cache().aset(pin_key(request), 1, settings.REPLICA_PIN_SECONDS)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.replica is None or state.wrote or _primary.get():
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ShardRouter:
+    def _shard(self, model, hints):
+        # (shard, whether its user is being moved), or None to leave the model
+        # to ReplicaRouter
+        if not sharding.is_sharded() or model not in sharding.SHARDED:
+            return None
+        instance = hints.get("instance")
+        userId = instance.pk if isinstance(instance, CustomUser) else getattr(instance, "user_id", None)
+        if userId is not None:
+            return sharding.lookup(userId)
+        return sharding.current()
+
+    def db_for_read(self, model, **hints):
+        shard = self._shard(model, hints)
+        return None if shard is None else shard[0]
+
+    def db_for_write(self, model, **hints):
+        shard = self._shard(model, hints)
+        if shard is None:
+            return None
+        alias, moving = shard
+        if moving:
+            raise sharding.ShardMoving(settings.SHARD_MOVE_RETRY_AFTER)
+        return alias
@@ -0,0 +1,212 @@
+"""
+Full-text search over the names and descriptions of a user's lists and the
+names and notes of their products, for SearchViewSet.
+
+On PostgreSQL, migration 0018 adds a tsvector column, ``search``, to both
+tables, filled in by a trigger whenever a row is inserted or its text
+changes, with names weighted above descriptions and notes. (A trigger rather
+than a generated column, which would block later migrations from changing the
+text columns' types.) Migration 0021 indexes it with a btree_gin index on
+(user_id, search), so a search only reads the searching user's entries and
+costs the same however many other users there are. Queries go through
+websearch_to_tsquery, so any user input is valid, and are ranked with
+ts_rank.
+
+On SQLite, used for local and test runs, the same migration adds external
+content FTS5 tables kept in step by triggers, ranked with bm25. Django rebuilds
+a SQLite table, dropping its triggers, when a later migration alters it; run
+rebuild_index() again after such a migration. FTS5 cannot index by user: MATCH
+reads every user's entries for the words and user_id is filtered afterwards,
+so search there slows down as the whole table grows.
+
+Ranks come from each table's own word statistics, so lists and products are
+merged on scores that are comparable only roughly. The models know nothing of
+either; search() returns (kind, id, rank) tuples and the caller loads the
+rows.
+"""
+import re
+from django.db import connections, router
+from .models import List, Product
+
+LIST = "list"
+PRODUCT = "product"
+
+# Text search configuration for PostgreSQL; stems "eggs" to "egg"
+CONFIG = "english"
+
+# (model, columns with the weight of each)
+_TABLES = {
+    LIST: (List, [("name", "A"), ("description", "B")]),
+    PRODUCT: (Product, [("name", "A"), ("note", "B")]),
+}
+
+
+def _connection():
+    return connections[router.db_for_read(List)]
+
+
+def _fts_table(model):
+    return f"{model._meta.db_table}_fts"
+
+
+def create_index(schema_editor):
+    """
+    Add the search columns or tables for the connection's database. Called by
+    migration 0018.
+    """
+    connection = schema_editor.connection
+    quote = connection.ops.quote_name
+    for model, columns in _TABLES.values():
+        table = quote(model._meta.db_table)
+        if connection.vendor == "postgresql":
+            function = quote(f"{model._meta.db_table}_search")
+            names = ", ".join(quote(column) for column, _ in columns)
+            schema_editor.execute(f"ALTER TABLE {table} ADD COLUMN search tsvector")
+            schema_editor.execute(
+                f"CREATE FUNCTION {function}() RETURNS trigger LANGUAGE plpgsql AS $$ "
+                f"BEGIN NEW.search := {_tsvector(quote, columns, 'NEW.')}; RETURN NEW; END $$"
+            )
+            schema_editor.execute(
+                f"CREATE TRIGGER {function} BEFORE INSERT OR UPDATE OF {names} ON {table} "
+                f"FOR EACH ROW EXECUTE PROCEDURE {function}()"
+            )
+            schema_editor.execute(f"UPDATE {table} SET search = {_tsvector(quote, columns)}")
+            schema_editor.execute(f"CREATE INDEX {quote(model._meta.db_table + '_search_idx')} ON {table} USING GIN (search)")
+        elif connection.vendor == "sqlite":
+            names = ", ".join(column for column, _ in columns)
+            fts = _fts_table(model)
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE {fts} USING fts5({names}, content={table}, content_rowid=id, tokenize='porter unicode61')"
+            )
+            _create_triggers(schema_editor, model, columns)
+            schema_editor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def _tsvector(quote, columns, prefix=""):
+    return " || ".join(
+        f"setweight(to_tsvector('{CONFIG}', coalesce({prefix}{quote(column)}, '')), '{weight}')"
+        for column, weight in columns
+    )
+
+
+def _create_triggers(schema_editor, model, columns):
+    table = model._meta.db_table
+    fts = _fts_table(model)
+    names = ", ".join(column for column, _ in columns)
+    new = ", ".join(f"new.{column}" for column, _ in columns)
+    old = ", ".join(f"old.{column}" for column, _ in columns)
+    insert = f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new});"
+    delete = f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old});"
+    schema_editor.execute(f"CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN {insert} END")
+    schema_editor.execute(f"CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN {delete} END")
+    schema_editor.execute(f"CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {names} ON {table} BEGIN {delete} {insert} END")
+
+
+def index_by_user(schema_editor):
+    """
+    PostgreSQL only: replace the GIN index on ``search`` with one on
+    (user_id, search). Needs the btree_gin extension. Called by migration 0021.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql":
+        return
+    quote = connection.ops.quote_name
+    for model, _ in _TABLES.values():
+        table = model._meta.db_table
+        schema_editor.execute(f"DROP INDEX IF EXISTS {quote(table + '_search_idx')}")
+        schema_editor.execute(f"CREATE INDEX {quote(table + '_user_search_idx')} ON {quote(table)} USING GIN (user_id, search)")
+
+
+def unindex_by_user(schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql":
+        return
+    quote = connection.ops.quote_name
+    for model, _ in _TABLES.values():
+        table = model._meta.db_table
+        schema_editor.execute(f"DROP INDEX IF EXISTS {quote(table + '_user_search_idx')}")
+        schema_editor.execute(f"CREATE INDEX {quote(table + '_search_idx')} ON {quote(table)} USING GIN (search)")
+
+
+def drop_index(schema_editor):
+    connection = schema_editor.connection
+    quote = connection.ops.quote_name
+    for model, _ in _TABLES.values():
+        if connection.vendor == "postgresql":
+            schema_editor.execute(f"ALTER TABLE {quote(model._meta.db_table)} DROP COLUMN search")
+            schema_editor.execute(f"DROP FUNCTION {quote(model._meta.db_table + '_search')}() CASCADE")
+        elif connection.vendor == "sqlite":
+            fts = _fts_table(model)
+            for event in ("insert", "delete", "update"):
+                schema_editor.execute(f"DROP TRIGGER IF EXISTS {fts}_{event}")
+            schema_editor.execute(f"DROP TABLE {fts}")
+
+
+def rebuild_index(using=None):
+    """
+    SQLite only: recreate the triggers and reindex every row, on the
+    ``using`` database or else the current shard.
+    """
+    connection = connections[using or router.db_for_write(List)]
+    with connection.schema_editor() as schema_editor:
+        restore_index(schema_editor)
+
+
+def restore_index(schema_editor):
+    """
+    The body of rebuild_index(), for the migrations that make SQLite rebuild
+    a searched table. Does nothing on PostgreSQL, whose triggers survive.
+    """
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for model, columns in _TABLES.values():
+        _create_triggers(schema_editor, model, columns)
+        fts = _fts_table(model)
+        schema_editor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def _fts5_query(text):
+    # Every word must match; each is quoted so FTS5 operators in the input
+    # are taken as text
+    words = re.findall(r"\w+", text)
+    return " ".join(f'"{word}"' for word in words)
+
+
+def search(user_id, text, offset, limit):
+    """
+    Return up to ``limit`` (kind, id, rank) tuples for the user's lists and
+    products matching ``text``, best first, skipping the first ``offset``.
+    """
+    connection = _connection()
+    quote = connection.ops.quote_name
+    lists, products = (quote(model._meta.db_table) for model, _ in _TABLES.values())
+    if connection.vendor == "postgresql":
+        sql = (
+            f"SELECT %s, id, ts_rank(search, query) AS rank FROM {lists}, websearch_to_tsquery('{CONFIG}', %s) query "
+            f"WHERE user_id = %s AND search @@ query "
+            f"UNION ALL "
+            f"SELECT %s, id, ts_rank(search, query) FROM {products}, websearch_to_tsquery('{CONFIG}', %s) query "
+            f"WHERE user_id = %s AND search @@ query "
+            f"ORDER BY rank DESC, 1, 2 LIMIT %s OFFSET %s"
+        )
+        params = [LIST, text, user_id, PRODUCT, text, user_id, limit, offset]
+    elif connection.vendor == "sqlite":
+        query = _fts5_query(text)
+        if not query:
+            return []
+        listFts, productFts = (_fts_table(model) for model, _ in _TABLES.values())
+        # bm25 is lower for better matches; the weights favour names
+        sql = (
+            f"SELECT %s, t.id, -bm25({listFts}, 10.0, 1.0) AS rank FROM {listFts} JOIN {lists} t ON t.id = {listFts}.rowid "
+            f"WHERE {listFts} MATCH %s AND t.user_id = %s "
+            f"UNION ALL "
+            f"SELECT %s, t.id, -bm25({productFts}, 10.0, 1.0) FROM {productFts} JOIN {products} t ON t.id = {productFts}.rowid "
+            f"WHERE {productFts} MATCH %s AND t.user_id = %s "
+            f"ORDER BY rank DESC, 1, 2 LIMIT %s OFFSET %s"
+        )
+        params = [LIST, query, user_id, PRODUCT, query, user_id, limit, offset]
+    else:
+        raise NotImplementedError(f"Full-text search is not available on {connection.vendor}.")
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
@@ -1,22 +1,159 @@
+from django.core.exceptions import ImproperlyConfigured
 from rest_framework import serializers
+from rest_framework.relations import PrimaryKeyRelatedField
 from .models import Product, List, CustomUser, SharedList
+from . import timing
 
-class ProductSerializer(serializers.ModelSerializer):
+class TimedListSerializer(serializers.ListSerializer):
+    @property
+    def data(self):
+        with timing.serializing():
+            return super().data
+
+class TimedModelSerializer(serializers.ModelSerializer):
+    """
+    ModelSerializer whose ``.data`` counts as serializer time in the request's
+    Server-Timing header. Subclasses set ``list_serializer_class =
+    TimedListSerializer`` in Meta so ``many=True`` is counted too.
+    """
+    @property
+    def data(self):
+        with timing.serializing():
+            return super().data
+
+class ProductSerializer(TimedModelSerializer):
     class Meta:
         model = Product
         fields = '__all__'
+        read_only_fields = ['version']
+        list_serializer_class = TimedListSerializer
+
+class BulkProductSerializer(TimedModelSerializer):
+    """
+    Product serializer for the bulk endpoints. The list id is checked against
+    the ids preloaded in context["list_ids"], so validating a batch does not
+    run one query per item.
+    """
+    list = serializers.IntegerField(source="list_id")
+
+    class Meta:
+        model = Product
+        exclude = ["user"]
+        read_only_fields = ["version"]
+        list_serializer_class = TimedListSerializer
+
+    def validate_list(self, value):
+        if value not in self.context["list_ids"]:
+            raise serializers.ValidationError(f'Invalid pk "{value}" - object does not exist.')
+        return value
 
-class ListSerializer(serializers.ModelSerializer):
+class ImportProductSerializer(TimedModelSerializer):
+    """
+    The product fields accepted by importer.py. The owner, list and version
+    are set by the importer, so validation runs no queries.
+    """
+    # Out-of-range values are rejected here rather than by the database, which
+    # would fail the whole chunk
+    quantity = serializers.IntegerField(min_value=0, max_value=2**63 - 1, required=False)
+
+    class Meta:
+        model = Product
+        fields = ["name", "note", "quantity", "checked"]
+        list_serializer_class = TimedListSerializer
+
+class ImportListSerializer(TimedModelSerializer):
+    """
+    The list fields accepted by importer.py; the counters come from the
+    imported products.
+    """
     class Meta:
         model = List
-        fields = '__all__'
+        fields = ["name", "color", "description", "complete"]
+        list_serializer_class = TimedListSerializer
 
-class CustomUserSerializer(serializers.ModelSerializer):
+class ListSerializer(TimedModelSerializer):
+    class Meta:
+        model = List
+        # share_generation only revokes share tokens, see share_tokens.py
+        exclude = ['share_generation']
+        # Maintained by the server whenever products change, see changes.py
+        read_only_fields = ['total', 'checked', 'version']
+        list_serializer_class = TimedListSerializer
+
+    def update(self, instance, validated_data):
+        # Only write the submitted columns so a concurrent counter update is
+        # not overwritten with the values read before it
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        instance.save(update_fields=list(validated_data))
+        return instance
+
+class ValuesSerializer:
+    """
+    Read-only counterpart of ``serializer_class`` that renders the dicts of
+    ``queryset.values()`` instead of model instances:
+
+        rows = ProductReadSerializer.values(Product.objects.filter(list=list_id))
+        ProductReadSerializer(rows, many=True).data
+
+    The output is the same as ``serializer_class``'s. Fields whose DRF
+    representation of a database value is the value itself (integers, strings,
+    booleans, primary keys) are copied as they are; only the rest, such as
+    datetimes, go through the DRF field. This skips building a model instance
+    and the per-field dispatch of ModelSerializer for every row.
+    """
+    serializer_class = None
+    _plain_fields = (serializers.IntegerField, serializers.CharField, serializers.BooleanField, PrimaryKeyRelatedField)
+
+    def __init__(self, instance, many=False):
+        self.instance = instance
+        self.many = many
+
+    @classmethod
+    def get_fields(cls):
+        # (output name, values() key, converter or None), built once per class
+        if "_fields" not in cls.__dict__:
+            fields = []
+            for field in cls.serializer_class()._readable_fields:
+                if "." in field.source or field.source == "*":
+                    raise ImproperlyConfigured(f"{cls.__name__} cannot read the {field.field_name} field from values()")
+                convert = None if isinstance(field, cls._plain_fields) else field.to_representation
+                fields.append((field.field_name, field.source, convert))
+            cls._fields = fields
+        return cls._fields
+
+    @classmethod
+    def values(cls, queryset):
+        return queryset.values(*[source for _, source, _ in cls.get_fields()])
+
+    def to_representation(self, row):
+        data = {}
+        for name, source, convert in self.get_fields():
+            value = row[source]
+            data[name] = value if convert is None or value is None else convert(value)
+        return data
+
+    @property
+    def data(self):
+        with timing.serializing():
+            if self.many:
+                return [self.to_representation(row) for row in self.instance]
+            return self.to_representation(self.instance)
+
+class ProductReadSerializer(ValuesSerializer):
+    serializer_class = ProductSerializer
+
+class ListReadSerializer(ValuesSerializer):
+    serializer_class = ListSerializer
+
+class CustomUserSerializer(TimedModelSerializer):
     class Meta:
         model = CustomUser
         fields = '__all__'
+        list_serializer_class = TimedListSerializer
 
-class SharedListSerializer(serializers.ModelSerializer):
+class SharedListSerializer(TimedModelSerializer):
     class Meta:
         model = SharedList
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+        list_serializer_class = TimedListSerializer
\ No newline at end of file
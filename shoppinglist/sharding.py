@@ -0,0 +1,424 @@
+"""
+Horizontal sharding of a user's rows by user id.
+
+settings.SHARDS names the databases that hold lists, products, shares,
+tombstones, product names and sync clocks. Users themselves, and UserShard,
+the map from user to shard, stay on DIRECTORY, the default database. A new
+user is placed on SHARDS[id % len(SHARDS)] and gets a copy of their
+CustomUser row there for the foreign keys to point at; only its id matters.
+Users without a UserShard row, those from before sharding, live on
+SHARDS[0].
+
+StatelessJWTAuthentication activates the shard of the request's user, and
+activate_token() that of a shared list's owner, read from a signed token or,
+for an old one, found by asking each shard once per token. routers.ShardRouter
+then sends the queries on the sharded models there. Code outside a request
+uses for_user(), and opens its transactions with atomic() and on_commit() so
+they are on the shard.
+
+Rows keep their ids when move_user() copies them to another shard, so each
+shard hands out ids from its own range of 2**ID_BITS, set up by reserve_ids()
+whenever the shard is migrated. A shard's range follows from its position in
+SHARDS: add new shards at the end.
+
+The map is cached in settings.SHARD_MAP_CACHE, which must be shared by every
+process for a move to take effect everywhere at once. While a user is moved,
+writes to their rows get ShardMoving, a 503 with Retry-After. The cache only
+saves reads: every write transaction locks the user's SyncClock row and then
+checks the directory itself, see check_placement().
+
+With a single shard, the default, nothing here runs a query.
+"""
+import contextvars
+from collections import defaultdict
+from contextlib import contextmanager
+from itertools import islice
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from .models import CustomUser, List, Product, ProductName, SharedList, SyncClock, Tombstone, UserShard
+from . import share_tokens
+
+DIRECTORY = DEFAULT_DB_ALIAS
+
+ID_BITS = 40
+
+KEY_PREFIX = "user-shard:"
+TOKEN_KEY_PREFIX = "share-owner:"
+
+# The models whose rows live on their user's shard, parents first, with the
+# filter that selects one user's rows
+SHARDED = {
+    SyncClock: "user",
+    List: "user",
+    Product: "list__user",
+    SharedList: "list__user",
+    Tombstone: "user",
+    ProductName: "user",
+}
+
+
+class ShardMoving(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "This account is being moved, try again shortly."
+    default_code = "shard_moving"
+
+    def __init__(self, wait):
+        super().__init__()
+        # DRF's exception handler sends this as Retry-After
+        self.wait = wait
+
+
+class _State:
+    def __init__(self):
+        self.user_id = None
+        self.shard = None
+        self.moving = False
+
+
+_state = contextvars.ContextVar("shard", default=None)
+
+
+def is_sharded():
+    return len(settings.SHARDS) > 1
+
+
+def _cache():
+    return caches[settings.SHARD_MAP_CACHE]
+
+
+def begin():
+    """
+    Start tracking the shard of the current request. Returns the token for end().
+    """
+    return _state.set(_State())
+
+
+def end(token):
+    _state.reset(token)
+
+
+def _load(user_id):
+    entry = UserShard.objects.using(DIRECTORY).filter(user=user_id).values_list("shard", "moving").first()
+    return tuple(entry or (settings.SHARDS[0], False))
+
+
+def lookup(user_id):
+    """
+    Return (shard, whether the user is being moved).
+    """
+    if not is_sharded():
+        return settings.SHARDS[0], False
+    key = KEY_PREFIX + str(user_id)
+    entry = _cache().get(key)
+    if entry is None:
+        entry = _load(user_id)
+        # add(), not set(): _set_shard() may have cached a newer entry since
+        # the row was read
+        _cache().add(key, entry, settings.SHARD_MAP_TIMEOUT)
+    return tuple(entry)
+
+
+async def alookup(user_id):
+    if not is_sharded():
+        return settings.SHARDS[0], False
+    key = KEY_PREFIX + str(user_id)
+    entry = await _cache().aget(key)
+    if entry is None:
+        entry = await UserShard.objects.using(DIRECTORY).filter(user=user_id).values_list("shard", "moving").afirst()
+        entry = tuple(entry or (settings.SHARDS[0], False))
+        await _cache().aadd(key, entry, settings.SHARD_MAP_TIMEOUT)
+    return tuple(entry)
+
+
+def shard_for_user(user_id):
+    return lookup(user_id)[0]
+
+
+def activate(user_id):
+    """
+    Route the rest of the current request to the user's shard.
+    """
+    state = _state.get()
+    if state is not None and state.user_id != user_id:
+        state.shard, state.moving = lookup(user_id)
+        state.user_id = user_id
+
+
+async def aactivate(user_id):
+    state = _state.get()
+    if state is not None and state.user_id != user_id:
+        state.shard, state.moving = await alookup(user_id)
+        state.user_id = user_id
+
+
+def current():
+    """
+    Return (shard, whether its user is being moved) for the current request,
+    the first shard when no user is active.
+    """
+    state = _state.get()
+    if state is None or state.shard is None:
+        return settings.SHARDS[0], False
+    return state.shard, state.moving
+
+
+@contextmanager
+def for_user(user_id):
+    """
+    Route the queries inside the block to the user's shard.
+    """
+    token = begin()
+    try:
+        activate(user_id)
+        yield
+    finally:
+        end(token)
+
+
+def atomic():
+    return transaction.atomic(using=current()[0])
+
+
+def check_placement(user_id, alias):
+    """
+    Raise ShardMoving unless the directory has the user on ``alias`` and not
+    being moved. Call it holding the lock on the user's SyncClock row on
+    ``alias``: move_user() takes that lock before it copies the rows, so the
+    answer then holds until the transaction commits.
+    """
+    if not is_sharded():
+        return
+    entry = _load(user_id)
+    if entry != (alias, False):
+        # The request routed on a stale map entry
+        _cache().set(KEY_PREFIX + str(user_id), entry, settings.SHARD_MAP_TIMEOUT)
+        raise ShardMoving(settings.SHARD_MOVE_RETRY_AFTER)
+
+
+def lock_user(user_id):
+    """
+    Lock the user's SyncClock row and check_placement(), for the write
+    transactions that do not advance the clock with sync.next_version().
+    """
+    if not is_sharded():
+        return
+    alias = current()[0]
+    list(SyncClock.objects.using(alias).select_for_update().filter(user=user_id).values_list("user", flat=True))
+    check_placement(user_id, alias)
+
+
+def on_commit(func):
+    transaction.on_commit(func, using=current()[0])
+
+
+def owner_of_token(access_token):
+    """
+    Return the id of the user who shared ``access_token``, or None if no
+    shard has it. Always None with a single shard, where it is not needed.
+    """
+    if not is_sharded():
+        return None
+    if share_tokens.is_signed(access_token):
+        token = share_tokens.parse(access_token)
+        return None if token is None else token.owner_id
+    key = TOKEN_KEY_PREFIX + access_token
+    userId = _cache().get(key)
+    if userId is None:
+        for alias in settings.SHARDS:
+            userId = SharedList.objects.using(alias).filter(access_token=access_token).values_list("user", flat=True).first()
+            if userId is not None:
+                # The owner, not the shard, so a move does not make it stale
+                _cache().set(key, userId, settings.SHARD_MAP_TIMEOUT)
+                break
+    return userId
+
+
+async def aowner_of_token(access_token):
+    if not is_sharded():
+        return None
+    if share_tokens.is_signed(access_token):
+        token = share_tokens.parse(access_token)
+        return None if token is None else token.owner_id
+    key = TOKEN_KEY_PREFIX + access_token
+    userId = await _cache().aget(key)
+    if userId is None:
+        for alias in settings.SHARDS:
+            userId = await SharedList.objects.using(alias).filter(access_token=access_token).values_list("user", flat=True).afirst()
+            if userId is not None:
+                await _cache().aset(key, userId, settings.SHARD_MAP_TIMEOUT)
+                break
+    return userId
+
+
+def activate_token(access_token):
+    """
+    Route the rest of the current request to the shard of the shared list's owner.
+    """
+    userId = owner_of_token(access_token)
+    if userId is not None:
+        activate(userId)
+
+
+async def aactivate_token(access_token):
+    userId = await aowner_of_token(access_token)
+    if userId is not None:
+        await aactivate(userId)
+
+
+def place_users(users):
+    """
+    Give every user in the ``users`` queryset of the directory that has no
+    shard yet one, with their CustomUser copy and SyncClock on it. For
+    bulk-created users, whom the post_save signal misses. Returns how many
+    were placed.
+    """
+    if not is_sharded():
+        userIds = list(users.filter(sync_clock__isnull=True).values_list("id", flat=True))
+        SyncClock.objects.bulk_create([SyncClock(user_id=userId) for userId in userIds])
+        return len(userIds)
+    newUsers = list(users.using(DIRECTORY).filter(shard__isnull=True))
+    byShard = defaultdict(list)
+    for user in newUsers:
+        byShard[settings.SHARDS[user.pk % len(settings.SHARDS)]].append(user)
+    for alias, shardUsers in byShard.items():
+        with transaction.atomic(using=alias):
+            if alias != DIRECTORY:
+                CustomUser.objects.using(alias).bulk_create(shardUsers, ignore_conflicts=True)
+            SyncClock.objects.using(alias).bulk_create([SyncClock(user_id=user.pk) for user in shardUsers], ignore_conflicts=True)
+    UserShard.objects.using(DIRECTORY).bulk_create(
+        [UserShard(user_id=user.pk, shard=alias) for alias, shardUsers in byShard.items() for user in shardUsers],
+        ignore_conflicts=True,
+    )
+    return len(newUsers)
+
+
+def forget_user(user_id):
+    """
+    Delete the user's rows from their shard, for a user being deleted from
+    the directory, whose cascade only reaches the directory's own tables.
+    """
+    if not is_sharded():
+        return
+    alias = shard_for_user(user_id)
+    if alias != DIRECTORY:
+        CustomUser.objects.using(alias).filter(pk=user_id).delete()
+    _cache().delete(KEY_PREFIX + str(user_id))
+
+
+def reserve_ids(alias):
+    """
+    Move the id sequences of the sharded tables on ``alias`` to the start of
+    its range, unless they are past it. Run after every migrate of a shard.
+    """
+    index = settings.SHARDS.index(alias)
+    if index == 0:
+        return
+    start = index << ID_BITS
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        for model in SHARDED:
+            if not model._meta.pk.auto_created:
+                continue
+            table = model._meta.db_table
+            if connection.vendor == "postgresql":
+                cursor.execute(
+                    f"SELECT setval(pg_get_serial_sequence(%s, 'id'), GREATEST(%s, (SELECT COALESCE(MAX(id), 0) FROM {connection.ops.quote_name(table)})))",
+                    [table, start],
+                )
+            elif connection.vendor == "sqlite":
+                cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, %s) WHERE name = %s", [start, table])
+                cursor.execute(
+                    "INSERT INTO sqlite_sequence (name, seq) SELECT %s, %s WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)",
+                    [table, start, table],
+                )
+
+
+def _set_shard(user_id, alias, moving):
+    UserShard.objects.using(DIRECTORY).update_or_create(user_id=user_id, defaults={"shard": alias, "moving": moving})
+    # Written rather than deleted, so a lookup() that read the old row cannot
+    # put it back
+    _cache().set(KEY_PREFIX + str(user_id), (alias, moving), settings.SHARD_MAP_TIMEOUT)
+
+
+def move_user(user_id, alias, batch_size):
+    """
+    Copy the user's rows to the ``alias`` shard, point the map at it and
+    delete them from the old one. Returns {model name: rows copied}, or None
+    if the user is already there.
+
+    The user's writes get ShardMoving from the moment the map marks the move.
+    The copy waits, on the user's SyncClock row, for the write transactions
+    already under way. Those that take the lock after the move began, with a
+    map entry looked up before it, fail check_placement() and roll back, and
+    once the rows are deleted their clock is gone with them, so no write
+    lands on the old shard.
+    """
+    source = UserShard.objects.using(DIRECTORY).filter(user=user_id).values_list("shard", flat=True).first() or settings.SHARDS[0]
+    if source == alias:
+        return None
+    _set_shard(user_id, source, moving=True)
+    try:
+        with transaction.atomic(using=source):
+            list(SyncClock.objects.using(source).select_for_update().filter(user=user_id).values_list("user", flat=True))
+            copied = _copy_rows(user_id, source, alias, batch_size)
+    except BaseException:
+        _set_shard(user_id, source, moving=False)
+        raise
+    _set_shard(user_id, alias, moving=False)
+    _delete_rows(user_id, source)
+    return copied
+
+
+def _copy_rows(user_id, source, alias, batch_size):
+    copied = {}
+    with transaction.atomic(using=alias):
+        if alias != DIRECTORY and not CustomUser.objects.using(alias).filter(pk=user_id).exists():
+            CustomUser.objects.using(alias).bulk_create([CustomUser.objects.using(DIRECTORY).get(pk=user_id)])
+        for model, owner in SHARDED.items():
+            # Rows written before an earlier move failed halfway are replaced
+            model.objects.using(alias).filter(**{owner: user_id}).delete()
+            rows = model.objects.using(source).filter(**{owner: user_id}).order_by("pk").iterator(chunk_size=batch_size)
+            copied[model.__name__] = 0
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                model.objects.using(alias).bulk_create(batch)
+                copied[model.__name__] += len(batch)
+    return copied
+
+
+def _delete_rows(user_id, source):
+    with transaction.atomic(using=source):
+        # Children before their parents
+        for model, owner in reversed(SHARDED.items()):
+            model.objects.using(source).filter(**{owner: user_id}).delete()
+        # The user's copy goes too, unless products of theirs remain on others' lists
+        if source != DIRECTORY and not Product.objects.using(source).filter(user=user_id).exists():
+            CustomUser.objects.using(source).filter(pk=user_id).delete()
+
+
+def plan_rebalance():
+    """
+    Return [(user id, shard)]: the moves, newest users first, that leave
+    every shard within one user of the others.
+    """
+    assigned = dict(UserShard.objects.using(DIRECTORY).values_list("user", "shard"))
+    users = {alias: [] for alias in settings.SHARDS}
+    for userId in CustomUser.objects.using(DIRECTORY).order_by("id").values_list("id", flat=True).iterator():
+        alias = assigned.get(userId, settings.SHARDS[0])
+        if alias in users:
+            users[alias].append(userId)
+    moves = []
+    while True:
+        fullest = max(users, key=lambda alias: len(users[alias]))
+        emptiest = min(users, key=lambda alias: len(users[alias]))
+        if len(users[fullest]) - len(users[emptiest]) <= 1:
+            break
+        userId = users[fullest].pop()
+        users[emptiest].append(userId)
+        moves.append((userId, emptiest))
+    return moves
@@ -0,0 +1,77 @@
+"""
+Signed share tokens. ShareDataViewSet.create mints
+
+    s1.<list id>.<owner id>.<generation>.<expiry>.<signature>
+
+where the signature is an HMAC-SHA256 of the rest under SECRET_KEY (or one of
+SECRET_KEY_FALLBACKS), the generation is the list's share_generation when the
+share was made and the expiry a Unix time, or 0 for none. The shared-list
+endpoints check a token in memory, so a forged, mangled or expired one is a
+404 without a query, and then read the list by primary key. Deleting a share
+bumps List.share_generation, which revokes the tokens minted before. The
+owner id lets sharding.py find the owner's shard without asking every shard.
+
+Tokens from before, random hex strings, are still looked up through
+SharedList while settings.SHARE_LEGACY_TOKENS is on.
+"""
+import base64
+import time
+from collections import namedtuple
+from django.conf import settings
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+PREFIX = "s1."
+
+_SALT = "shoppinglist.share_tokens"
+
+ShareToken = namedtuple("ShareToken", ["list_id", "owner_id", "generation", "expires"])
+
+
+def _signature(payload, secret):
+    digest = salted_hmac(_SALT, payload, secret=secret, algorithm="sha256").digest()
+    # 128 bits are plenty for a MAC and keep the URLs short
+    return base64.urlsafe_b64encode(digest[:16]).rstrip(b"=").decode()
+
+
+def mint(list_id, owner_id, generation, lifetime=None):
+    """
+    Return a token for the share of ``list_id``, valid for ``lifetime``
+    seconds or until the share is deleted.
+    """
+    expires = int(time.time()) + lifetime if lifetime else 0
+    payload = f"{PREFIX}{list_id}.{owner_id}.{generation}.{expires}"
+    return f"{payload}.{_signature(payload, settings.SECRET_KEY)}"
+
+
+def is_signed(access_token):
+    return access_token.startswith(PREFIX)
+
+
+def parse(access_token):
+    """
+    Return the ShareToken of a signed token, or None if it is not one, its
+    signature does not match or it has expired.
+    """
+    payload, _, signature = access_token.rpartition(".")
+    fields = payload[len(PREFIX):].split(".") if is_signed(payload) else []
+    if len(fields) != 4 or not all(field.isdigit() for field in fields):
+        return None
+    if not any(constant_time_compare(signature, _signature(payload, secret)) for secret in [settings.SECRET_KEY, *settings.SECRET_KEY_FALLBACKS]):
+        return None
+    token = ShareToken(*map(int, fields))
+    if token.expires and token.expires <= time.time():
+        return None
+    return token
+
+
+def list_filter(access_token):
+    """
+    Return the List.objects.filter() arguments that select the list shared
+    with ``access_token``, or None if the token can match no list.
+    """
+    if not is_signed(access_token):
+        return {"shared_list__access_token": access_token} if settings.SHARE_LEGACY_TOKENS else None
+    token = parse(access_token)
+    if token is None:
+        return None
+    return {"id": token.list_id, "share_generation": token.generation}
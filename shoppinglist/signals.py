@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete
+from django.dispatch import receiver
+from . import sharding, timing
+from .authentication import user_snapshots
+from .models import CustomUser, SyncClock
+
+
+@receiver(post_save, sender=CustomUser)
+def create_sync_clock(sender, instance, created, raw=False, using=None, **kwargs):
+    # ListChanges reads the owner's clock inside its UPDATEs, so every user
+    # needs one. The copies of users on the other shards are not new users.
+    if not created or raw or using != sharding.DIRECTORY:
+        return
+    if sharding.is_sharded():
+        sharding.place_users(CustomUser.objects.filter(pk=instance.pk))
+    else:
+        SyncClock.objects.get_or_create(user=instance)
+
+
+@receiver(pre_delete, sender=CustomUser)
+def delete_sharded_rows(sender, instance, using=None, **kwargs):
+    if using == sharding.DIRECTORY:
+        sharding.forget_user(instance.pk)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def forget_user_snapshot(sender, instance, **kwargs):
+    # StatelessJWTAuthentication reloads is_active on the user's next request
+    user_snapshots.discard(instance.pk)
+
+
+@receiver(post_migrate)
+def reserve_shard_ids(sender, using=None, **kwargs):
+    if sender.name == "shoppinglist" and using in settings.SHARDS:
+        sharding.reserve_ids(using)
+
+
+@receiver(connection_created)
+def count_queries(sender, connection, **kwargs):
+    # Every thread has its own connections, so a wrapper added per request
+    # would miss the queries run from sync_to_async threads under ASGI
+    if timing.record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(timing.record_query)
@@ -0,0 +1,59 @@
+"""
+Product name autocomplete. ProductName holds one row per user and distinct
+name with how often it was used; record() bumps the counts as products are
+created and suggest() answers prefix queries from the (user, key) index.
+"""
+from collections import Counter
+from django.db import connections, router
+from django.utils import timezone
+from .models import ProductName
+
+
+def normalize(name):
+    # The key of a name: lowercased, with runs of whitespace made one space
+    return " ".join(name.split()).lower()[:255]
+
+
+def record(user_id, names):
+    """
+    Count one use of each of ``names`` for the user, with one upsert. Run it
+    in the transaction that creates the products.
+    """
+    counts, spellings = Counter(), {}
+    for name in names:
+        key = normalize(name)
+        if key:
+            counts[key] += 1
+            spellings[key] = " ".join(name.split())[:255]
+    if not counts:
+        return
+    connection = connections[router.db_for_write(ProductName)]
+    quote = connection.ops.quote_name
+    table = quote(ProductName._meta.db_table)
+    columns = ", ".join(quote(column) for column in ("user_id", "key", "name", "count", "last_used"))
+    rows = ", ".join(["(%s, %s, %s, %s, %s)"] * len(counts))
+    params = []
+    now = timezone.now()
+    # In key order, so concurrent upserts of overlapping names lock their
+    # rows in the same order and cannot deadlock
+    for key in sorted(counts):
+        params += [user_id, key, spellings[key], counts[key], now]
+    # Django's bulk_create(update_conflicts=True) can only overwrite the count,
+    # so the increment is written out; PostgreSQL and SQLite share this syntax
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} ({columns}) VALUES {rows} "
+            f"ON CONFLICT (user_id, {quote('key')}) DO UPDATE SET "
+            f"{quote('count')} = {table}.{quote('count')} + EXCLUDED.{quote('count')}, "
+            f"name = EXCLUDED.name, last_used = EXCLUDED.last_used",
+            params,
+        )
+
+
+def suggest(user_id, prefix, limit):
+    """
+    Return the user's ``limit`` most used names starting with ``prefix``, as
+    {"name", "count"} dicts.
+    """
+    names = ProductName.objects.filter(user=user_id, key__startswith=normalize(prefix))
+    return list(names.order_by("-count", "-last_used").values("name", "count")[:limit])
@@ -0,0 +1,114 @@
+import base64
+import binascii
+from collections import namedtuple
+from operator import itemgetter
+from django.db import connections, router
+from django.db.models import Q
+from .models import SyncClock
+from . import sharding
+
+TOKEN_PREFIX = "v2:"
+# Tokens that only held a version
+_UNDATED_PREFIX = "v1:"
+
+
+def next_version(user_id):
+    """
+    Advance the user's SyncClock and return the new value. The clock row stays
+    locked until the surrounding transaction commits.
+    """
+    alias = router.db_for_write(SyncClock)
+    connection = connections[alias]
+    table = connection.ops.quote_name(SyncClock._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f"UPDATE {table} SET value = value + 1 WHERE user_id = %s RETURNING value", [user_id])
+        row = cursor.fetchone()
+    # Under the clock's lock, see sharding.move_user()
+    sharding.check_placement(user_id, alias)
+    if row is None:
+        if sharding.is_sharded():
+            # Every placed user has a clock on their shard; recreating it
+            # here would send their writes to the wrong one
+            raise SyncClock.DoesNotExist(f"No SyncClock for user {user_id} on {alias}.")
+        SyncClock.objects.get_or_create(user_id=user_id)
+        return next_version(user_id)
+    return row[0]
+
+
+def current_version(user_id):
+    return SyncClock.objects.filter(user_id=user_id).values_list("value", flat=True).first() or 0
+
+
+# Where each table's rows come within a version, in sync order
+LISTS, PRODUCTS, TOMBSTONES = range(3)
+
+# Where a token without a row position stands: after every row of its version
+_END = (TOMBSTONES + 1, 0)
+
+
+class SyncToken(namedtuple("SyncToken", ["issued", "version", "rank", "id"])):
+    """
+    A position in a user's changes: after the row (version, rank, id) in sync
+    order. ``issued`` is the Unix time of the sync the client started from,
+    for expiring tokens older than the tombstones kept.
+    """
+    @property
+    def position(self):
+        return (self.version, self.rank, self.id)
+
+
+def encode_token(issued, version, rank=_END[0], id=_END[1]):
+    value = f"{TOKEN_PREFIX}{int(issued)}:{version}"
+    if (rank, id) != _END:
+        value += f":{rank}:{id}"
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_token(token):
+    """
+    Return the SyncToken of a sync token, None for an empty token (a full
+    sync), or raise ValueError for anything that is not a token. Tokens from
+    before they were dated come back issued at 0, so they are expired.
+    """
+    if not token:
+        return None
+    try:
+        value = base64.urlsafe_b64decode(token.encode()).decode()
+    except (binascii.Error, UnicodeError):
+        raise ValueError("Invalid sync token")
+    if value.startswith(_UNDATED_PREFIX) and value[len(_UNDATED_PREFIX):].isdigit():
+        return SyncToken(0, int(value[len(_UNDATED_PREFIX):]), *_END)
+    fields = value[len(TOKEN_PREFIX):].split(":") if value.startswith(TOKEN_PREFIX) else []
+    if len(fields) not in (2, 4) or not all(field.isdigit() for field in fields):
+        raise ValueError("Invalid sync token")
+    fields = [int(field) for field in fields]
+    return SyncToken(*fields) if len(fields) == 4 else SyncToken(*fields, *_END)
+
+
+def _after(queryset, rank, position):
+    version, afterRank, afterId = position
+    if rank < afterRank:
+        return queryset.filter(version__gt=version)
+    if rank > afterRank:
+        return queryset.filter(version__gte=version)
+    return queryset.filter(Q(version__gt=version) | Q(version=version, id__gt=afterId))
+
+
+def page(tables, since, limit):
+    """
+    Read the first ``limit`` rows after ``since`` in sync order, by version,
+    then table, then id, from ``tables``: [(rank, values() queryset with
+    "version" and "id")]. Returns ({rank: rows}, position of the last row, or
+    None when no more rows follow). One query per table, each an indexed
+    range scan, so a page costs the same however far into the changes it is.
+    """
+    rows = []
+    for rank, queryset in tables:
+        if since is not None:
+            queryset = _after(queryset, rank, since.position)
+        rows += [((row["version"], rank, row["id"]), row) for row in queryset.order_by("version", "id")[:limit + 1]]
+    rows.sort(key=itemgetter(0))
+    found = {rank: [] for rank, _ in tables}
+    for (_, rank, _), row in rows[:limit]:
+        found[rank].append(row)
+    return found, rows[limit - 1][0] if len(rows) > limit else None
@@ -1,9 +1,36 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from asgiref.sync import async_to_sync, sync_to_async
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient as Client
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
-from .models import CustomUser, List, Product, SharedList
+from .models import CustomUser, List, Product, SharedList, SyncClock, Tombstone, UserShard
+from .serializers import ListReadSerializer, ListSerializer, ProductReadSerializer, ProductSerializer
+from . import async_views, budgets, cache, etags, hashing, realtime, routers, share_tokens, sharding, suggestions, timing
+from . import urls as shoppinglist_urls
+from .authentication import UserSnapshots, user_snapshots
+from .middleware import ReplicaRoutingMiddleware
+from .views import ListViewSet, shared_list_events
 from rest_framework_simplejwt.tokens import AccessToken
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from grocery.database import database_from_environment, replicas_from_environment, shards_from_environment
+from grocery.pooled_postgresql import base as pooled_postgresql
 
 '''
     CRUD test for User (only creation), List, Product, and SharedList
@@ -43,14 +70,49 @@ class ModelTestCase(TestCase):
         self.assertEqual(product.list, list)
 
     def test_shared_list_creation(self):
+        # Lists and access tokens are unique per share, so use a fresh list and token
+        list = List.objects.create(user=self.user, name="Groceries")
         shared_list = SharedList.objects.create(user=self.user,
-                                                list_name=self.list.name,
-                                                access_token="abc123",
-                                                list_id=self.list.pk)
-        self.assertEqual(shared_list.list_name, self.list.name)
-        self.assertEqual(shared_list.access_token, "abc123")
+                                                list_name=list.name,
+                                                access_token="def456",
+                                                list_id=list.pk)
+        self.assertEqual(shared_list.list_name, list.name)
+        self.assertEqual(shared_list.access_token, "def456")
         self.assertEqual(shared_list.user, self.user)
 
+    def test_read_serializers_match_model_serializers(self):
+        Product.objects.create(user=self.user, list=self.list, name="Pears", note="ripe", checked=True)
+        products = Product.objects.filter(list=self.list)
+        self.assertEqual(ProductReadSerializer(ProductReadSerializer.values(products), many=True).data,
+                         ProductSerializer(products, many=True).data)
+        self.assertEqual(ListReadSerializer(ListReadSerializer.values(List.objects.filter(id=self.list.id)).get()).data,
+                         ListSerializer(self.list).data)
+
+    def test_shared_list_is_unique_per_list(self):
+        with self.assertRaises(IntegrityError):
+            SharedList.objects.create(user=self.user, list=self.list, access_token="ghi789")
+
+    def test_hot_queries_use_indexes(self):
+        # Each hot lookup must be planned as an index scan, not a full table scan
+        queries = {
+            "share by token": (SharedList.objects.filter(access_token="abc123"), None),
+            "share by list": (SharedList.objects.filter(list=self.list), None),
+            "products by list and checked": (Product.objects.filter(list=self.list, checked=True), "product_list_checked_idx"),
+            # Both list indexes lead with user, so either one is a good plan
+            "lists by user and complete": (List.objects.filter(user=self.user, complete=False), "list_user_"),
+        }
+        with transaction.atomic():
+            if connection.vendor == "postgresql":
+                # Tiny test tables would otherwise always be scanned sequentially
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+            for name, (queryset, index) in queries.items():
+                plan = queryset.explain()
+                with self.subTest(name):
+                    self.assertRegex(plan, r"(?i)index|integer primary key")
+                    if index:
+                        self.assertIn(index, plan)
+
     def test_list_update(self):
         updated_name = "Updated List Name"
         self.list.name = updated_name
@@ -104,6 +166,7 @@ class ModelTestCase(TestCase):
 
 class EndpointTestCase(TestCase):
     def setUp(self):
+        caches["default"].clear()
         self.client = Client()
         self.user = CustomUser.objects.create_user(email="test@example.com", password="testpass")
         self.list = List.objects.create(user=self.user,
@@ -118,6 +181,7 @@ class EndpointTestCase(TestCase):
         self.client.login(email="test@example.com", password="testpass")
         self.jwt_token = str(AccessToken.for_user(self.user))
         self.headers = {'HTTP_AUTHORIZATION': f'Bearer {self.jwt_token}'}
+        self.asyncHeaders = {'Authorization': f'Bearer {self.jwt_token}'}
 
 
     #      user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, default="")    
@@ -141,6 +205,13 @@ class EndpointTestCase(TestCase):
         response = self.client.post(reverse("sharedList-create-list-destroy"), data=list_data, **self.headers)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
+    def test_sharedList_creation_endpoint_conflict(self):
+        # Test POST request for a list that is already shared
+        list_data = {"list_name": self.list.name, "list_id": self.list.pk}
+        response = self.client.post(reverse("sharedList-create-list-destroy"), data=list_data, **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(SharedList.objects.filter(list=self.list).count(), 1)
+
     def test_sharedList_list_endpoint(self):
         # Test GET request to list all shared lists
         list1 = List.objects.create(user=self.user,
@@ -176,6 +247,154 @@ class EndpointTestCase(TestCase):
         response = self.client.get(reverse("sharedList-retrieve", args=[sharedList.access_token]))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_sharedList_retrieve_endpoint_is_cached(self):
+        # Test a second GET request for the same token is served from the cache
+        url = reverse("sharedList-retrieve", args=[self.sharedList.access_token])
+        before = cache.stats()
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        after = cache.stats()
+        self.assertEqual(response.data["products"][0]["name"], "Product 1")
+        self.assertEqual((after["misses"] - before["misses"], after["hits"] - before["hits"]), (1, 1))
+
+    def test_shared_list_payload_loaded_before_a_write_is_not_served(self):
+        # Test a payload read before a write committed cannot outlive its invalidation
+        def load():
+            # The write commits while this reader is loading
+            cache._bump([self.sharedList.access_token])
+            return {"stale": True}
+
+        self.assertEqual(cache.get_shared_list(self.sharedList.access_token, load), {"stale": True})
+        self.assertIsNone(cache.peek_shared_list(self.sharedList.access_token))
+        self.assertEqual(cache.get_shared_list(self.sharedList.access_token, lambda: {"fresh": True}), {"fresh": True})
+        self.assertEqual(cache.peek_shared_list(self.sharedList.access_token), {"fresh": True})
+
+    def test_shared_list_payload_is_not_served_once_its_generation_is_evicted(self):
+        # Test a generation key that was evicted does not restart at a value a stale payload has
+        token = self.sharedList.access_token
+        self.assertEqual(cache.get_shared_list(token, lambda: {"stale": True}), {"stale": True})
+        caches["default"].delete(cache.GENERATION_PREFIX + token)
+        self.assertIsNone(cache.peek_shared_list(token))
+        cache._bump([token])
+        self.assertIsNone(cache.peek_shared_list(token))
+        self.assertEqual(cache.get_shared_list(token, lambda: {"fresh": True}), {"fresh": True})
+        self.assertEqual(async_to_sync(cache.apeek_shared_list)(token), {"fresh": True})
+
+    def test_sharedList_retrieve_endpoint_invalidated_on_change(self):
+        # Test that writes to the list or its products drop the cached payload
+        url = reverse("sharedList-retrieve", args=[self.sharedList.access_token])
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(reverse("product-destroy-retrieve-update", args=[self.product.pk]), data={"name": "Pears", "list": self.list.pk})
+        self.assertEqual(self.client.get(url).data["products"][0]["name"], "Pears")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(reverse("list-retrieve-update-destroy", args=[self.list.pk]), data={"name": "Costco"})
+        self.assertEqual(self.client.get(url).data["list"]["name"], "Costco")
+
+    def test_sharedList_retrieve_endpoint_conditional_get(self):
+        # Test a GET request with a matching If-None-Match returns 304 for a shared list
+        url = reverse("sharedList-retrieve", args=[self.sharedList.access_token])
+        etag = self.client.get(url)["ETag"]
+        caches["default"].clear()
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_sharedList_signed_token_round_trip(self):
+        # Test a token minted by POST finds its list, and stops once the share is deleted
+        list = List.objects.create(user=self.user, name="Gas")
+        response = self.client.post(reverse("sharedList-create-list-destroy"), data={"list_name": list.name, "list_id": list.pk}, **self.headers)
+        access_token = response.data["access_token"]
+        self.assertEqual(share_tokens.parse(access_token), (list.pk, self.user.pk, 0, 0))
+        url = reverse("sharedList-retrieve", args=[access_token])
+        self.assertEqual(self.client.get(url).data["list"]["name"], "Gas")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(reverse("sharedList-create-list-destroy"), data={"pk": response.data["id"]})
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_sharedList_forged_token_is_rejected_without_queries(self):
+        # Test a token with a bad signature, or an expired one, is a 404 before any query
+        access_token = share_tokens.mint(self.list.pk, self.user.pk, 0)
+        # Another list's id under this token's signature
+        signature = access_token.rpartition(".")[2]
+        forged = f"{share_tokens.PREFIX}{self.list.pk + 1}.{self.user.pk}.0.0.{signature}"
+        with mock.patch("time.time", return_value=time.time() - 120):
+            expired = share_tokens.mint(self.list.pk, self.user.pk, 0, lifetime=60)
+        for token in [forged, expired, "s1.1.1.0.0", "s1.x.1.0.0.abc"]:
+            with self.assertNumQueries(0):
+                response = self.client.get(reverse("sharedList-retrieve", args=[token]))
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(reverse("sharedList-retrieve", args=[access_token])).status_code, status.HTTP_200_OK)
+
+    def test_sharedList_legacy_tokens_can_be_turned_off(self):
+        url = reverse("sharedList-retrieve", args=[self.sharedList.access_token])
+        with override_settings(SHARE_LEGACY_TOKENS=False):
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+    def test_sharedList_cached_payload_does_not_outlive_its_token(self):
+        # Test an expired or disabled token gets a 404, not a 304 from the cached payload
+        access_token = share_tokens.mint(self.list.pk, self.user.pk, 0, lifetime=60)
+        for token, expire in [
+            (access_token, mock.patch("time.time", return_value=time.time() + 120)),
+            (self.sharedList.access_token, override_settings(SHARE_LEGACY_TOKENS=False)),
+        ]:
+            url = reverse("sharedList-retrieve", args=[token])
+            etag = self.client.get(url)["ETag"]
+            self.assertIsNotNone(cache.peek_shared_list(token))
+            with expire:
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+                self.assertIsNone(async_to_sync(etags.ashared_list_etag)(token))
+
+    def test_product_writes_publish_events_to_list_channel(self):
+        # Test that product writes reach the list's push channel once they commit
+        published = []
+        broker = realtime.Broker()
+        broker.publish = lambda channel, event: published.append((channel, event["type"]))
+        with mock.patch.object(realtime, "get_broker", return_value=broker):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse("product-list-create"), data={"name": "Milk", "list": self.list.pk}, **self.headers)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.put(reverse("product-destroy-retrieve-update", args=[response.data["id"]]), data={"name": "Milk", "list": self.list.pk, "checked": True})
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.delete(reverse("product-destroy-retrieve-update", args=[response.data["id"]]))
+        channel = realtime.channel_for(self.list.pk)
+        self.assertEqual(published, [(channel, "product.created"), (channel, "product.checked"), (channel, "product.deleted")])
+
+    async def test_sharedList_events_endpoint_streams_events(self):
+        # Test the event stream of a shared list delivers published events
+        request = AsyncRequestFactory().get(reverse("sharedList-events", args=[self.sharedList.access_token]))
+        response = await shared_list_events(request, self.sharedList.access_token)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = response.streaming_content
+        self.assertTrue((await anext(stream)).startswith(b"retry:"))
+        realtime.get_broker().publish(realtime.channel_for(self.list.pk), {"type": "product.checked", "list": self.list.pk})
+        chunk = await asyncio.wait_for(anext(stream), 5)
+        self.assertTrue(chunk.startswith(b"event: product.checked\ndata: "))
+        await stream.aclose()
+
+    async def test_subscription_queue_sizes(self):
+        # Test 0 buffers without limit and a full queue ends with the overflow marker
+        broker = realtime.InMemoryBroker()
+        loop = asyncio.get_running_loop()
+        unbounded = realtime.Subscription(broker, "list:1", loop, 0)
+        bounded = realtime.Subscription(broker, "list:1", loop, 2)
+        for n in range(3):
+            unbounded._put({"n": n})
+            bounded._put({"n": n})
+        self.assertEqual([await unbounded.get() for _ in range(3)], [{"n": 0}, {"n": 1}, {"n": 2}])
+        self.assertEqual([await bounded.get() for _ in range(2)], [{"n": 0}, realtime.Subscription.OVERFLOW])
+        with self.assertRaises(ValueError):
+            realtime.Subscription(broker, "list:1", loop, 1)
+
+    async def test_sharedList_events_endpoint_unknown_token(self):
+        request = AsyncRequestFactory().get(reverse("sharedList-events", args=["nope"]))
+        response = await shared_list_events(request, "nope")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
     '''
         ########################################
         ## SharedList Endpoint Test Cases End ##
@@ -200,7 +419,21 @@ class EndpointTestCase(TestCase):
         List.objects.create(name="List 2", user=self.user)
         response = self.client.get(reverse("list-list-create"), **self.headers)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 3)
+        self.assertEqual(len(response.data["results"]), 3)
+
+    def test_list_list_endpoint_pagination(self):
+        # Test GET request walks the user's lists page by page with the cursor
+        for i in range(4):
+            List.objects.create(name=f"List {i}", user=self.user)
+        response = self.client.get(reverse("list-list-create"), {"page_size": 2}, **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertIsNotNone(response.data["next"])
+        ids = [item["id"] for item in response.data["results"]]
+        while response.data["next"]:
+            response = self.client.get(response.data["next"], **self.headers)
+            ids += [item["id"] for item in response.data["results"]]
+        self.assertEqual(ids, sorted(List.objects.filter(user=self.user).values_list("id", flat=True)))
 
     def test_list_delete_endpoint(self):
         # Test a DELETE request to the product endpoint
@@ -225,6 +458,26 @@ class EndpointTestCase(TestCase):
         self.assertEqual("Buy some Lego", response.data["name"])
         self.assertEqual("Yorkdale", response.data["description"])
 
+    def test_list_retrieve_endpoint_conditional_get(self):
+        # Test a GET request with a matching If-None-Match returns 304 until the list changes
+        url = reverse("list-retrieve-update-destroy", args=[self.list.pk])
+        etag = self.client.get(url)["ETag"]
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.client.post(reverse("product-list-create"), data={"name": "Milk", "list": self.list.pk}, **self.headers)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_list_list_endpoint_conditional_get(self):
+        # Test the collection ETag changes when a list is renamed
+        url = reverse("list-list-create")
+        etag = self.client.get(url, **self.headers)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag, **self.headers).status_code, status.HTTP_304_NOT_MODIFIED)
+        self.client.put(reverse("list-retrieve-update-destroy", args=[self.list.pk]), data={"name": "Walmart"})
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag, **self.headers).status_code, status.HTTP_200_OK)
+
     '''
         ##################################
         ## List Endpoint Test Cases End ##
@@ -247,9 +500,32 @@ class EndpointTestCase(TestCase):
         # Test GET request to get all products
         Product.objects.create(name="Product 1", list=self.list, user=self.user)
         Product.objects.create(name="Product 2", list=self.list, user=self.user)
-        response = self.client.get(reverse("product-list-create"))
+        response = self.client.get(reverse("product-list-create"), **self.headers)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 3)
+        self.assertEqual(len(response.data["results"]), 3)
+
+    def test_product_list_endpoint_only_returns_own_products(self):
+        # Test GET request does not leak other users' products
+        other = CustomUser.objects.create_user(email="other@example.com", password="testpass")
+        otherList = List.objects.create(name="Other", user=other)
+        Product.objects.create(name="Not mine", list=otherList, user=other)
+        response = self.client.get(reverse("product-list-create"), **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item["name"] for item in response.data["results"]], ["Product 1"])
+
+    def test_product_list_endpoint_conditional_get_covers_products_in_other_lists(self):
+        # Test the ETag changes when the user's product in someone else's list changes
+        other = CustomUser.objects.create_user(email="other@example.com", password="testpass")
+        otherList = List.objects.create(name="Other", user=other)
+        product = Product.objects.create(name="Mine", list=otherList, user=self.user)
+        url = reverse("product-list-create")
+        etag = self.client.get(url, **self.headers)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag, **self.headers).status_code, status.HTTP_304_NOT_MODIFIED)
+        self.client.put(reverse("product-destroy-retrieve-update", args=[product.pk]), data={"name": "Renamed", "list": otherList.pk})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag, **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.client.delete(reverse("product-destroy-retrieve-update", args=[product.pk]))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"], **self.headers).status_code, status.HTTP_200_OK)
 
     def test_product_delete_endpoint(self):
         # Test a DELETE request to the product endpoint
@@ -273,12 +549,531 @@ class EndpointTestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual("Ginger", response.data["name"])
 
+    def test_product_retrieve_endpoint_conditional_get(self):
+        # Test a GET request with a matching If-None-Match returns 304 until the product changes
+        url = reverse("product-destroy-retrieve-update", args=[self.product.pk])
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+        self.client.put(url, data={"name": "Walmart", "list": self.list.pk})
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+    def test_product_bulk_create_endpoint(self):
+        # Test POST request to create several products at once, one of them invalid
+        products_data = [
+            {"name": "Milk", "quantity": 1, "list": self.list.pk},
+            {"name": "Eggs", "quantity": 12, "list": self.list.pk},
+            {"name": "Nowhere", "list": 0},
+        ]
+        response = self.client.post(reverse("product-bulk"), data=products_data, format="json", **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([result["status"] for result in response.data["results"]], [201, 201, 400])
+        self.assertEqual(response.data["results"][1]["data"]["name"], "Eggs")
+        self.assertEqual(Product.objects.filter(list=self.list, user=self.user).count(), 3)
+
+    def test_product_bulk_update_endpoint(self):
+        # Test PUT request to update several products at once
+        product = Product.objects.create(name="Product 2", list=self.list, user=self.user)
+        products_data = [
+            {"id": self.product.pk, "name": "Oat milk"},
+            {"id": product.pk, "quantity": 3, "checked": True},
+        ]
+        response = self.client.put(reverse("product-bulk"), data=products_data, format="json", **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.product.refresh_from_db()
+        product.refresh_from_db()
+        self.assertEqual(self.product.name, "Oat milk")
+        self.assertEqual((product.quantity, product.checked), (3, True))
+
+    def test_product_bulk_check_endpoint(self):
+        # Test POST request to check off several products at once
+        product = Product.objects.create(name="Product 2", list=self.list, user=self.user)
+        response = self.client.post(reverse("product-bulk-check"), data={"ids": [self.product.pk, product.pk, 0], "checked": True}, format="json", **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([result["status"] for result in response.data["results"]], [202, 202, 404])
+        self.assertEqual(Product.objects.filter(list=self.list, checked=True).count(), 2)
+
+    def test_product_bulk_delete_endpoint(self):
+        # Test DELETE request to remove several products in one statement
+        other = CustomUser.objects.create_user(email="other@example.com", password="testpass")
+        otherProduct = Product.objects.create(name="Not mine", list=self.list, user=other)
+        response = self.client.delete(reverse("product-bulk"), data={"ids": [self.product.pk, otherProduct.pk]}, format="json", **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertFalse(Product.objects.filter(pk=self.product.pk).exists())
+        self.assertTrue(Product.objects.filter(pk=otherProduct.pk).exists())
+
+    def test_product_endpoints_maintain_list_counters(self):
+        # Test that creating, checking and deleting products keeps List.total and List.checked in step
+        list = List.objects.create(name="Counted", user=self.user)
+        response = self.client.post(reverse("product-list-create"), data={"name": "Milk", "list": list.pk}, **self.headers)
+        productId = response.data["id"]
+        self.client.post(reverse("product-bulk"), data=[{"name": "Eggs", "list": list.pk, "checked": True}], format="json", **self.headers)
+        list.refresh_from_db()
+        self.assertEqual((list.total, list.checked), (2, 1))
+        self.client.put(reverse("product-destroy-retrieve-update", args=[productId]), data={"name": "Milk", "list": list.pk, "checked": True})
+        list.refresh_from_db()
+        self.assertEqual((list.total, list.checked), (2, 2))
+        self.client.delete(reverse("product-destroy-retrieve-update", args=[productId]))
+        list.refresh_from_db()
+        self.assertEqual((list.total, list.checked), (1, 1))
+        self.client.delete(reverse("product-bulk"), data={"ids": [product.pk for product in list.products.all()]}, format="json", **self.headers)
+        list.refresh_from_db()
+        self.assertEqual((list.total, list.checked), (0, 0))
+
+    def test_list_counters_are_read_only(self):
+        # Test a PUT request cannot overwrite the server-maintained counters
+        response = self.client.put(reverse("list-retrieve-update-destroy", args=[self.list.pk]), data={"name": "Walmart", "total": 99, "checked": 42})
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.list.refresh_from_db()
+        self.assertEqual((self.list.total, self.list.checked), (0, 0))
+
+    def test_product_suggest_endpoint(self):
+        # Test that created products feed the autocomplete counts
+        url = reverse("product-list-create")
+        for name in ["Milk", "milk ", "Mint tea"]:
+            self.client.post(url, data={"name": name, "list": self.list.pk}, **self.headers)
+        self.client.post(reverse("product-bulk"), [{"name": "Mushrooms", "list": self.list.pk}], format="json", **self.headers)
+        response = self.client.get(reverse("product-suggest"), {"q": "MI"}, **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"], [{"name": "milk", "count": 2}, {"name": "Mint tea", "count": 1}])
+        response = self.client.get(reverse("product-suggest"), {"q": "m", "limit": 1}, **self.headers)
+        self.assertEqual([item["name"] for item in response.data["results"]], ["milk"])
+        other = CustomUser.objects.create(email="other@example.com")
+        response = self.client.get(reverse("product-suggest"), {"q": "m"}, HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(other)}")
+        self.assertEqual(response.data["results"], [])
+
+    def test_product_names_are_upserted_in_key_order(self):
+        with CaptureQueriesContext(connection) as queries:
+            suggestions.record(self.user.id, ["Tea", "apples", "Milk"])
+        sql = queries[0]["sql"]
+        self.assertLess(sql.index("'apples'"), sql.index("'milk'"))
+        self.assertLess(sql.index("'milk'"), sql.index("'tea'"))
+
+    def test_recount_lists_command(self):
+        # Test that recount_lists repairs drifted counters
+        Product.objects.create(name="Product 2", list=self.list, user=self.user, checked=True)
+        List.objects.filter(pk=self.list.pk).update(total=7, checked=0)
+        url = reverse("list-retrieve-update-destroy", args=[self.list.pk])
+        etag = self.client.get(url, **self.headers)["ETag"]
+        shared = reverse("sharedList-retrieve", args=[self.sharedList.access_token])
+        self.client.get(shared)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("recount_lists", chunk_size=1, stdout=StringIO())
+        self.list.refresh_from_db()
+        self.assertEqual((self.list.total, self.list.checked), (2, 1))
+        # Clients holding the old ETag or payload see the repaired counters
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag, **self.headers).status_code, status.HTTP_200_OK)
+        self.assertIsNone(cache.peek_shared_list(self.sharedList.access_token))
+        self.assertEqual(self.client.get(shared).data["list"]["total"], 2)
+        with self.assertRaises(CommandError):
+            call_command("recount_lists", chunk_size=0, stdout=StringIO())
+
     '''
         #####################################
         ## Product Endpoint Test Cases End ##
         #####################################
     '''
 
+    '''
+        ####################################
+        ## Sync Endpoint Test Cases Start ##
+        ####################################
+    '''
+
+    def test_sync_endpoint_returns_changes_since_token(self):
+        # Test GET request without a token returns everything, then only what changed
+        response = self.client.get(reverse("sync"), **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item["id"] for item in response.data["lists"]], [self.list.pk])
+        self.assertEqual([item["id"] for item in response.data["products"]], [self.product.pk])
+        token = response.data["token"]
+
+        response = self.client.post(reverse("product-list-create"), data={"name": "Milk", "list": self.list.pk}, **self.headers)
+        milkId = response.data["id"]
+        self.client.delete(reverse("product-destroy-retrieve-update", args=[self.product.pk]))
+        other = List.objects.create(name="Untouched", user=self.user)
+
+        response = self.client.get(reverse("sync"), {"since": token}, **self.headers)
+        self.assertEqual([item["id"] for item in response.data["products"]], [milkId])
+        self.assertEqual([item["id"] for item in response.data["lists"]], [self.list.pk])
+        self.assertEqual(response.data["deleted"], {"lists": [], "products": [self.product.pk]})
+        self.assertNotIn(other.pk, [item["id"] for item in response.data["lists"]])
+
+        response = self.client.get(reverse("sync"), {"since": response.data["token"]}, **self.headers)
+        self.assertEqual((response.data["lists"], response.data["products"]), ([], []))
+
+    def test_sync_endpoint_reports_deleted_lists(self):
+        token = self.client.get(reverse("sync"), **self.headers).data["token"]
+        self.client.delete(reverse("list-retrieve-update-destroy", args=[self.list.pk]))
+        response = self.client.get(reverse("sync"), {"since": token}, **self.headers)
+        self.assertEqual(response.data["deleted"]["lists"], [self.list.pk])
+
+    def test_sync_endpoint_pages_through_changes(self):
+        # Test a sync is served in pages that split a version's rows without skipping any
+        products = [{"name": f"Item {n}", "list": self.list.pk} for n in range(5)]
+        self.client.post(reverse("product-bulk"), products, format="json", **self.headers)
+        listIds, productIds, token, pages = [], [], None, 0
+        while True:
+            params = {"page_size": 2, **({"since": token} if token else {})}
+            response = self.client.get(reverse("sync"), params, **self.headers)
+            self.assertLessEqual(len(response.data["lists"]) + len(response.data["products"]), 2)
+            listIds += [item["id"] for item in response.data["lists"]]
+            productIds += [item["id"] for item in response.data["products"]]
+            token, pages = response.data["token"], pages + 1
+            if not response.data["more"]:
+                break
+        self.assertEqual(pages, 4)
+        self.assertEqual(listIds, [self.list.pk])
+        self.assertEqual(sorted(productIds), sorted(Product.objects.filter(user=self.user).values_list("id", flat=True)))
+        response = self.client.get(reverse("sync"), {"since": token}, **self.headers)
+        self.assertEqual((response.data["lists"], response.data["products"], response.data["more"]), ([], [], False))
+
+    def test_sync_endpoint_expires_old_tokens(self):
+        # Test tokens older than the tombstones kept, and undated ones, ask for a full sync
+        token = self.client.get(reverse("sync"), **self.headers).data["token"]
+        with override_settings(SYNC_TOMBSTONE_RETENTION=timedelta(0)):
+            response = self.client.get(reverse("sync"), {"since": token}, **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+        undated = base64.urlsafe_b64encode(b"v1:3").decode()
+        self.assertEqual(self.client.get(reverse("sync"), {"since": undated}, **self.headers).status_code, status.HTTP_410_GONE)
+        self.assertEqual(self.client.get(reverse("sync"), {"since": token}, **self.headers).status_code, status.HTTP_200_OK)
+
+    def test_prune_tombstones_command(self):
+        self.client.delete(reverse("list-retrieve-update-destroy", args=[self.list.pk]))
+        kept = Tombstone.objects.create(user=self.user, kind=Tombstone.LIST, object_id=99, version=99)
+        old = Tombstone.objects.exclude(pk=kept.pk).update(deleted_at=timezone.now() - settings.SYNC_TOMBSTONE_RETENTION - timedelta(days=1))
+        out = StringIO()
+        call_command("prune_tombstones", chunk_size=1, stdout=out)
+        self.assertEqual(list(Tombstone.objects.values_list("pk", flat=True)), [kept.pk])
+        self.assertIn(f"Deleted {old} tombstones.", out.getvalue())
+
+    def test_sync_endpoint_rejects_garbage_token(self):
+        response = self.client.get(reverse("sync"), {"since": "not-a-token"}, **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    '''
+        ##################################
+        ## Sync Endpoint Test Cases End ##
+        ##################################
+    '''
+
+    '''
+        ###################################################
+        ## Export, Import and Search Test Cases Start ##
+        ###################################################
+    '''
+
+    def test_export_endpoint_streams_ndjson(self):
+        empty = List.objects.create(user=self.user, name="Empty")
+        other = CustomUser.objects.create(email="other@example.com")
+        List.objects.create(user=other, name="Not mine")
+        response = self.client.get(reverse("export"), **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual([line["id"] for line in lines], [self.list.pk, empty.pk])
+        self.assertEqual([product["id"] for product in lines[0]["products"]], [self.product.pk])
+        self.assertEqual(lines[1]["products"], [])
+
+    async def test_export_endpoint_streams_chunks_under_asgi(self):
+        # Test the export is read a chunk at a time under ASGI, not collected first
+        await List.objects.acreate(user=self.user, name="Empty")
+        response = await self.async_client.get(reverse("export"), headers=self.asyncHeaders)
+        self.assertTrue(response.is_async)
+        chunks = response.streaming_content
+        first = await anext(chunks)
+        self.assertEqual(json.loads(first)["id"], self.list.pk)
+        self.assertEqual(json.loads(await anext(chunks))["name"], "Empty")
+        await chunks.aclose()
+
+    def test_export_endpoint_streams_csv(self):
+        response = self.client.get(reverse("export"), {"format": "csv"}, **self.headers)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        rows = list(csv.DictReader(StringIO(b"".join(response.streaming_content).decode())))
+        self.assertEqual([(row["list_name"], row["product_name"]) for row in rows], [("Groceries", "Product 1")])
+        response = self.client.get(reverse("export"), {"format": "xml"}, **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_import_endpoint_creates_lists_and_reports_bad_rows(self):
+        body = "\n".join([
+            json.dumps({"name": "Costco", "products": [{"name": "Eggs", "checked": True}, {"name": "Milk"}, {"quantity": -1}]}),
+            "not json",
+            json.dumps({"name": "Empty"}),
+            "",
+        ])
+        response = self.client.post(reverse("import"), body, content_type="application/x-ndjson", **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual((response.data["lists"], response.data["products"], response.data["error_count"]), (2, 2, 2))
+        self.assertEqual([(error["line"], error.get("product")) for error in response.data["errors"]], [(1, 2), (2, None)])
+        costco = List.objects.get(user=self.user, name="Costco")
+        self.assertEqual((costco.total, costco.checked), (2, 1))
+        self.assertEqual(sorted(costco.products.values_list("name", flat=True)), ["Eggs", "Milk"])
+
+    def test_export_then_import_lists_command(self):
+        exported = b"".join(self.client.get(reverse("export"), **self.headers).streaming_content)
+        other = CustomUser.objects.create(email="other@example.com")
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        path = os.path.join(directory, "lists.ndjson")
+        with open(path, "wb") as file:
+            file.write(exported)
+        out = StringIO()
+        call_command("import_lists", path, user="other@example.com", chunk_size=1, stdout=out)
+        self.assertIn("Created 1 lists and 1 products.", out.getvalue())
+        imported = List.objects.get(user=other)
+        self.assertEqual((imported.name, imported.total), ("Groceries", 1))
+        self.assertEqual(list(imported.products.values_list("name", "user")), [("Product 1", other.pk)])
+
+    def test_search_endpoint_ranks_lists_and_products(self):
+        spices = List.objects.create(user=self.user, name="Spices", description="saffron and cumin")
+        saffron = Product.objects.create(name="Saffron", list=spices, user=self.user)
+        Product.objects.create(name="Rice", note="with saffron", list=self.list, user=self.user)
+        other = CustomUser.objects.create(email="other@example.com")
+        Product.objects.create(name="Saffron", list=List.objects.create(user=other, name="Theirs"), user=other)
+        response = self.client.get(reverse("search"), {"q": "saffron"}, **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data["results"]
+        self.assertEqual(len(results), 3)
+        self.assertEqual(sorted(result["type"] for result in results), ["list", "product", "product"])
+        # A match in the name ranks above one in the note
+        products = [result["data"]["id"] for result in results if result["type"] == "product"]
+        self.assertEqual(products[0], saffron.pk)
+
+        response = self.client.get(reverse("search"), {"q": "saffron", "page_size": 2}, **self.headers)
+        self.assertEqual(len(response.data["results"]), 2)
+        response = self.client.get(response.data["next"], **self.headers)
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertIsNone(response.data["next"])
+
+    def test_search_index_follows_updates_and_deletes(self):
+        self.client.put(reverse("product-destroy-retrieve-update", args=[self.product.pk]), {"name": "Paprika", "list": self.list.pk})
+        response = self.client.get(reverse("search"), {"q": "paprika"}, **self.headers)
+        self.assertEqual([result["data"]["id"] for result in response.data["results"]], [self.product.pk])
+        self.product.delete()
+        response = self.client.get(reverse("search"), {"q": "paprika \"OR"}, **self.headers)
+        self.assertEqual(response.data["results"], [])
+
+    '''
+        #################################################
+        ## Export, Import and Search Test Cases End ##
+        #################################################
+    '''
+
+    '''
+        ###########################################
+        ## Async Read Endpoint Test Cases Start ##
+        ###########################################
+    '''
+
+    async def test_async_list_list_endpoint_matches_sync(self):
+        # Test the async list endpoint returns the same page and ETag as the viewset
+        url = reverse("list-list-create")
+        expected = await sync_to_async(self.client.get)(url, **self.headers)
+        request = AsyncRequestFactory().get(url, headers=self.asyncHeaders)
+        response = await async_views.with_async_get(None, async_views.list_list)(request)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, expected.content)
+        self.assertEqual(response["ETag"], expected["ETag"])
+
+        request = AsyncRequestFactory().get(url, headers={**self.asyncHeaders, "If-None-Match": expected["ETag"]})
+        response = await async_views.list_list(request)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    async def test_async_sharedList_retrieve_endpoint_matches_sync(self):
+        url = reverse("sharedList-retrieve", args=[self.sharedList.access_token])
+        expected = await sync_to_async(self.client.get)(url)
+        await sync_to_async(caches["default"].clear)()
+        response = await async_views.shared_list_retrieve(AsyncRequestFactory().get(url), self.sharedList.access_token)
+        self.assertEqual(response.content, expected.content)
+        self.assertEqual(response["ETag"], expected["ETag"])
+
+    async def test_async_sharedList_retrieve_endpoint_revoked_between_etag_and_load(self):
+        # Test a share revoked after the ETag check is a 404, as in the sync view
+        url = reverse("sharedList-retrieve", args=[self.sharedList.access_token])
+        await sync_to_async(caches["default"].clear)()
+        view = async_views.with_async_get(None, async_views.shared_list_retrieve)
+        etag = etags.ashared_list_etag
+
+        async def revoke_after_etag(access_token):
+            value = await etag(access_token)
+            await SharedList.objects.filter(pk=self.sharedList.pk).aupdate(access_token="revoked")
+            return value
+        with mock.patch.object(etags, "ashared_list_etag", revoke_after_etag):
+            response = await view(AsyncRequestFactory().get(url), access_token=self.sharedList.access_token)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_async_read_endpoints_reject_bad_token_and_missing_rows(self):
+        view = async_views.with_async_get(None, async_views.product_retrieve)
+        url = reverse("product-destroy-retrieve-update", args=[self.product.pk])
+        response = await view(AsyncRequestFactory().get(url, headers={"Authorization": "Bearer nope"}), pk=self.product.pk)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIn("WWW-Authenticate", response)
+        response = await view(AsyncRequestFactory().get(url), pk=0)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_async_read_endpoint_delegates_writes_to_viewset(self):
+        url = reverse("list-retrieve-update-destroy", args=[self.list.pk])
+        view = async_views.with_async_get(ListViewSet.as_view({"put": "update"}), async_views.list_retrieve)
+        request = AsyncRequestFactory().put(url, data={"name": "Costco"}, content_type="application/json", headers=self.asyncHeaders)
+        response = await view(request, pk=self.list.pk)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        response = await view(AsyncRequestFactory().get(url), pk=self.list.pk)
+        self.assertIn(b'"name":"Costco"', response.content)
+
+    '''
+        #########################################
+        ## Async Read Endpoint Test Cases End ##
+        #########################################
+    '''
+
+    '''
+        ######################################
+        ## Request Timing Test Cases Start ##
+        ######################################
+    '''
+
+    def test_responses_carry_server_timing(self):
+        # Test the middleware reports the queries run by the view and records the request per URL name
+        timing.reset()
+        url = reverse("list-retrieve-update-destroy", args=[self.list.pk])
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        metrics = dict(metric.split(";", 1) for metric in response["Server-Timing"].split(", "))
+        self.assertEqual(set(metrics), {"total", "db", "serialize", "size"})
+        self.assertIn('desc="2 queries"', metrics["db"])
+        self.assertEqual(metrics["size"], f'desc="{len(response.content)} bytes"')
+        histograms = timing.snapshot()["list-retrieve-update-destroy"]
+        self.assertEqual(histograms["total"]["count"], 1)
+        self.assertEqual(histograms["queries"]["sum"], 2)
+
+    async def test_server_timing_counts_queries_under_asgi(self):
+        # Test the queries of a sync view, run from a sync_to_async thread, are counted
+        response = await self.async_client.get(reverse("list-list-create"), headers=self.asyncHeaders)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        metrics = dict(metric.split(";", 1) for metric in response["Server-Timing"].split(", "))
+        self.assertNotIn('desc="0 queries"', metrics["db"])
+
+    def test_metrics_endpoint_reports_requests_by_viewset_action(self):
+        self.client.get(reverse("list-retrieve-update-destroy", args=[self.list.pk]), **self.headers)
+        self.client.get(reverse("sharedList-retrieve", args=[self.sharedList.access_token]))
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.content.decode()
+        self.assertIn('grocery_requests_total{handler="ListViewSet.retrieve",method="GET",status="2xx"}', body)
+        self.assertIn('grocery_request_db_queries_count{handler="ShareDataViewSet.retrieve"}', body)
+        self.assertIn('grocery_jwt_authentication_duration_seconds_count{outcome="authenticated"}', body)
+        self.assertIn('grocery_shared_list_cache_requests_total{outcome="misses"}', body)
+
+    def test_metrics_endpoint_is_limited_to_allowed_addresses_and_the_token(self):
+        url = reverse("metrics")
+        outside = {"REMOTE_ADDR": "203.0.113.5"}
+        self.assertEqual(self.client.get(url, **outside).status_code, status.HTTP_403_FORBIDDEN)
+        with override_settings(METRICS_TOKEN="scrape"):
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION="Bearer scrape", **outside).status_code, status.HTTP_200_OK)
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION="Bearer other", **outside).status_code, status.HTTP_403_FORBIDDEN)
+        with override_settings(METRICS_ALLOWED_IPS=[]):
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_serializer_time_is_counted_for_many(self):
+        # Outside a request the timing hooks do nothing
+        ListSerializer(List.objects.all(), many=True).data
+        timings, token = timing.start()
+        try:
+            ListSerializer(List.objects.all(), many=True).data
+        finally:
+            timing.stop(token)
+        self.assertGreater(timings.serialize, 0)
+
+    '''
+        ####################################
+        ## Request Timing Test Cases End ##
+        ####################################
+    '''
+
+    '''
+        ######################################
+        ## Authentication Test Cases Start ##
+        ######################################
+    '''
+
+    def test_authentication_reuses_user_snapshot(self):
+        url = reverse("sharedList-create-list-destroy")
+        # The first request loads is_active, later ones only run the view's query
+        with self.assertNumQueries(2):
+            self.client.get(url, **self.headers)
+        with self.assertNumQueries(1):
+            response = self.client.get(url, **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_authentication_sees_deactivated_user(self):
+        url = reverse("sharedList-create-list-destroy")
+        self.client.get(url, **self.headers)
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(url, **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_user_snapshots_expire_and_stay_bounded(self):
+        snapshots = UserSnapshots(ttl=60, max_size=2)
+        for userId in (1, 2, 3):
+            snapshots.set(userId, True)
+        self.assertEqual([snapshots.get(userId) for userId in (1, 2, 3)], [None, True, True])
+        with mock.patch("shoppinglist.authentication.time.monotonic", return_value=time.monotonic() + 61):
+            self.assertIsNone(snapshots.get(2))
+
+    def test_login_rehashes_password_with_tuned_iterations(self):
+        credentials = {"email": "test@example.com", "password": "testpass"}
+        with override_settings(PASSWORD_PBKDF2_ITERATIONS=1000):
+            response = self.client.post(reverse("token_obtain_pair"), credentials)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertIn("access", response.data)
+            self.user.refresh_from_db()
+            self.assertTrue(self.user.password.startswith("pbkdf2_sha256$1000$"))
+            response = self.client.post(reverse("token_obtain_pair"), {**credentials, "password": "wrong"})
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(PASSWORD_HASHING_QUEUE=2)
+    def test_hashing_pool_turns_away_requests_when_full(self):
+        # Slots held by other processes count against this one
+        for slot in range(2):
+            caches["default"].set(f"{hashing.KEY_PREFIX}{slot}", 1)
+        signup = self.client.post(reverse("user-create"), {"email": "busy@example.com", "password": "testpass"})
+        login = self.client.post(reverse("token_obtain_pair"), {"email": "test@example.com", "password": "testpass"})
+        for response in (signup, login):
+            self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+            self.assertEqual(response["Retry-After"], "1")
+        self.assertFalse(CustomUser.objects.filter(email="busy@example.com").exists())
+        caches["default"].delete(f"{hashing.KEY_PREFIX}0")
+        response = self.client.post(reverse("token_obtain_pair"), {"email": "test@example.com", "password": "testpass"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # The slot is given back once the hash is done
+        self.assertIsNone(caches["default"].get(f"{hashing.KEY_PREFIX}0"))
+
+    @override_settings(PASSWORD_HASHING_QUEUE=1)
+    def test_hashing_slots_are_shared_by_concurrent_requests(self):
+        # As under gthread workers: one thread's hash is running when another asks
+        started, release = threading.Event(), threading.Event()
+
+        def slow(password):
+            started.set()
+            release.wait(5)
+            return "hashed"
+
+        with mock.patch.object(hashing.hashers, "make_password", slow):
+            first = threading.Thread(target=hashing.make_password, args=["one"])
+            first.start()
+            started.wait(5)
+            with self.assertRaises(hashing.HashingUnavailable):
+                hashing.make_password("two")
+            release.set()
+            first.join()
+            self.assertEqual(hashing.make_password("three"), "hashed")
+
+    '''
+        ####################################
+        ## Authentication Test Cases End ##
+        ####################################
+    '''
+
     '''
         ####################################
         ## User Endpoint Test Cases Start ##
@@ -288,6 +1083,61 @@ class EndpointTestCase(TestCase):
     def test_user_creation_endpoint(self):
         response = self.client.post(reverse("user-create"), {"email": "testCreate@example.com", "password": "testpass"})
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    @override_settings(PASSWORD_PBKDF2_ITERATIONS=1000)
+    def test_import_users_command(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        path = os.path.join(directory, "users.csv")
+        with open(path, "w") as file:
+            file.write("email,password,first_name\n"
+                       "new@EXAMPLE.com,secret,Ann\n"
+                       "test@example.com,other,\n"
+                       ",nopass,\n"
+                       "second@example.com,,\n")
+        errors = StringIO()
+        call_command("import_users", path, chunk_size=2, workers=0, stdout=StringIO(), stderr=errors)
+        user = CustomUser.objects.get(email="new@example.com")
+        self.assertEqual(user.first_name, "Ann")
+        self.assertTrue(user.check_password("secret"))
+        self.assertTrue(hasattr(user, "sync_clock"))
+        self.assertFalse(CustomUser.objects.get(email="second@example.com").has_usable_password())
+        # The existing user keeps their password
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password("testpass"))
+        self.assertIn("Record 3: no email.", errors.getvalue())
+        self.assertFalse(os.path.exists(f"{path}.checkpoint"))
+
+    @override_settings(PASSWORD_PBKDF2_ITERATIONS=1000)
+    def test_import_users_command_resumes_from_checkpoint(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        path = os.path.join(directory, "users.ndjson")
+        with open(path, "w") as file:
+            file.write('{"email": "first@example.com", "password": "secret"}\n'
+                       '{"email": "second@example.com", "password": "secret"}\n')
+        with open(f"{path}.checkpoint", "w") as file:
+            file.write('{"records": 1}')
+        out = StringIO()
+        call_command("import_users", path, workers=1, stdout=out)
+        self.assertIn("Created 1 users.", out.getvalue())
+        self.assertFalse(CustomUser.objects.filter(email="first@example.com").exists())
+        self.assertTrue(CustomUser.objects.get(email="second@example.com").check_password("secret"))
+
+    @override_settings(PASSWORD_PBKDF2_ITERATIONS=1000)
+    def test_import_users_command_skips_malformed_lines(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        path = os.path.join(directory, "users.ndjson")
+        with open(path, "w") as file:
+            file.write('{"email": "first@example.com", "password": "secret"}\n'
+                       'not json\n'
+                       '\n'
+                       '["list"]\n'
+                       '{"email": "second@example.com", "password": "secret"}\n')
+        out, errors = StringIO(), StringIO()
+        call_command("import_users", path, workers=0, stdout=out, stderr=errors)
+        self.assertIn("Created 2 users. Skipped 0 existing and 2 invalid records.", out.getvalue())
+        self.assertIn("Record 2: invalid JSON on line 2.", errors.getvalue())
+        self.assertIn("Record 3: not a JSON object on line 4.", errors.getvalue())
+        self.assertEqual(CustomUser.objects.filter(email__in=["first@example.com", "second@example.com"]).count(), 2)
     
     '''
         ##################################
@@ -295,6 +1145,389 @@ class EndpointTestCase(TestCase):
         ##################################
     '''
 
+class DatabaseSettingsTestCase(SimpleTestCase):
+    '''
+        DATABASES from the environment, and the connection pool behind DB_POOL_SIZE
+    '''
+    def test_database_settings_from_environment(self):
+        database = database_from_environment({})
+        self.assertEqual((database["HOST"], database["CONN_MAX_AGE"], database["CONN_HEALTH_CHECKS"]), ("db", 60, True))
+        database = database_from_environment({"DB_POOL_SIZE": "8", "DB_STATEMENT_TIMEOUT": "5000"})
+        self.assertEqual(database["ENGINE"], "grocery.pooled_postgresql")
+        self.assertEqual((database["CONN_MAX_AGE"], database["OPTIONS"]["pool"]["max_size"]), (0, 8))
+        self.assertEqual(database["OPTIONS"]["options"], "-c statement_timeout=5000")
+        database = database_from_environment({"DB_PGBOUNCER": "1", "DB_STATEMENT_TIMEOUT": "5000", "DB_CONN_MAX_AGE": "none"})
+        self.assertTrue(database["DISABLE_SERVER_SIDE_CURSORS"])
+        self.assertNotIn("options", database["OPTIONS"])
+        self.assertIsNone(database["CONN_MAX_AGE"])
+
+    def test_connection_pool_reuses_connections_and_stays_bounded(self):
+        def connect():
+            connection = mock.Mock(closed=0)
+            connection.info.transaction_status = TRANSACTION_STATUS_IDLE
+            return connection
+        pool = pooled_postgresql.ConnectionPool(max_size=1, timeout=0)
+        first = pool.checkout(connect)
+        with self.assertRaises(pooled_postgresql.Database.OperationalError):
+            pool.checkout(connect)
+        pool.checkin(first)
+        self.assertIs(pool.checkout(connect), first)
+        # A connection that saw an error is closed instead of reused
+        pool.checkin(first, discard=True)
+        first.close.assert_called_once()
+        self.assertIsNot(pool.checkout(connect), first)
+
+    def test_replicas_from_environment(self):
+        self.assertEqual(replicas_from_environment({}), {})
+        replicas = replicas_from_environment({"DB_REPLICA_HOSTS": "replica-a, replica-b:5433", "DB_POOL_SIZE": "4"})
+        self.assertEqual(list(replicas), ["replica1", "replica2"])
+        self.assertEqual((replicas["replica1"]["HOST"], replicas["replica1"]["PORT"]), ("replica-a", "5432"))
+        self.assertEqual((replicas["replica2"]["HOST"], replicas["replica2"]["PORT"]), ("replica-b", "5433"))
+        self.assertEqual(replicas["replica2"]["ENGINE"], "grocery.pooled_postgresql")
+        self.assertEqual(replicas["replica1"]["TEST"], {"MIRROR": "default"})
+
+    def test_shards_from_environment(self):
+        shards = shards_from_environment({"DB_SHARDS": "lists2, pg-b:5433/lists3"})
+        self.assertEqual((shards["shard1"]["HOST"], shards["shard1"]["NAME"]), ("db", "lists2"))
+        self.assertEqual((shards["shard2"]["HOST"], shards["shard2"]["PORT"], shards["shard2"]["NAME"]), ("pg-b", "5433", "lists3"))
+        shards = shards_from_environment({"DB_ENGINE": "sqlite3", "DB_SHARDS": "data/shard1.sqlite3"})
+        self.assertEqual(shards["shard1"], {"ENGINE": "django.db.backends.sqlite3", "NAME": "data/shard1.sqlite3"})
+
+@override_settings(
+    DATABASE_REPLICAS=["replica1"],
+    CACHES={**settings.CACHES, "pins": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": os.path.join(tempfile.gettempdir(), "grocery-test-pins")}},
+    REPLICA_PIN_CACHE="pins",
+)
+class ReplicaRoutingTestCase(SimpleTestCase):
+    '''
+        Which database ReplicaRouter picks for each request. Only the aliases
+        are checked, so no replica needs to exist. The pins go to a file
+        cache, standing in for one shared by every process
+    '''
+    def setUp(self):
+        caches["pins"].clear()
+        self.router = routers.ReplicaRouter()
+
+    def bearer(self, user_id):
+        return {"HTTP_AUTHORIZATION": "Bearer " + str(AccessToken.for_user(CustomUser(id=user_id)))}
+
+    def route(self, request, write=False):
+        seen = []
+        def view(request):
+            seen.append(self.router.db_for_read(Product))
+            if write:
+                self.router.db_for_write(Product)
+                seen.append(self.router.db_for_read(Product))
+            return None
+        ReplicaRoutingMiddleware(view)(request)
+        return seen
+
+    def test_reads_outside_requests_go_to_the_primary(self):
+        self.assertEqual(self.router.db_for_read(Product), "default")
+        self.assertEqual(self.router.db_for_write(Product), "default")
+        self.assertTrue(self.router.allow_migrate("default", "shoppinglist"))
+        self.assertFalse(self.router.allow_migrate("replica1", "shoppinglist"))
+
+    def test_safe_requests_read_from_a_replica_until_they_write(self):
+        self.assertEqual(self.route(RequestFactory().get("/api/lists")), ["replica1"])
+        self.assertEqual(self.route(RequestFactory().post("/api/lists")), ["default"])
+        self.assertEqual(self.route(RequestFactory().get("/api/lists", **self.bearer(2)), write=True), ["replica1", "default"])
+        token = routers.begin(True)
+        try:
+            with routers.use_primary():
+                self.assertEqual(self.router.db_for_read(Product), "default")
+            with mock.patch.object(connection, "in_atomic_block", True):
+                self.assertEqual(self.router.db_for_read(Product), "default")
+            self.assertEqual(self.router.db_for_read(Product), "replica1")
+        finally:
+            routers.end(token)
+
+    def test_clients_read_from_the_primary_after_writing(self):
+        self.route(RequestFactory().post("/api/lists", **self.bearer(1)), write=True)
+        self.assertEqual(self.route(RequestFactory().get("/api/lists", **self.bearer(1))), ["default"])
+        # Other clients are not pinned
+        self.assertEqual(self.route(RequestFactory().get("/api/lists", **self.bearer(2))), ["replica1"])
+        # Requests that only read do not pin
+        self.route(RequestFactory().post("/api/lists", **self.bearer(3)))
+        self.assertEqual(self.route(RequestFactory().get("/api/lists", **self.bearer(3))), ["replica1"])
+
+    def test_pins_follow_the_user_across_token_refreshes(self):
+        writer = self.bearer(1)
+        self.route(RequestFactory().post("/api/lists", **writer), write=True)
+        refreshed = self.bearer(1)
+        self.assertNotEqual(refreshed, writer)
+        self.assertEqual(self.route(RequestFactory().get("/api/lists", **refreshed)), ["default"])
+        # Invalid tokens are pinned by address
+        self.route(RequestFactory().post("/api/lists", HTTP_AUTHORIZATION="Bearer forged", REMOTE_ADDR="10.0.0.1"), write=True)
+        self.assertEqual(self.route(RequestFactory().get("/api/lists", REMOTE_ADDR="10.0.0.1")), ["default"])
+        self.assertEqual(self.route(RequestFactory().get("/api/lists", REMOTE_ADDR="10.0.0.2")), ["replica1"])
+
+    @override_settings(REPLICA_PIN_CACHE="default")
+    def test_process_local_pin_caches_keep_reads_on_the_primary(self):
+        with self.assertLogs("shoppinglist.middleware", "WARNING"):
+            self.assertEqual(self.route(RequestFactory().get("/api/lists")), ["default"])
+
+    def test_async_requests_are_routed(self):
+        seen = []
+        async def view(request):
+            seen.append(await sync_to_async(self.router.db_for_read)(Product))
+            await sync_to_async(self.router.db_for_write)(Product)
+            return None
+        middleware = ReplicaRoutingMiddleware(view)
+        authorization = self.bearer(1)["HTTP_AUTHORIZATION"]
+        async_to_sync(middleware)(AsyncRequestFactory().get("/api/lists", headers={"Authorization": authorization}))
+        async_to_sync(middleware)(AsyncRequestFactory().get("/api/lists", headers={"Authorization": authorization}))
+        self.assertEqual(seen, ["replica1", "default"])
+
+@override_settings(SHARDS=["default", "shard1"])
+class ShardingTestCase(TestCase):
+    '''
+        Routing to shards by user and planning moves. The map entries are
+        put in the cache, so nothing is read from shard1; ShardMoveTestCase
+        moves real rows
+    '''
+    def setUp(self):
+        caches["default"].clear()
+        self.router = routers.ShardRouter()
+
+    def place(self, user_id, shard, moving=False):
+        caches["default"].set(sharding.KEY_PREFIX + str(user_id), (shard, moving))
+
+    def create_user(self, email):
+        # Without a shard of their own, as if created before sharding
+        with override_settings(SHARDS=["default"]):
+            return CustomUser.objects.create_user(email=email, password="testpass")
+
+    def test_queries_go_to_the_active_users_shard(self):
+        self.place(7, "shard1")
+        self.assertEqual(self.router.db_for_read(List), "default")
+        with sharding.for_user(7):
+            self.assertEqual(self.router.db_for_read(List), "shard1")
+            self.assertEqual(self.router.db_for_write(Product), "shard1")
+            # Users stay on the directory, for ReplicaRouter to route
+            self.assertIsNone(self.router.db_for_read(CustomUser))
+        self.assertEqual(self.router.db_for_write(List, instance=List(user_id=7)), "shard1")
+        with override_settings(SHARDS=["default"]):
+            self.assertIsNone(self.router.db_for_read(List))
+
+    def test_writes_are_refused_while_the_user_moves(self):
+        self.place(7, "shard1", moving=True)
+        with sharding.for_user(7):
+            self.assertEqual(self.router.db_for_read(List), "shard1")
+            with self.assertRaises(sharding.ShardMoving):
+                self.router.db_for_write(List)
+
+    def test_signed_tokens_name_their_owner(self):
+        # Test the owner of a signed token is known without asking the shards
+        with override_settings(SHARDS=["default", "shard1"]):
+            with self.assertNumQueries(0):
+                self.assertEqual(sharding.owner_of_token(share_tokens.mint(3, 7, 0)), 7)
+                self.assertIsNone(sharding.owner_of_token(share_tokens.mint(3, 7, 0) + "x"))
+
+    def test_unplaced_users_live_on_the_first_shard(self):
+        user = self.create_user("old@example.com")
+        with self.assertNumQueries(1):
+            self.assertEqual(sharding.lookup(user.id), ("default", False))
+            self.assertEqual(sharding.lookup(user.id), ("default", False))
+
+    def test_plan_rebalance_evens_out_users(self):
+        users = [self.create_user(f"user{n}@example.com") for n in range(5)]
+        UserShard.objects.create(user=users[0], shard="shard1")
+        self.assertEqual(sharding.plan_rebalance(), [(users[4].id, "shard1")])
+
+    def test_reserve_ids_starts_each_shard_in_its_own_range(self):
+        with override_settings(SHARDS=["elsewhere", "default"]):
+            sharding.reserve_ids("default")
+        with override_settings(SHARDS=["default"]):
+            list = List.objects.create(user=self.create_user("ids@example.com"))
+        self.assertGreater(list.id, 1 << sharding.ID_BITS)
+
+@skipUnless("shard1" in settings.DATABASES, "needs the shard1 database of grocery.test_settings")
+@override_settings(SHARDS=["default", "shard1"])
+class ShardMoveTestCase(TestCase):
+    '''
+        Moving users between "default" and "shard1", two real databases
+    '''
+    databases = {"default", "shard1"}
+
+    def setUp(self):
+        caches["default"].clear()
+        sharding.reserve_ids("shard1")
+        # Created on one shard, as if before sharding, so the test picks the moves
+        with override_settings(SHARDS=["default"]):
+            self.user = CustomUser.objects.create_user(email="mover@example.com", password="testpass")
+        self.lists = [List.objects.create(user=self.user, name=name) for name in ["Groceries", "Gas"]]
+        self.products = [Product.objects.create(user=self.user, list=list, name=f"{list.name} {n}") for list in self.lists for n in range(3)]
+        self.sharedList = SharedList.objects.create(user=self.user, list=self.lists[0], access_token="moving")
+        self.headers = {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(self.user)}"}
+
+    def rows(self, alias):
+        return {model.__name__: sorted(model.objects.using(alias).filter(**{owner: self.user.id}).values_list("pk", flat=True)) for model, owner in sharding.SHARDED.items()}
+
+    def test_move_user_copies_the_rows_both_ways(self):
+        before = self.rows("default")
+        self.assertEqual(len(before["Product"]), 6)
+        copied = sharding.move_user(self.user.id, "shard1", batch_size=4)
+        self.assertEqual(copied["Product"], 6)
+        self.assertEqual(self.rows("shard1"), before)
+        self.assertTrue(all(not ids for ids in self.rows("default").values()))
+        self.assertEqual(sharding.lookup(self.user.id), ("shard1", False))
+        self.assertTrue(CustomUser.objects.using("shard1").filter(pk=self.user.id).exists())
+        self.assertIsNone(sharding.move_user(self.user.id, "shard1", batch_size=4))
+
+        sharding.move_user(self.user.id, "default", batch_size=4)
+        self.assertEqual(self.rows("default"), before)
+        self.assertTrue(all(not ids for ids in self.rows("shard1").values()))
+        self.assertFalse(CustomUser.objects.using("shard1").filter(pk=self.user.id).exists())
+
+    def test_api_writes_follow_the_user_and_get_503_while_moving(self):
+        sharding.move_user(self.user.id, "shard1", batch_size=100)
+        response = self.client.post(reverse("list-list-create"), data={"name": "Hardware"}, **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        # In shard1's range of ids, set up by reserve_ids()
+        self.assertGreaterEqual(response.data["id"], 1 << sharding.ID_BITS)
+        self.assertTrue(List.objects.using("shard1").filter(pk=response.data["id"]).exists())
+
+        sharding._set_shard(self.user.id, "shard1", moving=True)
+        response = self.client.post(reverse("list-list-create"), data={"name": "Pharmacy"}, **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response["Retry-After"], str(settings.SHARD_MOVE_RETRY_AFTER))
+
+    def test_writes_routed_on_a_stale_map_entry_are_refused(self):
+        sharding.move_user(self.user.id, "shard1", batch_size=100)
+        # What a worker that looked the user up before the move still holds
+        caches["default"].set(sharding.KEY_PREFIX + str(self.user.id), ("default", False))
+        response = self.client.post(reverse("list-list-create"), data={"name": "Hardware"}, **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertFalse(List.objects.using("default").filter(user=self.user.id).exists())
+        self.assertFalse(SyncClock.objects.using("default").filter(user=self.user.id).exists())
+        # The refusal corrected the map, so the retry lands on shard1
+        response = self.client.post(reverse("list-list-create"), data={"name": "Hardware"}, **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(List.objects.using("shard1").filter(pk=response.data["id"]).exists())
+
+    def test_writes_between_the_copy_and_the_delete_are_refused(self):
+        # The map points at shard1 but the rows are still on default
+        sharding._set_shard(self.user.id, "shard1", moving=False)
+        caches["default"].set(sharding.KEY_PREFIX + str(self.user.id), ("default", False))
+        response = self.client.post(reverse("list-list-create"), data={"name": "Hardware"}, **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(List.objects.using("default").filter(user=self.user.id).count(), 2)
+
+    def test_lookup_does_not_cache_over_a_newer_entry(self):
+        stale = sharding._load(self.user.id)
+        sharding._set_shard(self.user.id, "shard1", moving=True)
+        caches["default"].add(sharding.KEY_PREFIX + str(self.user.id), stale, settings.SHARD_MAP_TIMEOUT)
+        self.assertEqual(sharding.lookup(self.user.id), ("shard1", True))
+
+    def test_deleting_the_user_deletes_their_rows_on_their_shard(self):
+        sharding.move_user(self.user.id, "shard1", batch_size=100)
+        CustomUser.objects.get(pk=self.user.id).delete()
+        self.assertTrue(all(not ids for ids in self.rows("shard1").values()))
+        self.assertFalse(CustomUser.objects.using("shard1").filter(pk=self.user.id).exists())
+        self.assertIsNone(caches["default"].get(sharding.KEY_PREFIX + str(self.user.id)))
+
+    def test_rebalance_shards_command(self):
+        with self.assertRaisesMessage(CommandError, "SHARD_MAP_CACHE"):
+            call_command("rebalance_shards", stdout=StringIO())
+        out = StringIO()
+        call_command("rebalance_shards", dry_run=True, stdout=out)
+        self.assertEqual(out.getvalue(), "")
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": directory}}):
+                call_command("rebalance_shards", user=["mover@example.com"], to="shard1", batch_size=2, stdout=out)
+                self.assertEqual(sharding.lookup(self.user.id), ("shard1", False))
+        self.assertIn("Moved user", out.getvalue())
+        self.assertEqual(len(self.rows("shard1")["Product"]), 6)
+
+
+class QueryBudgetTestCase(TestCase):
+    '''
+        Runs one request per endpoint and method, with several rows where
+        the endpoint takes a batch, against the budgets in budgets.py
+    '''
+    def setUp(self):
+        caches["default"].clear()
+        self.client = Client()
+        self.user = CustomUser.objects.create_user(email="test@example.com", password="testpass")
+        self.list = List.objects.create(user=self.user, name="Groceries")
+        self.products = [Product.objects.create(name=f"Product {i}", list=self.list, user=self.user) for i in range(5)]
+        self.sharedList = SharedList.objects.create(access_token="abcddaaad", user=self.user, list=self.list)
+        self.headers = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'}
+        # Budgets are for a user whose snapshot is cached
+        user_snapshots.set(self.user.id, True)
+
+    def requests(self):
+        productIds = [product.pk for product in self.products]
+        productUrl = reverse("product-destroy-retrieve-update", args=[productIds[0]])
+        listUrl = reverse("list-retrieve-update-destroy", args=[self.list.pk])
+        other = List.objects.create(user=self.user, name="Other")
+        bulkItems = [{"name": f"New {i}", "list": self.list.pk} for i in range(5)]
+        importBody = "\n".join(json.dumps({"name": f"Imported {i}", "products": [{"name": "Milk"}] * 3}) for i in range(5))
+        return {
+            ("sharedList-create-list-destroy", "GET"): lambda: self.client.get(reverse("sharedList-create-list-destroy"), **self.headers),
+            ("sharedList-create-list-destroy", "POST"): lambda: self.client.post(reverse("sharedList-create-list-destroy"), {"list_name": "Other", "list_id": other.pk}, **self.headers),
+            ("sharedList-create-list-destroy", "DELETE"): lambda: self.client.delete(reverse("sharedList-create-list-destroy"), {"pk": self.sharedList.pk}, format="json", **self.headers),
+            ("sharedList-retrieve", "GET"): lambda: self.client.get(reverse("sharedList-retrieve", args=[self.sharedList.access_token]), **self.headers),
+            ("sharedList-events", "GET"): lambda: async_to_sync(shared_list_events)(AsyncRequestFactory().get("/"), self.sharedList.access_token),
+            ("product-list-create", "GET"): lambda: self.client.get(reverse("product-list-create"), **self.headers),
+            ("product-list-create", "POST"): lambda: self.client.post(reverse("product-list-create"), {"name": "Milk", "list": self.list.pk}, **self.headers),
+            ("product-bulk", "POST"): lambda: self.client.post(reverse("product-bulk"), bulkItems, format="json", **self.headers),
+            ("product-bulk", "PUT"): lambda: self.client.put(reverse("product-bulk"), [{"id": pk, "checked": True, "list": other.pk} for pk in productIds], format="json", **self.headers),
+            ("product-bulk", "DELETE"): lambda: self.client.delete(reverse("product-bulk"), {"ids": productIds}, format="json", **self.headers),
+            ("product-bulk-check", "POST"): lambda: self.client.post(reverse("product-bulk-check"), {"ids": productIds}, format="json", **self.headers),
+            ("product-suggest", "GET"): lambda: self.client.get(reverse("product-suggest"), {"q": "pro"}, **self.headers),
+            ("product-destroy-retrieve-update", "GET"): lambda: self.client.get(productUrl, **self.headers),
+            ("product-destroy-retrieve-update", "PUT"): lambda: self.client.put(productUrl, {"name": "Pears", "list": other.pk, "checked": True}, **self.headers),
+            ("product-destroy-retrieve-update", "DELETE"): lambda: self.client.delete(productUrl, **self.headers),
+            ("list-list-create", "GET"): lambda: self.client.get(reverse("list-list-create"), **self.headers),
+            ("list-list-create", "POST"): lambda: self.client.post(reverse("list-list-create"), {"name": "Costco"}, **self.headers),
+            ("list-retrieve-update-destroy", "GET"): lambda: self.client.get(listUrl, **self.headers),
+            ("list-retrieve-update-destroy", "PUT"): lambda: self.client.put(listUrl, {"name": "Costco"}, **self.headers),
+            ("list-retrieve-update-destroy", "DELETE"): lambda: self.client.delete(listUrl, **self.headers),
+            ("sync", "GET"): lambda: self.client.get(reverse("sync"), **self.headers),
+            ("search", "GET"): lambda: self.client.get(reverse("search"), {"q": "product"}, **self.headers),
+            ("export", "GET"): lambda: self.streamed(self.client.get(reverse("export"), **self.headers)),
+            ("import", "POST"): lambda: self.client.post(reverse("import"), importBody, content_type="application/x-ndjson", **self.headers),
+            ("user-create", "POST"): lambda: self.client.post(reverse("user-create"), {"email": "new@example.com", "password": "testpass"}),
+            ("metrics", "GET"): lambda: self.client.get(reverse("metrics")),
+        }
+
+    def streamed(self, response):
+        # The export runs its queries while the body is read
+        b"".join(response.streaming_content)
+        return response
+
+    def test_every_endpoint_has_a_budget(self):
+        endpoints = set()
+        for pattern in shoppinglist_urls.urlpatterns:
+            actions = getattr(pattern.callback, "actions", None) or {"get": None}
+            # DRF adds "head" to the actions of views that serve "get"
+            endpoints.update((pattern.name, method.upper()) for method in actions if method != "head")
+        self.assertEqual(endpoints - set(budgets.QUERY_BUDGETS), set())
+        self.assertEqual(set(self.requests()), set(budgets.QUERY_BUDGETS))
+
+    def test_debug_mode_logs_requests_over_budget(self):
+        url = reverse("list-retrieve-update-destroy", args=[self.list.pk])
+        with override_settings(QUERY_BUDGETS_DEBUG=True), \
+                mock.patch.dict(budgets.QUERY_BUDGETS, {("list-retrieve-update-destroy", "GET"): 1}):
+            with self.assertLogs("shoppinglist.budgets", "WARNING") as logs:
+                self.client.get(url)
+        self.assertIn("ran 2 queries, over its budget of 1", logs.output[0])
+        self.assertIn('FROM "shoppinglist_list"', logs.output[0])
+
+    def test_endpoints_stay_within_query_budgets(self):
+        for (urlName, method), send in self.requests().items():
+            with self.subTest(endpoint=urlName, method=method):
+                with transaction.atomic():
+                    with CaptureQueriesContext(connection) as queries:
+                        response = send()
+                    self.assertLess(response.status_code, 400)
+                    statements = [query["sql"] for query in queries.captured_queries]
+                    violation = budgets.check(urlName, method, statements)
+                    self.assertIsNone(violation, "\n".join(statements))
+                    transaction.set_rollback(True)
+
 # class EndpointTestCase(TestCase):
 #     def setUp(self):
 #         self.client = Client()
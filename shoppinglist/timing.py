@@ -0,0 +1,160 @@
+"""
+Per-request performance counters, filled in while a request runs and read by
+middleware.RequestTimingMiddleware once it is done.
+
+The counters of the current request live in a context variable, so they follow
+the request into sync_to_async threads and stay apart between concurrent async
+requests. Outside a request every function here is a no-op.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current = ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    __slots__ = ("start", "queries", "db", "serialize", "statements", "_serializing")
+
+    def __init__(self, capture=False):
+        self.start = time.perf_counter()
+        self.queries = 0
+        # Seconds
+        self.db = 0.0
+        self.serialize = 0.0
+        # SQL of every query, only kept when asked for
+        self.statements = [] if capture else None
+        self._serializing = False
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+
+def start(capture=False):
+    """
+    Start counting for a new request and return (timings, reset token). With
+    ``capture`` the SQL of each query is kept in ``timings.statements``.
+    """
+    timings = RequestTimings(capture)
+    return timings, _current.set(timings)
+
+
+def stop(token):
+    _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Execute wrapper, on every database connection, that counts queries and
+    their time.
+    """
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db += time.perf_counter() - started
+        timings.queries += 1
+        if timings.statements is not None:
+            timings.statements.append(sql)
+
+
+@contextmanager
+def serializing():
+    """
+    Count the enclosed block as serializer time. Nested blocks count once.
+    """
+    timings = _current.get()
+    if timings is None or timings._serializing:
+        yield
+        return
+    timings._serializing = True
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.serialize += time.perf_counter() - started
+        timings._serializing = False
+
+
+class Histogram:
+    """
+    Cumulative histogram with fixed upper bounds; the last bucket is +Inf.
+    """
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self):
+        buckets, running = {}, 0
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            running += count
+            buckets[bound] = running
+        return {"count": self.count, "sum": self.sum, "buckets": buckets}
+
+
+# Milliseconds for the durations
+DURATION_BOUNDS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+QUERY_BOUNDS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BOUNDS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+def _new_histograms():
+    return {
+        "total": Histogram(DURATION_BOUNDS),
+        "db": Histogram(DURATION_BOUNDS),
+        "serialize": Histogram(DURATION_BOUNDS),
+        "queries": Histogram(QUERY_BOUNDS),
+        "size": Histogram(SIZE_BOUNDS),
+    }
+
+
+def observe(url_name, total, timings, size):
+    """
+    Add one finished request to the histograms of its URL name. ``total`` is
+    in seconds and ``size`` in bytes, or None for a streamed response.
+    """
+    with _histograms_lock:
+        histograms = _histograms.get(url_name)
+        if histograms is None:
+            histograms = _histograms[url_name] = _new_histograms()
+        histograms["total"].observe(total * 1000)
+        histograms["db"].observe(timings.db * 1000)
+        histograms["serialize"].observe(timings.serialize * 1000)
+        histograms["queries"].observe(timings.queries)
+        if size is not None:
+            histograms["size"].observe(size)
+
+
+def snapshot():
+    """
+    Return {url name: {metric: {"count", "sum", "buckets"}}} for this process.
+    """
+    with _histograms_lock:
+        return {
+            url_name: {metric: histogram.snapshot() for metric, histogram in histograms.items()}
+            for url_name, histograms in _histograms.items()
+        }
+
+
+def reset():
+    with _histograms_lock:
+        _histograms.clear()
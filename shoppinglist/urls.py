@@ -1,5 +1,14 @@
+from django.conf import settings
 from django.urls import path
-from .views import ProductViewSet, ListViewSet, UserViewSet, ShareDataViewSet
+from .views import ProductViewSet, ListViewSet, UserViewSet, ShareDataViewSet, SyncViewSet, ExportViewSet, ImportViewSet, SearchViewSet, shared_list_events
+from . import async_views
+
+
+def read_view(viewset_view, async_get):
+    if settings.ASYNC_READ_VIEWS:
+        return async_views.with_async_get(viewset_view, async_get)
+    return viewset_view
+
 
 
 urlpatterns = [
@@ -8,27 +17,51 @@ urlpatterns = [
         'get': 'list',
         'delete': 'destroy'
     }), name="sharedList-create-list-destroy"),
-    path('share/<str:access_token>', ShareDataViewSet.as_view({
+    path('share/<str:access_token>', read_view(ShareDataViewSet.as_view({
         'get': 'retrieve',
-    }), name="sharedList-retrieve"),
+    }), async_views.shared_list_retrieve), name="sharedList-retrieve"),
+    path('share/<str:access_token>/events', shared_list_events, name="sharedList-events"),
     path('products', ProductViewSet.as_view({
         'get': 'list',
         'post': 'create'
     }), name='product-list-create'),
-    path('products/<str:pk>', ProductViewSet.as_view({
+    path('products/bulk', ProductViewSet.as_view({
+        'post': 'bulk_create',
+        'put': 'bulk_update',
+        'delete': 'bulk_destroy'
+    }), name='product-bulk'),
+    path('products/bulk/check', ProductViewSet.as_view({
+        'post': 'bulk_check'
+    }), name='product-bulk-check'),
+    path('products/suggest', ProductViewSet.as_view({
+        'get': 'suggest'
+    }), name='product-suggest'),
+    path('products/<str:pk>', read_view(ProductViewSet.as_view({
         'get': 'retrieve',
         'put': 'update',
         'delete': 'destroy'
-    }), name="product-destroy-retrieve-update"),
-    path('lists', ListViewSet.as_view({
+    }), async_views.product_retrieve), name="product-destroy-retrieve-update"),
+    path('lists', read_view(ListViewSet.as_view({
         'get': 'list',
         'post': 'create'
-    }), name="list-list-create"),
-    path('lists/<str:pk>', ListViewSet.as_view({
+    }), async_views.list_list), name="list-list-create"),
+    path('lists/<str:pk>', read_view(ListViewSet.as_view({
         'get': 'retrieve',
         'put': 'update',
         'delete': 'destroy'
-    }), name="list-retrieve-update-destroy"),
+    }), async_views.list_retrieve), name="list-retrieve-update-destroy"),
+    path('sync', SyncViewSet.as_view({
+        'get': 'list'
+    }), name="sync"),
+    path('export', ExportViewSet.as_view({
+        'get': 'list'
+    }), name="export"),
+    path('import', ImportViewSet.as_view({
+        'post': 'create'
+    }), name="import"),
+    path('search', SearchViewSet.as_view({
+        'get': 'list'
+    }), name="search"),
     path('users', UserViewSet.as_view({
         'post': 'create'
     }), name="user-create"),
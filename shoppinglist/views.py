@@ -1,11 +1,22 @@
-from django.shortcuts import get_object_or_404
 from rest_framework import viewsets, status, permissions
 from rest_framework.response import Response
-from .models import Product, List, CustomUser, SharedList
-from .serializers import ProductSerializer, ListSerializer, CustomUserSerializer, SharedListSerializer
-from django.contrib.auth.hashers import make_password
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from .models import Product, List, SharedList, Tombstone
+from .serializers import ProductSerializer, BulkProductSerializer, ListSerializer, CustomUserSerializer, SharedListSerializer, ProductReadSerializer, ListReadSerializer
+from .pagination import IdCursorPagination
+from .changes import ListChanges
+from . import cache, etags, export, hashing, importer, realtime, search, share_tokens, sharding, suggestions, sync
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.core.exceptions import ObjectDoesNotExist
-import secrets
+from django.db import IntegrityError
+from django.db.models import F
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+import asyncio
+import json
 
 class ShareDataViewSet(viewsets.ViewSet):
     def get_permissions(self):
@@ -25,48 +36,111 @@ class ShareDataViewSet(viewsets.ViewSet):
         data = request.data
         if (type(request.data) != dict):
             data = request.data.dict()
-        sharedList = SharedList.objects.filter(list = data["list_id"])
-        if sharedList.exists():
-            return Response({"This list has been shared"}, status=status.HTTP_409_CONFLICT)
-        # Generate a 32-character hexadecimal token
-        access_token = secrets.token_hex(16)  
-        data["access_token"] = access_token
         data["list"] = data["list_id"]
         data["user"] = request.user.id
         data["list_name"] = data["list_name"]
-        # Store the data and access token in SharedList model
         serializer = SharedListSerializer(data=data)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        # A token the shared-list endpoints can check without a query, see share_tokens.py
+        list = serializer.validated_data["list"]
+        access_token = share_tokens.mint(list.id, request.user.id, list.share_generation, settings.SHARE_TOKEN_LIFETIME)
+        try:
+            # The unique constraint on SharedList.list rejects a second share
+            # atomically, where a check-then-insert could race
+            with sharding.atomic():
+                sharding.lock_user(request.user.id)
+                serializer.save(access_token=access_token)
+        except IntegrityError:
+            return Response({"This list has been shared"}, status=status.HTTP_409_CONFLICT)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     
     def destroy(self, request, pk = None):
         try:
             data = request.data
             sharedList = SharedList.objects.get(id=data["pk"])
-            sharedList.delete()
+            with sharding.atomic():
+                sharding.lock_user(sharedList.user_id)
+                sharedList.delete()
+                # Revokes the share's signed tokens, see share_tokens.py
+                List.objects.filter(id=sharedList.list_id).update(share_generation=F("share_generation") + 1)
+                cache.invalidate_tokens([sharedList.access_token])
+                # Ends the event streams opened with this share's token
+                realtime.publish_on_commit([(sharedList.list_id, {"type": "share.deleted", "list": sharedList.list_id})])
             deletion_successful = True
         except ObjectDoesNotExist:
             deletion_successful = False
         return Response({deletion_successful, data["pk"]}, status=status.HTTP_202_ACCEPTED)
     
+    @method_decorator(condition(etag_func=etags.shared_list_etag))
     def retrieve(self, request, access_token = None):
-        sharedList = SharedList.objects.get(access_token=access_token)
-        list = List.objects.get(id = sharedList.list.id)
-        products = Product.objects.filter(list = list)
-        productSerializer = ProductSerializer(products, many=True)
-        listSerializer = ListSerializer(list)
-        combinedData = {
+        sharding.activate_token(access_token)
+        listFilter = share_tokens.list_filter(access_token)
+        if listFilter is None:
+            raise Http404
+        try:
+            combinedData = cache.get_shared_list(access_token, lambda: self.load_shared_list(listFilter))
+        except List.DoesNotExist:
+            # Unknown token, or one revoked by deleting its share
+            raise Http404
+        return Response(combinedData, status=status.HTTP_200_OK)
+
+    def load_shared_list(self, list_filter):
+        list = ListReadSerializer.values(List.objects.filter(**list_filter)).get()
+        products = ProductReadSerializer.values(Product.objects.filter(list = list["id"]))
+        productSerializer = ProductReadSerializer(products, many=True)
+        listSerializer = ListReadSerializer(list)
+        return {
             "products": productSerializer.data,
             "list": listSerializer.data
         }
-        return Response(combinedData, status=status.HTTP_200_OK)
+
+async def shared_list_events(request, access_token):
+    """
+    Server-Sent Events stream of the changes to a shared list. Needs ASGI:
+    each viewer holds the connection open and is pushed product and list
+    events as writers commit them.
+    """
+    if not hasattr(request, "scope"):
+        return JsonResponse({"detail": "Event streams are only served over ASGI."}, status=status.HTTP_501_NOT_IMPLEMENTED)
+    await sharding.aactivate_token(access_token)
+    listFilter = share_tokens.list_filter(access_token)
+    listId = None if listFilter is None else await List.objects.filter(**listFilter).values_list("id", flat=True).afirst()
+    if listId is None:
+        return JsonResponse({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+    response = StreamingHttpResponse(_event_stream(listId), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+async def _event_stream(list_id):
+    subscription = realtime.get_broker().subscribe(realtime.channel_for(list_id))
+    try:
+        yield f"retry: {settings.REALTIME_RETRY_MS}\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.get(), settings.REALTIME_HEARTBEAT)
+            except asyncio.TimeoutError:
+                # Comment line that keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: {event['type']}\ndata: {json.dumps(event, cls=DjangoJSONEncoder)}\n\n"
+            if event["type"] in ("share.deleted", "list.deleted", "overflow"):
+                return
+    finally:
+        subscription.close()
 
 class ProductViewSet(viewsets.ViewSet):
+    def get_permissions(self):
+        if self.action in ['list', 'bulk_create', 'bulk_update', 'bulk_check', 'bulk_destroy', 'suggest']:
+            permission_classes = [permissions.IsAuthenticated]
+        else:
+            permission_classes = [permissions.AllowAny]
+        return [permission() for permission in permission_classes]
+
+    @method_decorator(condition(etag_func=etags.product_collection_etag))
     def list(self, request):
-        products = Product.objects.all()
-        serializer = ProductSerializer(products, many=True)
-        return Response(serializer.data)
+        products = ProductReadSerializer.values(Product.objects.filter(user=request.user.id))
+        return IdCursorPagination().paginate(products, request, ProductReadSerializer, view=self)
     
     def create(self, request):
         data = request.data
@@ -75,37 +149,221 @@ class ProductViewSet(viewsets.ViewSet):
         data["user"] = request.user.id
         serializer = ProductSerializer(data=data)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with sharding.atomic():
+            changes = ListChanges()
+            product = serializer.save(version=changes.version_for(request.user.id))
+            changes.add(product.list_id, product.checked)
+            changes.event(product.list_id, "product.created", product=serializer.data)
+            changes.apply()
+            suggestions.record(product.user_id, [product.name])
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     
+    @method_decorator(condition(etag_func=etags.product_etag))
     def retrieve(self, request, pk = None):
         product = Product.objects.get(id=pk)
         serializer  = ProductSerializer(product)
         return Response(serializer.data, status=status.HTTP_200_OK)
     
     def update(self, request, pk = None):
-        product = Product.objects.get(id=pk)
-        serializer = ProductSerializer(instance=product, data = request.data)
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with sharding.atomic():
+            product = Product.objects.select_for_update().get(id=pk)
+            oldListId, oldChecked = product.list_id, product.checked
+            serializer = ProductSerializer(instance=product, data = request.data)
+            serializer.is_valid(raise_exception=True)
+            changes = ListChanges()
+            serializer.save(version=changes.version_for(product.user_id))
+            changes.change(oldListId, oldChecked, product.list_id, product.checked)
+            _product_changed_event(changes, oldListId, oldChecked, product, serializer.data)
+            changes.apply()
         return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
 
     def destroy(self, request, pk = None):
         try:
-            product = Product.objects.get(id=pk)
-            product.delete()
+            with sharding.atomic():
+                product = Product.objects.select_for_update().get(id=pk)
+                changes = ListChanges()
+                changes.remove(product.list_id, product.checked, product.id, product.user_id)
+                changes.event(product.list_id, "product.deleted", product={"id": product.id})
+                product.delete()
+                changes.apply()
             deletion_successful = True
         except ObjectDoesNotExist:
             deletion_successful = False
         return Response({deletion_successful, pk}, status=status.HTTP_202_ACCEPTED)
 
+    def bulk_create(self, request):
+        items = request.data
+        error = _check_bulk_payload(items)
+        if error:
+            return error
+        context = {"list_ids": _owned_list_ids(request.user.id, items)}
+        results = [None] * len(items)
+        products = []
+        for index, item in enumerate(items):
+            serializer = BulkProductSerializer(data=item, context=context)
+            if serializer.is_valid():
+                products.append((index, Product(user_id=request.user.id, **serializer.validated_data)))
+            else:
+                results[index] = {"index": index, "status": status.HTTP_400_BAD_REQUEST, "errors": serializer.errors}
+        changes = ListChanges()
+        for _, product in products:
+            changes.add(product.list_id, product.checked)
+        with sharding.atomic():
+            version = changes.version_for(request.user.id) if products else None
+            for _, product in products:
+                product.version = version
+            Product.objects.bulk_create([product for _, product in products], batch_size=settings.BULK_BATCH_SIZE)
+            for index, product in products:
+                results[index] = {"index": index, "status": status.HTTP_201_CREATED, "data": ProductSerializer(product).data}
+                changes.event(product.list_id, "product.created", product=results[index]["data"])
+            changes.apply()
+            suggestions.record(request.user.id, [product.name for _, product in products])
+        return _bulk_response(results, status.HTTP_201_CREATED)
+
+    def bulk_update(self, request):
+        items = request.data
+        error = _check_bulk_payload(items)
+        if error:
+            return error
+        ids = _parse_ids(item.get("id") if isinstance(item, dict) else None for item in items)
+        with sharding.atomic():
+            existing = Product.objects.select_for_update().filter(user=request.user.id, id__in=[pk for pk in ids if pk is not None]).in_bulk()
+            context = {"list_ids": _owned_list_ids(request.user.id, items)}
+            results = []
+            products = []
+            fields = set()
+            changes = ListChanges()
+            for index, (pk, item) in enumerate(zip(ids, items)):
+                product = existing.get(pk)
+                if product is None:
+                    results.append({"index": index, "status": status.HTTP_404_NOT_FOUND, "errors": {"id": ["Not found."]}})
+                    continue
+                serializer = BulkProductSerializer(instance=product, data=item, partial=True, context=context)
+                if not serializer.is_valid():
+                    results.append({"index": index, "status": status.HTTP_400_BAD_REQUEST, "errors": serializer.errors})
+                    continue
+                oldListId, oldChecked = product.list_id, product.checked
+                for field, value in serializer.validated_data.items():
+                    setattr(product, field, value)
+                product.version = changes.version_for(request.user.id)
+                product.updated_at = timezone.now()
+                changes.change(oldListId, oldChecked, product.list_id, product.checked)
+                fields.update(serializer.validated_data)
+                products.append(product)
+                results.append({"index": index, "status": status.HTTP_202_ACCEPTED, "data": ProductSerializer(product).data})
+                _product_changed_event(changes, oldListId, oldChecked, product, results[-1]["data"])
+            if products:
+                Product.objects.bulk_update(products, fields | {"version", "updated_at"}, batch_size=settings.BULK_BATCH_SIZE)
+                changes.apply()
+        return _bulk_response(results, status.HTTP_202_ACCEPTED)
+
+    def suggest(self, request):
+        # Autocomplete for product names, from the counts in suggestions.py
+        try:
+            limit = min(int(request.query_params.get("limit", settings.SUGGESTIONS_LIMIT)), settings.SUGGESTIONS_MAX_LIMIT)
+        except ValueError:
+            return Response({"limit": ["A valid integer is required."]}, status=status.HTTP_400_BAD_REQUEST)
+        results = suggestions.suggest(request.user.id, request.query_params.get("q", ""), max(limit, 0))
+        return Response({"results": results})
+
+    def bulk_check(self, request):
+        ids = request.data.get("ids") if isinstance(request.data, dict) else None
+        error = _check_bulk_payload(ids)
+        if error:
+            return error
+        ids = _parse_ids(ids)
+        checked = request.data.get("checked", True)
+        if not isinstance(checked, bool):
+            return Response({"checked": ["Must be a boolean."]}, status=status.HTTP_400_BAD_REQUEST)
+        with sharding.atomic():
+            rows = _lock_products(request.user.id, ids)
+            found = {pk for pk, _, _ in rows}
+            toggled = [(pk, listId) for pk, listId, wasChecked in rows if wasChecked != checked]
+            changes = ListChanges()
+            if toggled:
+                Product.objects.filter(id__in=[pk for pk, _ in toggled]).update(
+                    checked=checked,
+                    version=changes.version_for(request.user.id),
+                    updated_at=timezone.now(),
+                )
+            for pk, listId in toggled:
+                changes.change(listId, not checked, listId, checked)
+                changes.event(listId, "product.checked", product={"id": pk, "checked": checked})
+            changes.apply()
+        return _bulk_response(_id_results(ids, found), status.HTTP_202_ACCEPTED)
+
+    def bulk_destroy(self, request):
+        ids = request.data.get("ids") if isinstance(request.data, dict) else None
+        error = _check_bulk_payload(ids)
+        if error:
+            return error
+        ids = _parse_ids(ids)
+        with sharding.atomic():
+            rows = _lock_products(request.user.id, ids)
+            found = {pk for pk, _, _ in rows}
+            Product.objects.filter(id__in=found).delete()
+            changes = ListChanges()
+            for pk, listId, wasChecked in rows:
+                changes.remove(listId, wasChecked, pk, request.user.id)
+                changes.event(listId, "product.deleted", product={"id": pk})
+            changes.apply()
+        return _bulk_response(_id_results(ids, found), status.HTTP_202_ACCEPTED)
+
+def _product_changed_event(changes, old_list_id, old_checked, product, data):
+    if old_list_id != product.list_id:
+        # Viewers of each list see the product leave one and join the other
+        changes.event(old_list_id, "product.deleted", product={"id": product.id})
+        changes.event(product.list_id, "product.created", product=data)
+    elif old_checked != product.checked:
+        changes.event(product.list_id, "product.checked", product=data)
+    else:
+        changes.event(product.list_id, "product.updated", product=data)
+
+def _check_bulk_payload(items):
+    if not isinstance(items, list):
+        return Response({"detail": "Expected a list."}, status=status.HTTP_400_BAD_REQUEST)
+    if len(items) > settings.BULK_MAX_ITEMS:
+        return Response({"detail": f"At most {settings.BULK_MAX_ITEMS} items per request."}, status=status.HTTP_400_BAD_REQUEST)
+    return None
+
+def _owned_list_ids(user_id, items):
+    # One query for every list referenced by the batch, limited to the user's own lists
+    listIds = _parse_ids(item.get("list") for item in items if isinstance(item, dict) and "list" in item)
+    return set(List.objects.filter(user=user_id, id__in=listIds).values_list("id", flat=True))
+
+def _lock_products(user_id, ids):
+    # Lock the rows first so concurrent toggles and deletes cannot double count
+    products = Product.objects.select_for_update().filter(user=user_id, id__in=[pk for pk in ids if pk is not None])
+    return list(products.values_list("id", "list_id", "checked"))
+
+def _parse_ids(values):
+    ids = []
+    for value in values:
+        try:
+            ids.append(int(value))
+        except (TypeError, ValueError):
+            ids.append(None)
+    return ids
+
+def _id_results(ids, found):
+    return [
+        {"index": index, "id": pk, "status": status.HTTP_202_ACCEPTED if pk in found else status.HTTP_404_NOT_FOUND}
+        for index, pk in enumerate(ids)
+    ]
+
+def _bulk_response(results, success_status):
+    # 207 tells the client to look at the per-item statuses
+    failed = any(result["status"] >= 400 for result in results)
+    return Response({"results": results}, status=status.HTTP_207_MULTI_STATUS if failed else success_status)
+
 class ListViewSet(viewsets.ViewSet):
+    @method_decorator(condition(etag_func=etags.list_collection_etag))
     def list(self, request):
-        user_id = request.user.id
-        user = get_object_or_404(CustomUser, id=user_id)
-        lists = List.objects.filter(user=user)
-        listSerializer = ListSerializer(lists, many=True)
-        return Response(listSerializer.data)
+        # Anonymous requests get the 404 they got when the user was looked up here
+        if not request.user.is_authenticated:
+            raise Http404
+        lists = ListReadSerializer.values(List.objects.filter(user=request.user.id))
+        return IdCursorPagination().paginate(lists, request, ListReadSerializer, view=self)
     
     def create(self, request):
         data = request.data
@@ -114,9 +372,11 @@ class ListViewSet(viewsets.ViewSet):
         data["user"] = request.user.id
         serializer = ListSerializer(data=data)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with sharding.atomic():
+            serializer.save(version=ListChanges().version_for(request.user.id))
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     
+    @method_decorator(condition(etag_func=etags.list_etag))
     def retrieve(self, request, pk = None):
         list = List.objects.get(id=pk)
         serializer  = ListSerializer(list)
@@ -126,24 +386,165 @@ class ListViewSet(viewsets.ViewSet):
         list = List.objects.get(id=pk)
         serializer = ListSerializer(instance=list, data = request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with sharding.atomic():
+            sharding.lock_user(list.user_id)
+            serializer.save()
+            changes = ListChanges()
+            changes.touch(list.id)
+            changes.apply()
+            list.refresh_from_db(fields=["version", "updated_at"])
+            realtime.publish_on_commit([(list.id, {"type": "list.updated", "list": list.id, "data": serializer.data})])
         return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
 
     def destroy(self, request, pk = None):
         try:
             list = List.objects.get(id=pk)
-            list.delete()
+            with sharding.atomic():
+                changes = ListChanges()
+                changes.remove_list(list.id, list.user_id)
+                changes.event(list.id, "list.deleted")
+                cache.invalidate_lists([list.id])
+                list.delete()
+                changes.apply()
             deletion_successful = True
         except ObjectDoesNotExist:
             deletion_successful = False
         return Response({deletion_successful, pk}, status=status.HTTP_202_ACCEPTED)
 
+class SyncViewSet(viewsets.ViewSet):
+    """
+    Delta sync: the user's lists and products changed after ?since=, with the
+    ids of those deleted, a page of ?page_size= rows at a time. Without a
+    token, every list and product. Clients repeat the request with the
+    returned token while "more" is true. Pages end between versions only
+    where they have to, so a client never skips a row. A token issued before
+    the tombstones kept, settings.SYNC_TOMBSTONE_RETENTION, gets a 410: the
+    client must sync again without one.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def list(self, request):
+        try:
+            since = sync.decode_token(request.query_params.get("since"))
+        except ValueError:
+            return Response({"since": ["Invalid sync token."]}, status=status.HTTP_400_BAD_REQUEST)
+        now = timezone.now()
+        if since is not None and since.issued < (now - settings.SYNC_TOMBSTONE_RETENTION).timestamp():
+            return Response({"since": ["Sync token expired, sync again without one."]}, status=status.HTTP_410_GONE)
+        user_id = request.user.id
+        # Rows stamped after this read belong to the next sync
+        current = sync.current_version(user_id)
+        window = {"user": user_id, "version__lte": current}
+        tables = [
+            (sync.LISTS, ListReadSerializer.values(List.objects.filter(**window))),
+            (sync.PRODUCTS, ProductReadSerializer.values(Product.objects.filter(**window))),
+        ]
+        if since is not None:
+            tables.append((sync.TOMBSTONES, Tombstone.objects.filter(**window).values("id", "version", "kind", "object_id")))
+        rows, last = sync.page(tables, since, IdCursorPagination().get_page_size(request))
+        deleted = {Tombstone.LIST: [], Tombstone.PRODUCT: []}
+        for tombstone in rows.get(sync.TOMBSTONES, []):
+            deleted[tombstone["kind"]].append(tombstone["object_id"])
+        if last is None:
+            token = sync.encode_token(now.timestamp(), current)
+        else:
+            # Dated from the start of the sync, whose deletions the rest must still find
+            token = sync.encode_token(since.issued if since else now.timestamp(), *last)
+        return Response({
+            "lists": ListReadSerializer(rows[sync.LISTS], many=True).data,
+            "products": ProductReadSerializer(rows[sync.PRODUCTS], many=True).data,
+            "deleted": {"lists": deleted[Tombstone.LIST], "products": deleted[Tombstone.PRODUCT]},
+            "token": token,
+            "more": last is not None,
+        })
+
+class ExportViewSet(viewsets.ViewSet):
+    """
+    Streams all of the user's lists with their products, as NDJSON by default
+    or as CSV with ?format=csv. See export.py.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def perform_content_negotiation(self, request, force=False):
+        # ?format= picks the export format here, not a DRF renderer
+        return super().perform_content_negotiation(request, force=True)
+
+    def list(self, request):
+        format = request.query_params.get("format", "ndjson")
+        if format not in export.FORMATS:
+            return Response({"format": [f"Choose one of: {', '.join(export.FORMATS)}."]}, status=status.HTTP_400_BAD_REQUEST)
+        generate, contentType = export.FORMATS[format]
+        chunks = generate(request.user.id, settings.EXPORT_CHUNK_SIZE)
+        if hasattr(request, "scope"):
+            chunks = export.aiterate(chunks)
+        response = StreamingHttpResponse(chunks, content_type=contentType)
+        response["Content-Disposition"] = f'attachment; filename="grocery-export.{format}"'
+        return response
+
+class ImportViewSet(viewsets.ViewSet):
+    """
+    Creates lists with their products from an NDJSON upload, in the format
+    /v1/export writes. The body is read line by line, not parsed as a whole.
+    See importer.py.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def create(self, request):
+        lines = request.stream if request.stream is not None else []
+        report = importer.import_lists(request.user.id, lines, settings.IMPORT_CHUNK_SIZE, settings.IMPORT_MAX_ERRORS)
+        # 207 tells the client to look at the errors
+        return Response(report.as_dict(), status=status.HTTP_207_MULTI_STATUS if report.error_count else status.HTTP_201_CREATED)
+
+class SearchViewSet(viewsets.ViewSet):
+    """
+    Full-text search over the user's lists and products, best match first,
+    a page at a time with ?page= and ?page_size=. See search.py.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def list(self, request):
+        text = request.query_params.get("q", "").strip()
+        if not text:
+            return Response({"q": ["This field is required."]}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            page = int(request.query_params.get("page", 1))
+            pageSize = min(int(request.query_params.get("page_size", settings.PAGE_SIZE)), settings.MAX_PAGE_SIZE)
+            if page < 1 or pageSize < 1:
+                raise ValueError
+        except ValueError:
+            return Response({"detail": "Invalid page."}, status=status.HTTP_404_NOT_FOUND)
+        # One extra hit tells whether there is a next page
+        hits = search.search(request.user.id, text, (page - 1) * pageSize, pageSize + 1)
+        more = len(hits) > pageSize
+        hits = hits[:pageSize]
+        rows = {
+            search.LIST: _rows_by_id(ListReadSerializer, List, [pk for kind, pk, _ in hits if kind == search.LIST]),
+            search.PRODUCT: _rows_by_id(ProductReadSerializer, Product, [pk for kind, pk, _ in hits if kind == search.PRODUCT]),
+        }
+        serializerClasses = {search.LIST: ListReadSerializer, search.PRODUCT: ProductReadSerializer}
+        results = [
+            {"type": kind, "rank": rank, "data": serializerClasses[kind](rows[kind][pk]).data}
+            # A row deleted since the search is left out
+            for kind, pk, rank in hits if pk in rows[kind]
+        ]
+        url = request.build_absolute_uri()
+        return Response({
+            "next": replace_query_param(url, "page", page + 1) if more else None,
+            "previous": None if page == 1 else (replace_query_param(url, "page", page - 1) if page > 2 else remove_query_param(url, "page")),
+            "results": results,
+        })
+
+def _rows_by_id(serializer_class, model, ids):
+    if not ids:
+        return {}
+    return {row["id"]: row for row in serializer_class.values(model.objects.filter(id__in=ids))}
+
 class UserViewSet(viewsets.ViewSet):
     def create(self, request):
         data = request.data
         password = data["password"]
         pwdEncrptedData = {}
-        pwdEncrptedData["password"] = make_password(password)
+        pwdEncrptedData["password"] = hashing.make_password(password)
         pwdEncrptedData["email"] = data["email"]
         serializer = CustomUserSerializer(data=pwdEncrptedData)
         serializer.is_valid(raise_exception=True)